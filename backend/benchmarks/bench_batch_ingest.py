@@ -0,0 +1,90 @@
+"""
+Ingest throughput: POST /api/potholes (one row per request) vs
+POST /api/potholes/batch (one transaction per request).
+
+The table is pre-seeded (default 1M rows) so inserts hit a realistically sized
+B-tree. Requests go through the real ASGI app in-process via httpx.
+
+Usage:
+    python benchmarks/bench_batch_ingest.py --rows 1000000 --requests 2000 --batch-size 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp = tempfile.mkdtemp(prefix="pothole_bench_")
+os.environ.setdefault("POTHOLE_DB", os.path.join(_tmp, "bench.db"))
+os.environ.setdefault("POTHOLE_UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+
+
+def make_report():
+    depth = round(random.uniform(2.0, 15.0), 2)
+    return {
+        "latitude": 19.0760 + (random.random() - 0.5) * 0.1,
+        "longitude": 72.8777 + (random.random() - 0.5) * 0.1,
+        "depth": depth,
+        "severity": "Critical" if depth > 7 else ("Moderate" if depth > 3 else "Minor"),
+        "timestamp": time.time(),
+    }
+
+
+def seed(path, rows, chunk=50000):
+    main.init_db()  # the app migrates the schema at startup, not on import
+    conn = sqlite3.connect(path)
+    done = 0
+    while done < rows:
+        n = min(chunk, rows - done)
+        batch = [main.PotholeData(**make_report()) for _ in range(n)]
+        main._insert_potholes(conn, batch)
+        conn.commit()
+        done += n
+    conn.close()
+
+
+async def run(requests, batch_size):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        t0 = time.perf_counter()
+        for _ in range(requests):
+            r = await client.post("/api/potholes", json=make_report())
+            r.raise_for_status()
+        single = requests / (time.perf_counter() - t0)
+
+        batches = max(1, requests // batch_size)
+        t0 = time.perf_counter()
+        for _ in range(batches):
+            r = await client.post("/api/potholes/batch", json=[make_report() for _ in range(batch_size)])
+            r.raise_for_status()
+        batch = batches * batch_size / (time.perf_counter() - t0)
+    main.db.close()
+    return single, batch
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows seeded before measuring")
+    parser.add_argument("--requests", type=int, default=2000, help="rows written per mode")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.rows} rows into {main.DB_FILE} ...")
+    seed(main.DB_FILE, args.rows)
+
+    single, batch = asyncio.run(run(args.requests, args.batch_size))
+    print(f" single: {single:10.1f} rows/s")
+    print(f"  batch: {batch:10.1f} rows/s  (batch size {args.batch_size})")
+    print(f"speedup: {batch / single:10.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
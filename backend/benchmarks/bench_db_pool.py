@@ -0,0 +1,149 @@
+"""
+Mixed ingest/read benchmark for the SQLite access layer.
+
+Compares the legacy access pattern (fresh sqlite3.connect() per request, SQL run
+inline on the event loop) against the pooled WAL `Database` used by main.py.
+Both modes run the same handler SQL from main.py under the same asyncio load.
+
+Usage:
+    python benchmarks/bench_db_pool.py --seconds 5 --concurrency 32 --read-ratio 0.7
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp = tempfile.mkdtemp(prefix="pothole_bench_")
+os.environ.setdefault("POTHOLE_DB", os.path.join(_tmp, "bench.db"))
+os.environ.setdefault("POTHOLE_UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+
+import main  # noqa: E402  (needs the env vars above)
+import listing  # noqa: E402
+from db import Database  # noqa: E402
+
+
+def make_report():
+    depth = round(random.uniform(2.0, 15.0), 2)
+    return main.PotholeData(
+        latitude=19.0760 + (random.random() - 0.5) * 0.1,
+        longitude=72.8777 + (random.random() - 0.5) * 0.1,
+        depth=depth,
+        severity="Critical" if depth > 7 else ("Moderate" if depth > 3 else "Minor"),
+        timestamp=time.time(),
+    )
+
+
+def seed(path, rows):
+    main.init_db()  # the app migrates the schema at startup, not on import
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM potholes")
+    conn.commit()
+    main._insert_potholes(conn, [make_report() for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+class LegacyAccess:
+    """What main.py did before: connect per call, blocking the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _conn(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    async def write(self, fn, *args):
+        conn = self._conn()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    async def read(self, fn, *args):
+        conn = self._conn()
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+async def measure_lag(stop, samples):
+    # How late does a 1 ms sleep wake up? Large values = blocked event loop.
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.001)
+        samples.append(time.perf_counter() - t0 - 0.001)
+
+
+async def run_mode(access, seconds, concurrency, read_ratio):
+    counts = {"read": 0, "write": 0, "error": 0}
+    stop = asyncio.Event()
+    lag = []
+
+    async def worker():
+        while not stop.is_set():
+            try:
+                if random.random() < read_ratio:
+                    await access.read(listing.list_page, {})
+                    counts["read"] += 1
+                else:
+                    await access.write(main._ingest_reports, [make_report()])
+                    counts["write"] += 1
+            except sqlite3.OperationalError:
+                counts["error"] += 1
+            await asyncio.sleep(0)
+
+    lag_task = asyncio.create_task(measure_lag(stop, lag))
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks, lag_task)
+    access.close()
+
+    total = counts["read"] + counts["write"]
+    lag.sort()
+    return {
+        "req_per_s": total / seconds,
+        "reads": counts["read"],
+        "writes": counts["write"],
+        "errors": counts["error"],
+        "loop_lag_p99_ms": (lag[int(len(lag) * 0.99) - 1] * 1000) if lag else 0.0,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--read-ratio", type=float, default=0.7)
+    parser.add_argument("--rows", type=int, default=500, help="rows seeded before each run")
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    path = main.DB_FILE
+    print(f"Database: {path}  rows={args.rows}  concurrency={args.concurrency}  read_ratio={args.read_ratio}")
+
+    for name, factory in (("legacy", lambda: LegacyAccess(path)),
+                          ("pooled", lambda: Database(path, readers=args.readers))):
+        seed(path, args.rows)
+        result = asyncio.run(run_mode(factory(), args.seconds, args.concurrency, args.read_ratio))
+        print(f"{name:>7}: {result['req_per_s']:8.1f} req/s  "
+              f"(reads={result['reads']} writes={result['writes']} errors={result['errors']}, "
+              f"loop lag p99={result['loop_lag_p99_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main_cli()
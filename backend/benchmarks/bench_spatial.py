@@ -0,0 +1,150 @@
+"""
+Latency of bbox and nearest-k queries against the R*Tree spatial index.
+
+Seeds potholes (default 5M rows) either uniformly over a country-sized region
+or, with --layout city, over one city clustered around hotspots with detections
+spread over the past year (the distribution bench_suite.py uses), then times
+random viewports through the same query functions the GET /api/potholes handler
+uses. Viewports are centred on a random pothole, so in the city layout most of
+them land on dense areas.
+
+Usage:
+    python benchmarks/bench_spatial.py --rows 5000000 --queries 200 --viewport-deg 0.1
+    python benchmarks/bench_spatial.py --layout city --viewport-km 2,5,10 --db /data/city-5m.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp = tempfile.mkdtemp(prefix="pothole_bench_")
+if "--db" in sys.argv[:-1]:
+    os.environ["POTHOLE_DB"] = sys.argv[sys.argv.index("--db") + 1]
+os.environ.setdefault("POTHOLE_DB", os.path.join(_tmp, "bench.db"))
+os.environ.setdefault("POTHOLE_UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+
+import main  # noqa: E402
+import tiles  # noqa: E402
+import geo  # noqa: E402
+import listing  # noqa: E402
+
+# Roughly mainland India
+REGION = (68.0, 8.0, 97.0, 37.0)  # minLon, minLat, maxLon, maxLat
+# Greater Mumbai, roughly (as in bench_suite.py)
+CITY = (72.77, 18.89, 73.03, 19.27)
+HOTSPOTS = 400
+
+SEED_SQL = """
+INSERT INTO potholes (latitude, longitude, depth, length, width, severity_level, status, cell,
+                      tile, detected_at, last_seen_at)
+VALUES (?, ?, ?, ?, ?, 'Moderate', 'Red', ?, ?, ?, ?)
+"""
+
+
+def random_point(rng):
+    min_lon, min_lat, max_lon, max_lat = REGION
+    return rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+
+
+def city_points(rng):
+    """80% of potholes around hotspots (~150 m spread), the rest anywhere in the city."""
+    min_lon, min_lat, max_lon, max_lat = CITY
+    hotspots = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(HOTSPOTS)]
+
+    def point(rng):
+        if rng.random() < 0.8:
+            lat, lon = rng.choice(hotspots)
+            return lat + rng.gauss(0, 0.0015), lon + rng.gauss(0, 0.0015)
+        return rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+    return point
+
+
+def seed(path, rows, point, rng, chunk=100000):
+    """Top the table up to `rows` potholes detected over the past year."""
+    main.init_db()  # the app migrates the schema at startup, not on import
+    conn = sqlite3.connect(path)
+    have = conn.execute("SELECT COUNT(*) FROM potholes").fetchone()[0]
+    now = datetime.now(timezone.utc)
+    while have < rows:
+        params = []
+        for _ in range(min(chunk, rows - have)):
+            lat, lon = point(rng)
+            detected = (now - timedelta(seconds=rng.uniform(0, 365 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+            params.append((lat, lon, rng.uniform(2, 15), 0.0, 0.0, geo.cell_key(lat, lon),
+                           tiles.tile_key(lat, lon), detected, detected))
+        conn.executemany(SEED_SQL, params)
+        conn.commit()
+        have += len(params)
+        print(f"  seeded {have}/{rows}", end="\r", flush=True)
+    conn.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summary(values):
+    return (f"p50={percentile(values, 0.5):.2f} ms  p95={percentile(values, 0.95):.2f} ms  "
+            f"p99={percentile(values, 0.99):.2f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--layout", choices=("uniform", "city"), default="uniform")
+    parser.add_argument("--db", help="database file to use; seeded only if it holds fewer rows")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--viewport-deg", type=float, default=0.1, help="viewport edge length in degrees (~11 km)")
+    parser.add_argument("--viewport-km", help="comma separated viewport edge lengths in km (overrides --viewport-deg)")
+    parser.add_argument("--limit", type=int, default=listing.MAX_PAGE_SIZE, help="page size")
+    parser.add_argument("--pages", type=int, default=1, help="pages to follow per viewport")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    point = city_points(rng) if args.layout == "city" else random_point
+    t0 = time.perf_counter()
+    seed(main.DB_FILE, args.rows, point, rng)
+    print(f"Seeded {args.rows} rows ({args.layout}) in {time.perf_counter() - t0:.1f}s ({main.DB_FILE})")
+
+    sizes = ([float(km) / 111.32 for km in args.viewport_km.split(",")] if args.viewport_km
+             else [args.viewport_deg])
+    for size in sizes:
+        bbox_ms, page_ms, hits = [], [], []
+        for _ in range(args.queries):
+            lat, lon = point(rng)
+            bbox = (lon - size / 2, lat - size / 2, lon + size / 2, lat + size / 2)
+            cursor, t0 = None, time.perf_counter()
+            for _ in range(args.pages):
+                t1 = time.perf_counter()
+                rows, next_cursor = main.db.read_sync(listing.list_page, {}, args.limit,
+                                                      cursor and listing.decode_cursor(cursor), None, bbox)
+                page_ms.append((time.perf_counter() - t1) * 1000)
+                hits.append(len(rows))
+                cursor = next_cursor
+                if cursor is None:
+                    break
+            bbox_ms.append((time.perf_counter() - t0) * 1000)
+        print(f"bbox  ({size * 111.32:.1f} km, limit {args.limit}, avg {sum(hits) / len(hits):.0f} rows/page): "
+              f"{summary(page_ms)} per page" + (f", {summary(bbox_ms)} for {args.pages} pages" if args.pages > 1 else ""))
+
+    near_ms = []
+    for _ in range(args.queries):
+        lat, lon = point(rng)
+        t0 = time.perf_counter()
+        main.db.read_sync(listing.nearest, lat, lon, args.k)
+        near_ms.append((time.perf_counter() - t0) * 1000)
+    main.db.close()
+    print(f"near  (k={args.k}): {summary(near_ms)}")
+
+
+if __name__ == "__main__":
+    main_cli()
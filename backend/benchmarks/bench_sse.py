@@ -0,0 +1,130 @@
+"""
+Load test for the /api/stream Server-Sent Events channel.
+
+Starts one uvicorn worker on a scratch database, connects N concurrent SSE
+subscribers, posts reports through /api/potholes and measures how long each
+event takes to reach every subscriber (from the start of the POST).
+
+Usage:
+    python benchmarks/bench_sse.py --subscribers 1000 --events 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def wait_for_server(host, port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+async def subscriber(host, port, ready, received, stop):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /api/stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    ready.release()
+    event = None
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line.startswith(b"event:"):
+                event = line[6:].strip()
+            elif line.startswith(b"data:") and event == b"pothole":
+                pothole_id = json.loads(line[5:])["pothole"]["id"]
+                received.setdefault(pothole_id, []).append(time.perf_counter())
+    finally:
+        writer.close()
+
+
+async def post_report(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({
+        "latitude": 19.0760 + (random.random() - 0.5) * 0.1,
+        "longitude": 72.8777 + (random.random() - 0.5) * 0.1,
+        "depth": 8.0, "severity": "Critical", "timestamp": time.time(),
+    }).encode()
+    writer.write(b"POST /api/potholes HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])["id"]
+
+
+async def run(host, port, subscribers, events, interval):
+    ready = asyncio.Semaphore(0)
+    received, stop = {}, asyncio.Event()
+    tasks = [asyncio.create_task(subscriber(host, port, ready, received, stop)) for _ in range(subscribers)]
+    for _ in range(subscribers):
+        await ready.acquire()
+    await asyncio.sleep(1.0)  # let the server register every stream
+
+    sent = {}
+    for _ in range(events):
+        t0 = time.perf_counter()
+        sent[await post_report(host, port)] = t0
+        await asyncio.sleep(interval)
+    await asyncio.sleep(2.0)
+    stop.set()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [(t - sent[pid]) * 1000 for pid, times in received.items() if pid in sent for t in times]
+    return latencies, len(sent) * subscribers
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between reports")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="pothole_bench_")
+    env = dict(os.environ, POTHOLE_DB=os.path.join(tmp, "bench.db"), POTHOLE_UPLOAD_DIR=os.path.join(tmp, "uploads"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", "1", "--log-level", "warning", "--backlog", "4096"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        asyncio.run(wait_for_server("127.0.0.1", args.port))
+        latencies, expected = asyncio.run(run("127.0.0.1", args.port, args.subscribers, args.events, args.interval))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"subscribers={args.subscribers} events={args.events}")
+    print(f"delivered {len(latencies)}/{expected} ({100.0 * len(latencies) / max(1, expected):.1f}%)")
+    if latencies:
+        print(f"latency p50={percentile(latencies, 0.5):.1f} ms  p95={percentile(latencies, 0.95):.1f} ms  "
+              f"p99={percentile(latencies, 0.99):.1f} ms  max={max(latencies):.1f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
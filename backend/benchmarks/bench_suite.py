@@ -0,0 +1,344 @@
+"""
+Reproducible load benchmark for the backend on synthetic city-scale data.
+
+Seeds potholes over one city (clustered along hotspots, detections spread over
+the past year), then drives the app with a closed loop of --concurrency clients,
+in-process through the ASGI app and/or over real HTTP against a uvicorn
+subprocess. Reports throughput and p50/p95/p99 latency per scenario and writes
+everything, with the commit and environment, to a JSON file so runs can be
+compared across commits (--compare).
+
+Scenarios:
+    ingest       POST /api/potholes, one new report per request
+    batch        POST /api/potholes/batch, --batch-size reports per request
+    list         GET /api/potholes?limit=100 with a random `until` (cache misses)
+    list_cached  the same listing query every time (response cache hits)
+    bbox         GET /api/potholes?bbox=... for a random ~2 km viewport
+    near         GET /api/potholes?near=...&k=10
+    upload       POST /api/upload_image with a fresh JPEG per request
+
+Usage:
+    python benchmarks/bench_suite.py --scale 1m --transport both --concurrency 32
+    python benchmarks/bench_suite.py --rows 250000 --scenarios ingest,bbox --requests 2000
+    python benchmarks/bench_suite.py --db /data/bench-10m.db --scale 10m   # reuse a seeded file
+    python benchmarks/bench_suite.py --compare results/old.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_DIR)
+
+SCALES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+SCENARIOS = ("ingest", "batch", "list", "list_cached", "bbox", "near", "upload")
+
+# Greater Mumbai, roughly
+CITY = (72.77, 18.89, 73.03, 19.27)  # minLon, minLat, maxLon, maxLat
+HOTSPOTS = 400
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="100k", help="rows to seed")
+    parser.add_argument("--rows", type=int, help="explicit row count (overrides --scale)")
+    parser.add_argument("--db", help="database file to use; seeded only if it holds fewer rows")
+    parser.add_argument("--transport", choices=("inproc", "http", "both"), default="inproc")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<rows>-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+ROWS = ARGS.rows if ARGS.rows is not None else SCALES[ARGS.scale]
+
+_tmp = tempfile.mkdtemp(prefix="pothole_bench_")
+os.environ["POTHOLE_DB"] = os.path.abspath(ARGS.db) if ARGS.db else os.path.join(_tmp, "bench.db")
+os.environ.setdefault("POTHOLE_UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+os.environ.setdefault("POTHOLE_DERIVED_DIR", os.path.join(_tmp, "derived"))
+
+import httpx  # noqa: E402
+import geo  # noqa: E402
+import main  # noqa: E402
+import tiles  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# --- Synthetic data ---
+
+def city_point(rng, hotspots):
+    """80% of potholes cluster around hotspots (~150 m spread), the rest anywhere in the city."""
+    min_lon, min_lat, max_lon, max_lat = CITY
+    if rng.random() < 0.8:
+        lat, lon = rng.choice(hotspots)
+        return lat + rng.gauss(0, 0.0015), lon + rng.gauss(0, 0.0015)
+    return rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+
+
+def make_hotspots(rng):
+    min_lon, min_lat, max_lon, max_lat = CITY
+    return [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(HOTSPOTS)]
+
+
+def make_report(rng, hotspots):
+    lat, lon = city_point(rng, hotspots)
+    depth = round(rng.uniform(2.0, 15.0), 2)
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "depth": depth,
+        "length": round(rng.uniform(10, 80), 1),
+        "width": round(rng.uniform(10, 80), 1),
+        "severity": "Critical" if depth > 7 else ("Moderate" if depth > 3 else "Minor"),
+        "timestamp": time.time(),
+    }
+
+
+SEED_SQL = """
+INSERT INTO potholes (latitude, longitude, depth, length, width, severity_level, status, cell,
+                      tile, detected_at, last_seen_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def seed(path, rows, rng, hotspots, chunk=100000):
+    """Top the table up to `rows` potholes detected over the past year. Returns seconds spent."""
+    main.init_db()  # the app migrates the schema at startup, not on import
+    conn = sqlite3.connect(path)
+    have = conn.execute("SELECT COUNT(*) FROM potholes").fetchone()[0]
+    t0 = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    statuses = ("Red", "Red", "Red", "Yellow", "Green")
+    while have < rows:
+        params = []
+        for _ in range(min(chunk, rows - have)):
+            r = make_report(rng, hotspots)
+            detected = (now - timedelta(seconds=rng.uniform(0, 365 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+            params.append((r["latitude"], r["longitude"], r["depth"], r["length"], r["width"], r["severity"],
+                           rng.choice(statuses), geo.cell_key(r["latitude"], r["longitude"]),
+                           tiles.tile_key(r["latitude"], r["longitude"]), detected, detected))
+        conn.executemany(SEED_SQL, params)
+        conn.commit()
+        have += len(params)
+        print(f"  seeded {have}/{rows}", end="\r", flush=True)
+    conn.close()
+    return time.perf_counter() - t0
+
+
+def make_jpeg(rng):
+    """A distinct small JPEG (random blocks, so neither hash nor dHash deduplicates it)."""
+    if Image is None:
+        return b"\xff\xd8\xff\xe0" + rng.randbytes(40000) + b"\xff\xd9"
+    im = Image.new("RGB", (8, 6))
+    im.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+    buf = io.BytesIO()
+    im.resize((640, 480), Image.NEAREST).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def request_factory(scenario, rng, hotspots, batch_size):
+    """Returns a function producing (method, url, kwargs) for one request of the scenario."""
+    min_lon, min_lat, max_lon, max_lat = CITY
+    now = time.time()
+    if scenario == "ingest":
+        return lambda: ("POST", "/api/potholes", {"json": make_report(rng, hotspots)})
+    if scenario == "batch":
+        return lambda: ("POST", "/api/potholes/batch",
+                        {"json": [make_report(rng, hotspots) for _ in range(batch_size)]})
+    if scenario == "list":
+        return lambda: ("GET", f"/api/potholes?limit=100&until={int(now - rng.uniform(0, 300 * 86400))}", {})
+    if scenario == "list_cached":
+        return lambda: ("GET", "/api/potholes?limit=100", {})
+    if scenario == "bbox":
+        def bbox():
+            lat, lon = city_point(rng, hotspots)
+            return "GET", f"/api/potholes?bbox={lon - 0.01},{lat - 0.01},{lon + 0.01},{lat + 0.01}&limit=500", {}
+        return bbox
+    if scenario == "near":
+        def near():
+            lat, lon = city_point(rng, hotspots)
+            return "GET", f"/api/potholes?near={lat},{lon}&k=10", {}
+        return near
+    if scenario == "upload":
+        images = [make_jpeg(rng) for _ in range(ARGS.requests)]
+
+        def upload():
+            lat, lon = city_point(rng, hotspots)
+            return "POST", f"/api/upload_image?lat={lat}&lon={lon}", {
+                "content": images.pop() if images else make_jpeg(rng),
+                "headers": {"Content-Type": "image/jpeg"}}
+        return upload
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+# --- Load generation ---
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_scenario(client, make_request, requests, concurrency):
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = make_request()
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            errors += not ok
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_all(client, transport, scenarios, rng, hotspots):
+    results = []
+    for scenario in scenarios:
+        make_request = request_factory(scenario, rng, hotspots, ARGS.batch_size)
+        result = await run_scenario(client, make_request, ARGS.requests, ARGS.concurrency)
+        result.update(scenario=scenario, transport=transport)
+        results.append(result)
+        print(f"  {transport:6} {scenario:12} {result['throughput_rps']:9.1f} req/s  "
+              f"p50={result['p50_ms']:.2f} ms  p95={result['p95_ms']:.2f} ms  p99={result['p99_ms']:.2f} ms"
+              + (f"  errors={result['errors']}" if result["errors"] else ""))
+    return results
+
+
+async def run_inproc(scenarios, rng, hotspots):
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run_all(client, "inproc", scenarios, rng, hotspots)
+
+
+async def run_http(scenarios, rng, hotspots):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(ARGS.port),
+         "--log-level", "warning"], cwd=BACKEND_DIR, env=dict(os.environ))
+    base_url = f"http://127.0.0.1:{ARGS.port}"
+    try:
+        limits = httpx.Limits(max_connections=ARGS.concurrency, max_keepalive_connections=ARGS.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            deadline = time.time() + 30
+            while True:
+                try:
+                    await client.get("/api/cache/stats")
+                    break
+                except httpx.HTTPError:
+                    if time.time() > deadline or server.poll() is not None:
+                        raise RuntimeError("uvicorn did not come up")
+                    await asyncio.sleep(0.2)
+            return await run_all(client, "http", scenarios, rng, hotspots)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# --- Reporting ---
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, old_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    before = {(r["transport"], r["scenario"]): r for r in old["results"]}
+    print(f"\nvs {old_path} (commit {old['meta']['commit']}, {old['meta']['rows']} rows):")
+    for r in results:
+        o = before.get((r["transport"], r["scenario"]))
+        if o is None:
+            continue
+        print(f"  {r['transport']:6} {r['scenario']:12} throughput {r['throughput_rps'] / o['throughput_rps']:5.2f}x  "
+              f"p99 {o['p99_ms']:.2f} -> {r['p99_ms']:.2f} ms")
+
+
+def main_cli():
+    scenarios = [s.strip() for s in ARGS.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+    rng = random.Random(ARGS.seed)
+    hotspots = make_hotspots(rng)
+
+    print(f"Seeding {ROWS} potholes into {main.DB_FILE}")
+    seed_seconds = seed(main.DB_FILE, ROWS, rng, hotspots)
+    print(f"\nSeeded in {seed_seconds:.1f}s")
+
+    results = []
+    if ARGS.transport in ("inproc", "both"):
+        results += asyncio.run(run_inproc(scenarios, random.Random(ARGS.seed + 1), hotspots))
+    if ARGS.transport in ("http", "both"):
+        main.db.close()
+        results += asyncio.run(run_http(scenarios, random.Random(ARGS.seed + 2), hotspots))
+
+    commit = git_commit()
+    meta = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rows": ROWS,
+        "seed_seconds": round(seed_seconds, 1),
+        "concurrency": ARGS.concurrency,
+        "requests_per_scenario": ARGS.requests,
+        "batch_size": ARGS.batch_size,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    output = ARGS.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                         f"{ROWS}-{commit}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    if ARGS.compare:
+        compare(results, ARGS.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
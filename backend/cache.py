@@ -0,0 +1,226 @@
+"""
+Read-through cache of encoded GET /api/potholes responses.
+
+Entries are keyed by the parsed query (so parameter order or formatting does not
+matter) and hold the response bytes, an ETag derived from those bytes, and the
+scope of the query: its filters and bbox plus either the (detected_at, id) range
+the page covers or, for nearest-neighbour queries, the k-th distance. Writes
+report the rows they touched and only entries whose scope a row falls in are
+dropped, so a report on one street leaves listings of other areas (and their
+ETags) intact.
+
+Entries are indexed by the coarse INDEX_STEP_DEG cells their scope covers
+(listings without a bbox, or spanning too many cells, are checked on every
+write), so a write only tests the entries near its rows. A write that would
+still need more than max_checks tests, such as a large batch ingest, drops
+every entry instead: rebuilding pages is cheaper than stalling the event loop.
+
+The cache assumes this process makes every write to the potholes table; writes
+from elsewhere are only picked up as entries get evicted.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import geo
+
+try:
+    import orjson
+
+    def dumps(value):
+        return orjson.dumps(value)
+except ImportError:
+    import json
+
+    def dumps(value):
+        return json.dumps(value, separators=(",", ":")).encode()
+
+# Invalidation index: ~2 km cells; a scope covering more than MAX_INDEX_CELLS is checked on every write
+INDEX_STEP_DEG = 0.02
+MAX_INDEX_CELLS = 64
+
+
+def _index_cell(lat, lon):
+    return int((lat + 90.0) // INDEX_STEP_DEG), int((lon + 180.0) // INDEX_STEP_DEG)
+
+
+def _index_cells(bounds):
+    """Index cells covering bounds (min_lon, min_lat, max_lon, max_lat), or None for too many or no bounds."""
+    if bounds is None:
+        return None
+    min_lon, min_lat, max_lon, max_lat = bounds
+    r0, c0 = _index_cell(min_lat, min_lon)
+    r1, c1 = _index_cell(max_lat, max_lon)
+    if (r1 - r0 + 1) * (c1 - c0 + 1) > MAX_INDEX_CELLS:
+        return None
+    return [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+
+class PageScope:
+    """Rows a newest-first page covers: filters, bbox and upper > (detected_at, id) >= lower."""
+
+    def __init__(self, filters, bbox, upper, lower):
+        self.filters = filters
+        self.bbox = bbox
+        self.upper = upper
+        self.lower = lower
+
+    def bounds(self):
+        return self.bbox
+
+    def affected(self, row, op):
+        key = (row["detected_at"], row["id"])
+        if (self.upper is not None and key >= self.upper) or (self.lower is not None and key < self.lower):
+            return False
+        if not _in_bbox(self.bbox, row):
+            return False
+        # An update may take a row out of the filter as well as into it
+        return op != "insert" or _matches(self.filters, row)
+
+
+class NearScope:
+    """Rows that could enter or leave a k-nearest result: anything within its k-th distance."""
+
+    def __init__(self, lat, lon, filters, radius_m):
+        self.lat = lat
+        self.lon = lon
+        self.filters = filters
+        self.radius_m = radius_m  # None when fewer than k potholes matched
+
+    def bounds(self):
+        return geo.box_around(self.lat, self.lon, self.radius_m) if self.radius_m is not None else None
+
+    def affected(self, row, op):
+        if self.radius_m is not None and \
+                geo.haversine_m(self.lat, self.lon, row["latitude"], row["longitude"]) > self.radius_m:
+            return False
+        return op != "insert" or _matches(self.filters, row)
+
+
+def _in_bbox(bbox, row):
+    if bbox is None:
+        return True
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return min_lat <= row["latitude"] <= max_lat and min_lon <= row["longitude"] <= max_lon
+
+
+def _matches(filters, row):
+    """Python mirror of listing._where() for one row."""
+    if "open" in filters and (row["status"] != "Green") != filters["open"]:
+        return False
+    if "status" in filters and row["status"] != filters["status"]:
+        return False
+    if "severity_level" in filters and row["severity_level"] != filters["severity_level"]:
+        return False
+    # NULL never satisfies a comparison in SQL
+    if "min_depth" in filters and (row["depth"] is None or row["depth"] < filters["min_depth"]):
+        return False
+    if "max_depth" in filters and (row["depth"] is None or row["depth"] > filters["max_depth"]):
+        return False
+    if "since" in filters and not row["detected_at"] >= filters["since"]:
+        return False
+    if "until" in filters and not row["detected_at"] < filters["until"]:
+        return False
+    return True
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses, bounded by entry count and total body bytes."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, max_checks=20000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_checks = max_checks
+        self._entries = OrderedDict()  # key -> (body, etag, headers, scope)
+        self._bytes = 0
+        self._by_cell = {}  # index cell -> keys of the entries whose scope covers it
+        self._unindexed = set()  # keys checked against every write
+        self._cells = {}  # key -> index cells, None if unindexed
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.flushes = 0
+        # Bumped by every invalidation; a response built across a write is served but not cached
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations, "flushes": self.flushes}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value, scope, generation, headers=None):
+        """Encode value and cache it unless a write happened since generation. Returns the entry."""
+        body = dumps(value)
+        entry = (body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"', headers or {}, scope)
+        with self._lock:
+            # Responses larger than a quarter of the budget would just flush everything else
+            if generation != self.generation or len(body) > self.max_bytes // 4:
+                return entry
+            self._drop(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            cells = self._cells[key] = _index_cells(scope.bounds())
+            if cells is None:
+                self._unindexed.add(key)
+            for cell in cells or ():
+                self._by_cell.setdefault(cell, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[0])
+        cells = self._cells.pop(key)
+        if cells is None:
+            self._unindexed.discard(key)
+        for cell in cells or ():
+            keys = self._by_cell[cell]
+            keys.discard(key)
+            if not keys:
+                del self._by_cell[cell]
+
+    def invalidate(self, op, rows):
+        """Drop every entry one of the written rows ("insert" or "update") could change."""
+        if not rows:
+            return
+        with self._lock:
+            self.generation += 1
+            by_cell = {}
+            for row in rows:
+                by_cell.setdefault(_index_cell(row["latitude"], row["longitude"]), []).append(row)
+            checks = len(self._unindexed) * len(rows) + \
+                sum(len(self._by_cell.get(cell, ())) * len(cell_rows) for cell, cell_rows in by_cell.items())
+            if checks > self.max_checks:
+                stale = list(self._entries)
+                self.flushes += 1
+            else:
+                nearby = {}  # key of an indexed entry -> the written rows in its cells
+                for cell, cell_rows in by_cell.items():
+                    for key in self._by_cell.get(cell, ()):
+                        nearby.setdefault(key, []).extend(cell_rows)
+                candidates = [(key, rows) for key in self._unindexed] + list(nearby.items())
+                stale = [key for key, touching in candidates
+                         if any(self._entries[key][3].affected(row, op) for row in touching)]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
@@ -0,0 +1,115 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+
+
+class Database:
+    """
+    Long-lived SQLite access layer for the backend.
+
+    One writer connection (serialised by a lock, SQLite only allows one writer
+    anyway) plus a small pool of read-only connections. The file runs in WAL
+    mode so dashboards reading never block vehicles reporting.
+
+    Handlers must not touch sqlite3 directly from `async def` code: use
+    `await db.read(fn, ...)` / `await db.write(fn, ...)`, which run `fn(conn, ...)`
+    on a worker thread so the event loop keeps serving other requests.
+    """
+
+    def __init__(self, path, readers=4, busy_timeout_ms=5000, synchronous="NORMAL"):
+        self.path = path
+        self.max_readers = readers
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._all_readers = []
+        # Optional observer(mode, name, seconds) for every read/write call, e.g. metrics
+        self.observer = None
+
+    def _observe(self, mode, fn, start):
+        if self.observer is not None:
+            self.observer(mode, getattr(fn, "__name__", "unknown"), time.perf_counter() - start)
+
+    def _connect(self, readonly=False):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # NORMAL is durable across application crashes in WAL mode; only an OS
+        # crash / power cut can lose the last transactions.
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")  # ~16 MB per connection
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    # --- Synchronous API (call from worker threads only) ---
+
+    def write_sync(self, fn, *args):
+        """Run fn(conn, *args) in a single transaction on the writer connection."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            start = time.perf_counter()
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._observe("write", fn, start)
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._reader_lock:
+            if self._reader_count < self.max_readers:
+                self._reader_count += 1
+                conn = self._connect(readonly=True)
+                self._all_readers.append(conn)
+                return conn
+        # Pool exhausted: wait for a connection to come back
+        return self._readers.get()
+
+    def read_sync(self, fn, *args):
+        """Run fn(conn, *args) on a pooled read-only connection."""
+        conn = self._acquire_reader()
+        start = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._observe("read", fn, start)
+            self._readers.put(conn)
+
+    # --- Async API (call from request handlers) ---
+
+    async def read(self, fn, *args):
+        return await asyncio.to_thread(self.read_sync, fn, *args)
+
+    async def write(self, fn, *args):
+        return await asyncio.to_thread(self.write_sync, fn, *args)
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._reader_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers = []
+            self._reader_count = 0
+            self._readers = queue.LifoQueue()
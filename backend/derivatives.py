@@ -0,0 +1,135 @@
+"""
+Thumbnails and web-sized versions of uploaded ESP32-CAM images.
+
+Derivatives are rendered in a small process pool (Pillow is CPU bound and would
+stall the event loop or hold the GIL in a thread) and stored under the SHA-256 of
+the original image, so a re-uploaded image reuses existing files and every
+derivative URL names immutable bytes. Pillow is optional: without it uploads work
+as before and the dashboard keeps using the full image.
+"""
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, features
+    HAVE_PIL = True
+except ImportError:
+    HAVE_PIL = False
+
+# name -> (longest side in px, preferred format)
+VARIANTS = {
+    "thumb": (320, "JPEG"),
+    "preview": (1280, "WEBP"),
+}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+MEDIA_TYPES = {"jpg": "image/jpeg", "webp": "image/webp"}
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 75, "progressive": True, "optimize": True},
+    "WEBP": {"quality": 75, "method": 4},
+}
+NAME_RE = re.compile(r"^([0-9a-f]{64})_([a-z]+)\.(jpg|webp)$")
+
+
+def _format(preferred):
+    # Pillow builds without libwebp fall back to progressive JPEG
+    if preferred == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return preferred
+
+
+def derived_name(digest, variant):
+    return f"{digest}_{variant}.{EXTENSIONS[_format(VARIANTS[variant][1])]}"
+
+
+def derived_path(out_dir, name):
+    """Path of a derivative file; files are sharded by the first two hash digits."""
+    return os.path.join(out_dir, name[:2], name)
+
+
+def existing(out_dir, digest):
+    """{variant: name} if every derivative of digest is already on disk, else None."""
+    if not HAVE_PIL:
+        return None
+    names = {v: derived_name(digest, v) for v in VARIANTS}
+    if all(os.path.exists(derived_path(out_dir, n)) for n in names.values()):
+        return names
+    return None
+
+
+def remove(out_dir, digest):
+    """Delete every derivative of digest, in whichever format it was rendered."""
+    for variant in VARIANTS:
+        for ext in EXTENSIONS.values():
+            path = derived_path(out_dir, f"{digest}_{variant}.{ext}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def render(src_path, out_dir, digest):
+    """Worker process entry point: write the missing derivatives of one image. Returns {variant: name}."""
+    names = {v: derived_name(digest, v) for v in VARIANTS}
+    os.makedirs(os.path.join(out_dir, digest[:2]), exist_ok=True)
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        for variant, (max_px, preferred) in VARIANTS.items():
+            path = derived_path(out_dir, names[variant])
+            if os.path.exists(path):
+                continue
+            fmt = _format(preferred)
+            copy = im.copy()
+            copy.thumbnail((max_px, max_px), Image.LANCZOS)
+            part = f"{path}.{os.getpid()}.part"  # two workers may render the same image
+            copy.save(part, format=fmt, **SAVE_OPTIONS[fmt])
+            os.replace(part, path)
+    return names
+
+
+class DerivativePipeline:
+    """Runs render() for uploads in a process pool and reports finished jobs to on_done."""
+
+    def __init__(self, out_dir, workers=2):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.enabled = HAVE_PIL and workers > 0
+        self._pool = None
+        self._tasks = set()
+        self.completed = 0
+        self.failed = 0
+
+    def __len__(self):
+        """Jobs queued or running."""
+        return len(self._tasks)
+
+    def submit(self, src_path, digest, on_done):
+        """
+        Schedule derivatives for an image. on_done(names) is awaited on the event
+        loop once the files exist. Must be called from the event loop.
+        """
+        if not self.enabled:
+            return
+        if self._pool is None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        task = asyncio.get_running_loop().create_task(self._run(src_path, digest, on_done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, src_path, digest, on_done):
+        loop = asyncio.get_running_loop()
+        try:
+            names = await loop.run_in_executor(self._pool, render, src_path, self.out_dir, digest)
+            await on_done(names)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Derivative generation failed for {src_path}: {e}")
+
+    async def close(self):
+        """Let running jobs finish, then stop the worker processes."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
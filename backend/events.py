@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+
+class Subscription:
+    """One connected stream client: a bounded queue of pre-encoded SSE frames."""
+
+    def __init__(self, queue_size, bbox=None):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.bbox = bbox
+        self.evicted = False
+
+    def wants(self, lat, lon):
+        if self.bbox is None or lat is None or lon is None:
+            return True
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+
+class EventHub:
+    """
+    In-process fan-out of pothole events to /api/stream subscribers.
+
+    publish() must be called from the event loop (after the DB write committed).
+    Each event is encoded once and the same bytes are queued for every interested
+    subscriber. A subscriber whose queue is full is evicted instead of letting it
+    hold memory or slow the publisher down; the client reconnects and resyncs via
+    the delta feed.
+    """
+
+    def __init__(self, queue_size=256, max_subscribers=5000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self.published = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, bbox=None):
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        sub = Subscription(self.queue_size, bbox)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def _evict(self, sub):
+        self._subscribers.discard(sub)
+        sub.evicted = True
+        self.evictions += 1
+        # Make room for the sentinel that tells the stream to close
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    def publish(self, event_type, payload, lat=None, lon=None):
+        if not self._subscribers:
+            return
+        frame = f"event: {event_type}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+        self.published += 1
+        for sub in list(self._subscribers):
+            if not sub.wants(lat, lon):
+                continue
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._evict(sub)
+
+    def publish_potholes(self, op, rows):
+        # Deletes carry the same "deleted" flag as the delta feed's tombstones
+        for row in rows:
+            pothole = {**row, "deleted": True} if op == "delete" else row
+            self.publish("pothole", {"op": op, "pothole": pothole}, row.get("latitude"), row.get("longitude"))
+
+    async def stream(self, sub, heartbeat=15.0, ready=None):
+        """Async generator of SSE frames for one subscriber, starting with a `ready` event if given."""
+        try:
+            yield b": connected\n\n"
+            if ready is not None:
+                yield f"event: ready\ndata: {json.dumps(ready, separators=(',', ':'))}\n\n".encode()
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if frame is None:
+                    yield b"event: evicted\ndata: {}\n\n"
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(sub)
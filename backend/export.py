@@ -0,0 +1,176 @@
+"""
+Bulk export of the pothole table (GET /api/export) as GeoJSON, CSV or Parquet.
+
+Rows are read in CHUNK_ROWS primary-key chunks (listing.export_chunk) and each
+chunk is encoded on the same worker thread that fetched it, so the download
+streams with memory bounded by one chunk (one row group for Parquet, released
+after each write) no matter how large the table is. Parquet needs pyarrow, which is optional.
+"""
+import csv
+import io
+
+import listing
+from cache import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+CHUNK_ROWS = 5000
+# Five chunks per row group. Arrow buffers a whole group before writing it: 100k-row
+# groups grew RSS ~70 MB, 25k rows ~17 MB flat up to 10M rows, for a file ~1.8x larger
+# (benchmarks/bench_export.py).
+PARQUET_ROW_GROUP = 25000
+
+# format -> (media type, file extension)
+FORMATS = {
+    "geojson": ("application/geo+json", "geojson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+TIME_COLUMNS = ("detected_at", "repaired_at", "last_seen_at")
+INTEGER_COLUMNS = ("id", "observation_count")
+REAL_COLUMNS = ("latitude", "longitude", "depth", "length", "width", "growth_rate")
+
+
+class CsvEncoder:
+    def begin(self):
+        return self.encode([listing.COLUMNS])
+
+    def encode(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(rows)
+        return buf.getvalue().encode()
+
+    def end(self):
+        return b""
+
+
+class GeoJsonEncoder:
+    """A FeatureCollection of Points; every other column becomes a property."""
+
+    def __init__(self):
+        self._first = True
+        self._lat = listing.COLUMNS.index("latitude")
+        self._lon = listing.COLUMNS.index("longitude")
+
+    def begin(self):
+        return b'{"type":"FeatureCollection","features":['
+
+    def encode(self, rows):
+        features = []
+        for row in rows:
+            features.append({
+                "type": "Feature",
+                "id": row[0],
+                "geometry": {"type": "Point", "coordinates": [row[self._lon], row[self._lat]]},
+                "properties": dict(zip(listing.COLUMNS, row)),
+            })
+        body = dumps(features)[1:-1]  # drop the list brackets, the collection provides them
+        if not self._first:
+            body = b"," + body
+        self._first = False
+        return body
+
+    def end(self):
+        return b"]}"
+
+
+class _Sink:
+    """Write-only file object that hands out what pyarrow wrote since the last drain()."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class ParquetEncoder:
+    """Zstd-compressed Parquet, one row group per PARQUET_ROW_GROUP rows; timestamps as UTC seconds."""
+
+    def __init__(self):
+        fields = []
+        for c in listing.COLUMNS:
+            if c in TIME_COLUMNS:
+                fields.append(pa.field(c, pa.timestamp("s", tz="UTC")))
+            elif c in INTEGER_COLUMNS:
+                fields.append(pa.field(c, pa.int64()))
+            elif c in REAL_COLUMNS:
+                fields.append(pa.field(c, pa.float64()))
+            else:
+                fields.append(pa.field(c, pa.string()))
+        self.schema = pa.schema(fields)
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+        self._batches = []
+        self._pending = 0
+
+    def _batch(self, rows):
+        arrays = []
+        for field, values in zip(self.schema, zip(*rows)):
+            if field.name in TIME_COLUMNS:
+                text = pa.array(values, pa.string())
+                arrays.append(pc.strptime(text, format="%Y-%m-%d %H:%M:%S", unit="s", error_is_null=True)
+                              .cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _flush(self):
+        if self._batches:
+            table = pa.Table.from_batches(self._batches)
+            self._batches, self._pending = [], 0
+            self._writer.write_table(table, row_group_size=PARQUET_ROW_GROUP)
+            del table
+            # Hand the group's buffers back to the OS instead of keeping them in the pool
+            pa.default_memory_pool().release_unused()
+
+    def begin(self):
+        return self._sink.drain()
+
+    def encode(self, rows):
+        self._batches.append(self._batch(rows))
+        self._pending += len(rows)
+        if self._pending >= PARQUET_ROW_GROUP:
+            self._flush()
+        return self._sink.drain()
+
+    def end(self):
+        self._flush()
+        self._writer.close()
+        return self._sink.drain()
+
+
+def encoder(fmt):
+    return {"geojson": GeoJsonEncoder, "csv": CsvEncoder, "parquet": ParquetEncoder}[fmt]()
+
+
+def encode_chunk(conn, enc, filters, after_id, last_id, bbox=None, table=None):
+    """Fetch and encode the next chunk. Returns (bytes, last id), or (None, after_id) when done."""
+    rows = listing.export_chunk(conn, filters, after_id, last_id, CHUNK_ROWS, bbox, table)
+    if not rows:
+        return None, after_id
+    return enc.encode(rows), rows[-1][0]
@@ -0,0 +1,91 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+EARTH_CIRCUMFERENCE_M = 2 * math.pi * EARTH_RADIUS_M
+# On the same sphere as haversine_m, so a box_around radius holds every point haversine_m puts within it
+METERS_PER_DEG_LAT = math.radians(1) * EARTH_RADIUS_M
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_bbox(value):
+    """'minLon,minLat,maxLon,maxLat' -> (min_lon, min_lat, max_lon, max_lat). Raises ValueError."""
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox min values must not exceed max values")
+    if not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("bbox out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_point(value):
+    """'lat,lon' -> (lat, lon). Raises ValueError."""
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 2:
+        raise ValueError("near must be lat,lon")
+    lat, lon = parts
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("near out of range")
+    return lat, lon
+
+
+def box_around(lat, lon, radius_m):
+    """Bounding box (min_lon, min_lat, max_lon, max_lat) containing a circle of radius_m. Raises ValueError."""
+    if not (math.isfinite(lat) and math.isfinite(lon) and math.isfinite(radius_m)):
+        raise ValueError("coordinates and radius must be finite")
+    dlat = radius_m / METERS_PER_DEG_LAT
+    # Widest longitude offset of the circle: asin(sin(d) / cos(lat)), a little more than d / cos(lat)
+    d = min(radius_m / EARTH_RADIUS_M, math.pi / 2)
+    coslat = math.cos(math.radians(lat))
+    if abs(lat) + dlat >= 90 or math.sin(d) >= coslat:
+        dlon = 180.0  # the circle holds a pole
+    else:
+        dlon = math.degrees(math.asin(math.sin(d) / coslat))
+    return (max(-180.0, lon - dlon), max(-90.0, lat - dlat),
+            min(180.0, lon + dlon), min(90.0, lat + dlat))
+
+
+# Fixed square grid used to match repeat detections in O(1). The cell size is
+# independent of the matching radius, so the radius can change without
+# recomputing stored cell keys.
+GRID_CELL_M = 5.0
+GRID_STEP_DEG = GRID_CELL_M / 111320.0  # not METERS_PER_DEG_LAT: stored cell keys depend on it
+GRID_COLS = int(math.ceil(360.0 / GRID_STEP_DEG)) + 1
+# Near the poles a few metres span many degrees of longitude, so many cells
+MAX_NEIGHBOUR_CELLS = 64
+
+
+def _grid_rc(lat, lon):
+    return int((lat + 90.0) // GRID_STEP_DEG), int((lon + 180.0) // GRID_STEP_DEG)
+
+
+def cell_key(lat, lon):
+    """Integer id of the grid cell containing (lat, lon)."""
+    if lat is None or lon is None:
+        return None
+    row, col = _grid_rc(lat, lon)
+    return row * GRID_COLS + col
+
+
+def cells_within(lat, lon, radius_m, max_cells=MAX_NEIGHBOUR_CELLS):
+    """
+    Keys of every grid cell that may hold a point within radius_m of (lat, lon),
+    or None when there would be more than max_cells of them. Raises ValueError
+    for non-finite input.
+    """
+    min_lon, min_lat, max_lon, max_lat = box_around(lat, lon, radius_m)
+    r0, c0 = _grid_rc(min_lat, min_lon)
+    r1, c1 = _grid_rc(max_lat, max_lon)
+    if (r1 - r0 + 1) * (c1 - c0 + 1) > max_cells:
+        return None
+    return [r * GRID_COLS + c for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
@@ -0,0 +1,303 @@
+"""
+Image uploads from the ESP32-CAM: streaming storage and pothole correlation.
+
+An image is tied to a pothole, in order of preference, by
+  1. an explicit pothole id,
+  2. the event id the Pi generated for the detection (sent to the ESP32 with the
+     capture command and included in the report),
+  3. a short time window plus distance, when the uploader sends coordinates.
+Images nothing matches yet are kept as pending rows in `images`; the report that
+arrives later claims them by event id or by time and location.
+
+Files are content addressed: stored once per SHA-256 under uploads/ab/cd/<hash>.jpg
+and reference counted in `blobs`, so ESP32 retries do not store the same bytes
+twice. With Pillow installed a difference hash (dHash) of each image is kept as
+well, and a frame nearly identical to one stored moments earlier (consecutive
+triggers on the same hole) reuses that blob instead of adding a new file.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+import anyio
+
+import derivatives
+import geo
+
+try:
+    from PIL import Image
+    HAVE_PIL = True
+except ImportError:
+    HAVE_PIL = False
+
+CHUNK_SIZE = 64 * 1024
+INCOMING_DIR = ".incoming"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def store_stream(chunks, upload_dir, max_bytes):
+    """
+    Write an async iterator of byte chunks to a temporary file under upload_dir
+    without holding the image in memory. Returns (temp path, size, sha256 hex
+    digest); finalize() moves it into the store. Raises UploadTooLarge (after
+    removing the partial file) once more than max_bytes arrive.
+    """
+    incoming = os.path.join(upload_dir, INCOMING_DIR)
+    os.makedirs(incoming, exist_ok=True)
+    final_path = os.path.join(incoming, f"{uuid.uuid4()}.jpg")
+    part_path = final_path + ".part"
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async with await anyio.open_file(part_path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+        os.replace(part_path, final_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return final_path, size, digest.hexdigest()
+
+
+def blob_name(digest):
+    """Store-relative path of a blob: two directory levels of 256 shards each."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+
+def finalize(temp_path, upload_dir, digest, keep):
+    """
+    Move an uploaded temp file into the store as blob digest, or discard it when
+    keep is False (its bytes are already stored) or the blob exists. Idempotent,
+    so concurrent uploads of the same bytes are safe.
+    """
+    path = os.path.join(upload_dir, blob_name(digest))
+    if keep and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    else:
+        os.remove(temp_path)
+    return path
+
+
+def dhash(path):
+    """64-bit difference hash (as a signed SQLite integer), or None without Pillow."""
+    if not HAVE_PIL:
+        return None
+    with Image.open(path) as im:
+        im.draft("L", (64, 64))  # let the JPEG decoder downscale, much cheaper than a full decode
+        px = list(im.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+def _hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def acquire_blob(conn, digest, size, phash=None, max_distance=0, window_s=60):
+    """
+    Take a reference on the blob for an upload. Exact duplicates share the blob;
+    with phash and max_distance > 0, so does an image within max_distance bits of
+    a blob stored in the last window_s seconds. Returns (blob digest, duplicate)
+    where duplicate is None, "exact" or "near"; the caller keeps its file only
+    for (digest, None).
+    """
+    if conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,)).rowcount:
+        return digest, "exact"
+
+    if phash is not None and max_distance > 0:
+        recent = conn.execute(
+            "SELECT hash, phash FROM blobs WHERE phash IS NOT NULL AND refcount > 0 "
+            "AND created_at >= datetime('now', ?) ORDER BY created_at DESC", (_window(window_s),)).fetchall()
+        for other, other_phash in recent:
+            if _hamming(phash, other_phash) <= max_distance:
+                conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (other,))
+                return other, "near"
+
+    conn.execute("INSERT INTO blobs (hash, size, phash, refcount) VALUES (?, ?, ?, 1)", (digest, size, phash))
+    return digest, None
+
+
+def release_image(conn, image_id):
+    """
+    Delete an image row and drop its blob reference. Returns the digest of the
+    blob if that was its last reference; the caller removes the file once the
+    transaction has committed. Raises LookupError for an unknown image.
+    """
+    row = conn.execute("SELECT content_hash FROM images WHERE id = ?", (image_id,)).fetchone()
+    if row is None:
+        raise LookupError(f"Image {image_id} not found")
+    conn.execute("DELETE FROM images WHERE id = ?", (image_id,))
+    digest = row[0]
+    remaining = conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ? RETURNING refcount",
+                             (digest,)).fetchone() if digest else None
+    if remaining is not None and remaining[0] == 0:
+        conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+        return digest
+    return None
+
+
+def release_superseded(conn, event_id, image_id):
+    """
+    Release the images an upload retry replaces: earlier rows of the same event.
+    Returns the digests of the blobs left without references.
+    """
+    superseded = [r[0] for r in conn.execute("SELECT id FROM images WHERE event_id = ? AND id != ?",
+                                             (event_id, image_id))]
+    return [d for d in (release_image(conn, i) for i in superseded) if d]
+
+
+def release_pothole_images(conn, pothole_ids):
+    """Release every image of the given potholes. Returns the digests of the blobs left without references."""
+    ids = [r[0] for r in conn.execute("SELECT id FROM images WHERE pothole_id IN (SELECT value FROM json_each(?))",
+                                      (json.dumps(list(pothole_ids)),))]
+    return [d for d in (release_image(conn, i) for i in ids) if d]
+
+
+def drop_blobs(conn, digests, upload_dir, derived_dir):
+    """
+    Remove the files of released blobs, with their derivatives. Call it on the
+    writer after the release committed: a blob stored again since then has its
+    row back and keeps its file.
+    """
+    for digest in digests:
+        if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None:
+            continue
+        path = os.path.join(upload_dir, blob_name(digest))
+        if os.path.exists(path):
+            os.remove(path)
+        derivatives.remove(derived_dir, digest)
+
+
+async def iter_upload_file(upload):
+    """Chunks of a Starlette UploadFile (multipart part)."""
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _window(seconds):
+    return f"-{int(seconds)} seconds"
+
+
+def _match_by_window(conn, lat, lon, window_s, radius_m):
+    """
+    Pothole seen within the last window_s seconds and nearest within radius_m.
+    Without coordinates nothing ties the image to one car's pothole (the latest
+    pothole may come from any car), so it stays pending for its report to claim.
+    """
+    if lat is None or lon is None:
+        return None
+    # Candidates come from the spatial index, so a burst of recent reports elsewhere costs nothing
+    min_lon, min_lat, max_lon, max_lat = geo.box_around(lat, lon, radius_m)
+    rows = conn.execute(
+        "SELECT p.id, p.latitude, p.longitude FROM potholes_rtree r JOIN potholes p ON p.id = r.id "
+        "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ? "
+        "AND p.last_seen_at >= datetime('now', ?)",
+        (min_lat, max_lat, min_lon, max_lon, _window(window_s))).fetchall()
+    best = None
+    for pothole_id, plat, plon in rows:
+        dist = geo.haversine_m(lat, lon, plat, plon)
+        if dist <= radius_m and (best is None or dist < best[0]):
+            best = (dist, pothole_id)
+    return best[1] if best else None
+
+
+def register_image(conn, url, size, pothole_id=None, event_id=None, lat=None, lon=None,
+                   window_s=120, radius_m=50.0, content_hash=None, thumbnail_url=None, preview_url=None):
+    """
+    Record an uploaded image and attach it to its pothole if one can be identified.
+    Derivative URLs are known up front when an identical image was processed before.
+    Returns (image_id, pothole_id or None, matched_by). Raises LookupError for an
+    explicit pothole id that does not exist.
+    """
+    matched_by = None
+    if pothole_id is not None:
+        if conn.execute("SELECT 1 FROM potholes WHERE id = ?", (pothole_id,)).fetchone() is None:
+            raise LookupError(f"Pothole {pothole_id} not found")
+        matched_by = "pothole_id"
+    elif event_id:
+        row = conn.execute("SELECT pothole_id FROM observations WHERE event_id = ? ORDER BY id DESC LIMIT 1",
+                           (event_id,)).fetchone()
+        if row:
+            pothole_id, matched_by = row[0], "event_id"
+    else:
+        pothole_id = _match_by_window(conn, lat, lon, window_s, radius_m)
+        if pothole_id is not None:
+            matched_by = "window"
+
+    cursor = conn.execute(
+        "INSERT INTO images (pothole_id, event_id, url, size, latitude, longitude, content_hash, "
+        "thumbnail_url, preview_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (pothole_id, event_id, url, size, lat, lon, content_hash, thumbnail_url, preview_url))
+    if pothole_id is not None:
+        conn.execute("UPDATE potholes SET image_url = ?, thumbnail_url = ?, preview_url = ? WHERE id = ?",
+                     (url, thumbnail_url, preview_url, pothole_id))
+    return cursor.lastrowid, pothole_id, matched_by
+
+
+def attach_derivatives(conn, url, thumbnail_url, preview_url):
+    """
+    Record finished derivatives of the image at url, on the image row and on any
+    pothole currently showing it. Returns the ids of the updated potholes.
+    """
+    conn.execute("UPDATE images SET thumbnail_url = ?, preview_url = ? WHERE url = ?",
+                 (thumbnail_url, preview_url, url))
+    ids = [r[0] for r in conn.execute("SELECT id FROM potholes WHERE image_url = ?", (url,))]
+    if ids:
+        conn.execute("UPDATE potholes SET thumbnail_url = ?, preview_url = ? WHERE image_url = ?",
+                     (thumbnail_url, preview_url, url))
+    return ids
+
+
+def claim_pending_images(conn, reports, window_s=120, radius_m=50.0):
+    """
+    Attach images uploaded before their report arrived. reports are (pothole_id,
+    event_id, lat, lon) in arrival order; each claims the pending images with its
+    event id and (among those without one) the ones uploaded within the window
+    near its location. One query per kind of match for the whole batch.
+    Returns the number of images claimed.
+    """
+    event_ids = sorted({event_id for _, event_id, _, _ in reports if event_id})
+    by_event = {}
+    if event_ids:
+        for row in conn.execute("SELECT id, url, thumbnail_url, preview_url, event_id FROM images "
+                                "WHERE pothole_id IS NULL AND event_id IN (SELECT value FROM json_each(?))",
+                                (json.dumps(event_ids),)):
+            by_event.setdefault(row[4], []).append(tuple(row[:4]))
+    nearby = conn.execute(
+        "SELECT id, url, thumbnail_url, preview_url, latitude, longitude FROM images "
+        "WHERE pothole_id IS NULL AND event_id IS NULL "
+        "AND latitude IS NOT NULL AND received_at >= datetime('now', ?)", (_window(window_s),)).fetchall()
+
+    taken, claims, shown = set(), [], {}
+    for pothole_id, event_id, lat, lon in reports:
+        claimed = by_event.get(event_id, []) if event_id else []
+        claimed = [c for c in claimed if c[0] not in taken]
+        claimed += [tuple(r[:4]) for r in nearby
+                    if r[0] not in taken and geo.haversine_m(lat, lon, r[4], r[5]) <= radius_m]
+        if not claimed:
+            continue
+        taken.update(c[0] for c in claimed)
+        claims += [(pothole_id, c[0]) for c in claimed]
+        # The newest image claimed by the pothole's latest report is the one shown
+        shown[pothole_id] = max(claimed)[1:]
+    if claims:
+        conn.executemany("UPDATE images SET pothole_id = ? WHERE id = ?", claims)
+        conn.executemany("UPDATE potholes SET image_url = ?, thumbnail_url = ?, preview_url = ? WHERE id = ?",
+                         [(*urls, pothole_id) for pothole_id, urls in shown.items()])
+    return len(claims)
@@ -0,0 +1,158 @@
+"""
+Write-behind ingest: reports are validated, queued in memory and written by a
+single task that groups them into one transaction per batch.
+
+The queue is bounded by the number of reports it holds; submit() raises
+QueueFull instead of letting memory grow, and the HTTP layer turns that into
+429. Every submission gets a ticket whose outcome (pothole ids or the error) is
+kept for a while so clients that were answered before the commit can look it up.
+close() stops accepting reports and waits until everything queued is written.
+"""
+import asyncio
+import uuid
+from collections import OrderedDict
+
+
+class QueueFull(Exception):
+    pass
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class Job:
+    """One submission: its reports, ticket and (once written) outcomes or error."""
+
+    __slots__ = ("items", "ticket", "outcomes", "error", "_done")
+
+    def __init__(self, items):
+        self.items = items
+        self.ticket = uuid.uuid4().hex
+        self.outcomes = None
+        self.error = None
+        self._done = asyncio.Event()
+
+    async def wait(self):
+        """Outcomes once the batch holding this job has committed; raises RuntimeError if it failed."""
+        await self._done.wait()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.outcomes
+
+
+class WriteBehindQueue:
+    """
+    write(items) is an async callable that stores a list of reports in one
+    transaction and returns one outcome per report, in order. Must be used from
+    the event loop.
+    """
+
+    def __init__(self, write, max_items=10000, max_batch=500, max_delay=0.005, retain_tickets=100000):
+        self.write = write
+        self.max_items = max_items
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retain_tickets = retain_tickets
+        self._queue = asyncio.Queue()
+        self._queued_items = 0
+        self._task = None
+        self._closed = False
+        self._results = OrderedDict()
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def __len__(self):
+        """Reports waiting to be written."""
+        return self._queued_items
+
+    def submit(self, items):
+        if self._closed:
+            raise QueueClosed("Ingest queue is shutting down")
+        if self._queued_items + len(items) > self.max_items:
+            self.rejected += len(items)
+            raise QueueFull(f"Ingest queue full ({self._queued_items} reports pending)")
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        job = Job(items)
+        self._queued_items += len(items)
+        self._remember(job.ticket, {"status": "pending"})
+        self._queue.put_nowait(job)
+        return job
+
+    def status(self, ticket):
+        """{"status": "pending" | "success" | "error", ...} for a recent ticket, else None."""
+        return self._results.get(ticket)
+
+    def _remember(self, ticket, result):
+        self._results[ticket] = result
+        while len(self._results) > self.retain_tickets:
+            self._results.popitem(last=False)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+            batch, count = [job], len(job.items)
+            # Group whatever arrives within max_delay, up to max_batch reports
+            deadline = loop.time() + self.max_delay
+            while count < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        job = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+                count += len(job.items)
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        items = [item for job in batch for item in job.items]
+        try:
+            outcomes = await self.write(items)
+        except Exception as e:
+            if len(batch) > 1:
+                # Isolate the submission that broke the transaction
+                for job in batch:
+                    await self._commit([job])
+                return
+            self._finish(batch[0], error=str(e))
+            return
+        self.batches += 1
+        offset = 0
+        for job in batch:
+            self._finish(job, outcomes=outcomes[offset:offset + len(job.items)])
+            offset += len(job.items)
+
+    def _finish(self, job, outcomes=None, error=None):
+        self._queued_items -= len(job.items)
+        job.outcomes, job.error = outcomes, error
+        if error is None:
+            self.written += len(job.items)
+            self._remember(job.ticket, {"status": "success", "results": outcomes})
+        else:
+            self.failed += len(job.items)
+            print(f"Queued ingest failed ({len(job.items)} reports): {error}")
+            self._remember(job.ticket, {"status": "error", "detail": error})
+        job._done.set()
+
+    async def close(self):
+        """Stop accepting reports and wait until everything queued has been written."""
+        self._closed = True
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
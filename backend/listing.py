@@ -0,0 +1,312 @@
+"""
+Query building for GET /api/potholes.
+
+Listings are ordered newest first and paged with an opaque keyset cursor over
+(detected_at, id), so each page is an index range scan whose cost depends on the
+page size, not on how many potholes are stored. SQL text is generated in a fixed
+clause order, so a given filter combination always produces the same statement
+and hits sqlite3's per-connection prepared statement cache.
+"""
+import base64
+import json
+import math
+from datetime import datetime, timezone
+
+import geo
+
+COLUMNS = (
+    "id", "latitude", "longitude", "depth", "length", "width", "severity_level",
+    "image_url", "thumbnail_url", "preview_url", "status", "detected_at", "repaired_at",
+    "last_seen_at", "observation_count", "growth_rate",
+)
+# Columns the pager needs regardless of the requested projection
+KEY_COLUMNS = ("id", "detected_at")
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# A bbox match read through the R*Tree and sorted (table lookup included) costs
+# about this many newest-first index entries walked (measured at 300k and 5M rows)
+RTREE_MATCH_COST = 20
+# Ids per SELECT ... IN (...), well below SQLite's bound parameter limit
+_CHUNK = 500
+
+
+def parse_fields(value):
+    """'id,latitude,...' -> tuple of columns, or None for all. Raises ValueError."""
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_time(value):
+    """
+    ISO 8601 or unix seconds -> 'YYYY-MM-DD HH:MM:SS' in UTC, the format SQLite's
+    CURRENT_TIMESTAMP writes to detected_at. Raises ValueError.
+    """
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc)
+    else:
+        try:
+            dt = datetime.fromtimestamp(seconds, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            # inf, nan or beyond the platform's time_t / datetime's year range
+            raise ValueError(f"Time out of range: {value}") from None
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def encode_cursor(detected_at, pothole_id):
+    raw = json.dumps([detected_at, pothole_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        detected_at, pothole_id = json.loads(raw)
+        return str(detected_at), int(pothole_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_filters(status=None, severity_level=None, min_depth=None, max_depth=None, since=None, until=None,
+                  is_open=None):
+    """Normalise the listing filters into a dict; absent filters are dropped."""
+    filters = {
+        "open": is_open,
+        "status": status,
+        "severity_level": severity_level,
+        "min_depth": min_depth,
+        "max_depth": max_depth,
+        "since": parse_time(since),
+        "until": parse_time(until),
+    }
+    return {k: v for k, v in filters.items() if v is not None}
+
+
+def _where(filters, bbox=None, spatial=True):
+    """WHERE clauses (always in the same order) and their parameters."""
+    clauses, params = [], []
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if spatial:
+            # The R*Tree stores 32-bit floats rounded outwards, so re-check exact coordinates
+            clauses.append("r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?")
+            params += [min_lat, max_lat, min_lon, max_lon]
+        clauses.append("p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?")
+        params += [min_lat, max_lat, min_lon, max_lon]
+    if "open" in filters:
+        # Literal, not a parameter, so SQLite can use the partial idx_potholes_open_detected_point
+        clauses.append("p.status != 'Green'" if filters["open"] else "p.status = 'Green'")
+    if "status" in filters:
+        clauses.append("p.status = ?")
+        params.append(filters["status"])
+    if "severity_level" in filters:
+        clauses.append("p.severity_level = ?")
+        params.append(filters["severity_level"])
+    if "min_depth" in filters:
+        clauses.append("p.depth >= ?")
+        params.append(filters["min_depth"])
+    if "max_depth" in filters:
+        clauses.append("p.depth <= ?")
+        params.append(filters["max_depth"])
+    if "since" in filters:
+        clauses.append("p.detected_at >= ?")
+        params.append(filters["since"])
+    if "until" in filters:
+        clauses.append("p.detected_at < ?")
+        params.append(filters["until"])
+    return clauses, params
+
+
+def _select(fields, spatial, extra=(), table=None):
+    """
+    (selected columns, 'SELECT ... FROM ...') for a projection. table names an
+    archive partition's copy of potholes, which has no R*Tree.
+    """
+    cols = COLUMNS if fields is None else tuple(dict.fromkeys(KEY_COLUMNS + extra + fields))
+    if table is not None:
+        source = f"{table} p"
+    else:
+        source = "potholes_rtree r JOIN potholes p ON p.id = r.id" if spatial else "potholes p"
+    return cols, f"SELECT {', '.join('p.' + c for c in cols)} FROM {source}"
+
+
+def _project(cols, rows, fields):
+    drop = () if fields is None else [c for c in KEY_COLUMNS if c not in fields]
+    results = []
+    for row in rows:
+        item = dict(zip(cols, row))
+        for c in drop:
+            del item[c]
+        results.append(item)
+    return results
+
+
+def _walk_cheaper(conn, bbox, limit):
+    """
+    Whether a bbox page is cheaper to find by walking the newest-first index than
+    by sorting the box's R*Tree matches. Sorting costs about RTREE_MATCH_COST index
+    steps per match (each is a table lookup); the walk reads about
+    (limit + 1) * rows / matches entries before the page is full. The two cross at
+    sqrt((limit + 1) * rows / RTREE_MATCH_COST) matches, so count that many and
+    no further.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cap = int(math.sqrt((limit + 1) * max_id(conn) / RTREE_MATCH_COST)) + 1
+    matches = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM potholes_rtree "
+        "WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ? LIMIT ?)",
+        (min_lat, max_lat, min_lon, max_lon, cap)).fetchone()[0]
+    return matches >= cap
+
+
+def page_rows(conn, filters, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, bbox=None, table=None):
+    """
+    Up to limit + 1 raw rows of a newest-first page, with their column names.
+
+    A bbox holding few potholes is read through the R*Tree and its matches sorted;
+    one holding many walks the newest-first index, whose entries carry the point,
+    until the page is full. Either way the cost is bounded by the page size and
+    the table size, never by the number of potholes in the box.
+    """
+    spatial = bbox is not None and table is None and not _walk_cheaper(conn, bbox, limit)
+    cols, sql = _select(fields, spatial, table=table)
+    clauses, params = _where(filters, bbox, spatial)
+    if cursor is not None:
+        clauses.append("(p.detected_at, p.id) < (?, ?)")
+        params += list(cursor)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY p.detected_at DESC, p.id DESC LIMIT ?"
+    params.append(limit + 1)
+    return cols, conn.execute(sql, params).fetchall()
+
+
+def finish_page(cols, rows, limit, fields):
+    """(items, next_cursor) from page_rows() output."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[cols.index("detected_at")], last[cols.index("id")])
+    return _project(cols, rows, fields), next_cursor
+
+
+def list_page(conn, filters, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, bbox=None):
+    """
+    One page of potholes, newest first. Returns (items, next_cursor); next_cursor
+    is None on the last page.
+    """
+    cols, rows = page_rows(conn, filters, limit, cursor, fields, bbox)
+    return finish_page(cols, rows, limit, fields)
+
+
+def nearest(conn, lat, lon, k, filters=None, fields=None):
+    """
+    k nearest potholes by great-circle distance. Grows a search box around the point
+    until it holds k candidates and the k-th distance fits inside the box's inscribed
+    circle, so no closer pothole can sit outside it.
+    """
+    filters = filters or {}
+    cols, sql = _select(fields, spatial=True, extra=("latitude", "longitude"))
+    lat_i, lon_i = cols.index("latitude"), cols.index("longitude")
+    radius = 100.0
+    while True:
+        clauses, params = _where(filters, geo.box_around(lat, lon, radius))
+        rows = conn.execute(sql + " WHERE " + " AND ".join(clauses), params).fetchall()
+        scored = sorted(((geo.haversine_m(lat, lon, r[lat_i], r[lon_i]), r) for r in rows), key=lambda x: x[0])
+        if (len(scored) >= k and scored[k - 1][0] <= radius) or radius > geo.EARTH_CIRCUMFERENCE_M:
+            break
+        radius *= 4
+
+    results = []
+    keep = set(COLUMNS if fields is None else fields)
+    for dist, row in scored[:k]:
+        item = {c: v for c, v in zip(cols, row) if c in keep}
+        item["distance_m"] = round(dist, 2)
+        results.append(item)
+    return results
+
+
+def max_id(conn, table="potholes"):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+
+def export_chunk(conn, filters, after_id, last_id, limit, bbox=None, table=None):
+    """
+    Raw rows (tuples in COLUMNS order) with after_id < id <= last_id, ascending by
+    id. Walking the primary key in short queries keeps bulk exports from holding a
+    read transaction (and the WAL) open for the whole download.
+    """
+    spatial = bbox is not None and table is None
+    cols, sql = _select(None, spatial, table=table)
+    clauses, params = _where(filters, bbox, spatial)
+    clauses.append("p.id > ? AND p.id <= ?")
+    params += [after_id, last_id]
+    sql += " WHERE " + " AND ".join(clauses) + " ORDER BY p.id LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def current_seq(conn):
+    """Sequence number of the latest change to the potholes table (0 if none)."""
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM pothole_changes").fetchone()[0]
+
+
+def changes_since(conn, since_seq, limit=DEFAULT_PAGE_SIZE, fields=None):
+    """
+    Potholes inserted, updated or deleted after since_seq, oldest change first.
+    Deleted potholes come back as {"id": ..., "deleted": true} tombstones.
+    Returns (items, cursor, has_more); pass cursor as since_seq on the next call.
+    """
+    cols = COLUMNS if fields is None else tuple(dict.fromkeys(("id",) + fields))
+    sql = (f"SELECT c.seq, c.pothole_id, c.deleted, {', '.join('p.' + c for c in cols)} "
+           "FROM pothole_changes c LEFT JOIN potholes p ON p.id = c.pothole_id "
+           "WHERE c.seq > ? ORDER BY c.seq LIMIT ?")
+    rows = conn.execute(sql, (since_seq, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    keep = set(COLUMNS if fields is None else fields) | {"id"}
+    items = []
+    for row in rows:
+        if row[2] or row[3] is None:
+            items.append({"id": row[1], "deleted": True})
+        else:
+            item = {c: v for c, v in zip(cols, row[3:]) if c in keep}
+            items.append(item)
+    cursor = rows[-1][0] if rows else since_seq
+    return items, cursor, has_more
+
+
+def fetch_by_ids(conn, ids):
+    """Full rows for the given pothole ids, in id order."""
+    ids = sorted(set(ids))
+    rows = []
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        rows += conn.execute(f"SELECT {', '.join(COLUMNS)} FROM potholes WHERE id IN ({','.join('?' * len(chunk))}) "
+                             "ORDER BY id", chunk).fetchall()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+OBSERVATION_COLUMNS = ("id", "latitude", "longitude", "depth", "length", "width", "severity_level",
+                       "reported_at", "observed_at")
+
+
+def observations(conn, pothole_id, limit=DEFAULT_PAGE_SIZE):
+    """Observation history of one pothole, oldest first."""
+    rows = conn.execute(
+        f"SELECT {', '.join(OBSERVATION_COLUMNS)} FROM observations WHERE pothole_id = ? "
+        "ORDER BY observed_at, id LIMIT ?", (pothole_id, limit)).fetchall()
+    return [dict(zip(OBSERVATION_COLUMNS, row)) for row in rows]
@@ -1,13 +1,136 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from datetime import datetime
-import sqlite3
+from starlette.datastructures import UploadFile
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Literal, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 import os
-import uuid
 
-app = FastAPI(title="Smart Pothole Detection API (SQLite Mode)")
+from cache import NearScope, PageScope, ResponseCache
+from db import Database
+from events import EventHub
+import derivatives
+import export
+import geo
+import images
+import ingest
+import listing
+import metrics
+import migrations
+import partitions
+import repairs
+import rollups
+import tiles
+
+DB_FILE = os.environ.get("POTHOLE_DB", "pothole_system.db")
+UPLOAD_DIR = os.environ.get("POTHOLE_UPLOAD_DIR", "uploads")
+DERIVED_DIR = os.environ.get("POTHOLE_DERIVED_DIR", "derived")
+DB_READERS = int(os.environ.get("POTHOLE_DB_READERS", "4"))
+# Repaired potholes older than this move to monthly partition files (0 disables archival)
+ARCHIVE_DIR = os.environ.get("POTHOLE_ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("POTHOLE_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL_S = float(os.environ.get("POTHOLE_ARCHIVE_INTERVAL_S", "3600"))
+ARCHIVE_BATCH = int(os.environ.get("POTHOLE_ARCHIVE_BATCH", "2000"))
+# FULL fsyncs every commit; NORMAL (WAL) survives process crashes but not power loss
+DB_SYNCHRONOUS = os.environ.get("POTHOLE_DB_SYNCHRONOUS", "NORMAL").upper()
+# "direct": every report commits before its response. "queued": write-behind queue
+# with a single batching writer; POTHOLE_INGEST_DURABILITY then picks between
+# answering once queued ("ack", 202 + ticket) or once its batch committed ("commit").
+INGEST_MODE = os.environ.get("POTHOLE_INGEST_MODE", "direct")
+INGEST_DURABILITY = os.environ.get("POTHOLE_INGEST_DURABILITY", "ack")
+INGEST_QUEUE_SIZE = int(os.environ.get("POTHOLE_INGEST_QUEUE", "10000"))
+INGEST_BATCH_SIZE = int(os.environ.get("POTHOLE_INGEST_BATCH", "500"))
+INGEST_BATCH_DELAY_MS = float(os.environ.get("POTHOLE_INGEST_DELAY_MS", "5"))
+MAX_BATCH_SIZE = int(os.environ.get("POTHOLE_MAX_BATCH", "1000"))
+MAX_STATUS_BATCH = int(os.environ.get("POTHOLE_MAX_STATUS_BATCH", "10000"))
+MAX_NEAREST_K = 1000
+STATS_DEFAULT_DAYS = 30
+MAX_UPLOAD_BYTES = int(os.environ.get("POTHOLE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Fallback image correlation: potholes seen this recently (and this close, if coordinates are sent)
+IMAGE_MATCH_WINDOW_S = int(os.environ.get("POTHOLE_IMAGE_WINDOW_S", "120"))
+IMAGE_MATCH_RADIUS_M = float(os.environ.get("POTHOLE_IMAGE_RADIUS_M", "50"))
+# Near-duplicate frames: dHash distance in bits within this many seconds. Off by default:
+# frames of different potholes on the same road can be that close and would share a photo
+PHASH_MAX_DISTANCE = int(os.environ.get("POTHOLE_PHASH_DISTANCE", "0"))
+PHASH_WINDOW_S = int(os.environ.get("POTHOLE_PHASH_WINDOW_S", "60"))
+# Worker processes for thumbnails / previews (0 disables; also disabled without Pillow)
+THUMB_WORKERS = int(os.environ.get("POTHOLE_THUMB_WORKERS", "2"))
+# Reports within this distance of an open pothole are recorded as observations of it (0 disables)
+DEDUP_RADIUS_M = float(os.environ.get("POTHOLE_DEDUP_RADIUS_M", "3.0"))
+STREAM_QUEUE_SIZE = int(os.environ.get("POTHOLE_STREAM_QUEUE", "256"))
+MAX_STREAM_CLIENTS = int(os.environ.get("POTHOLE_MAX_STREAM_CLIENTS", "5000"))
+
+# Shared connection pool (1 writer + DB_READERS readers, WAL mode)
+db = Database(DB_FILE, readers=DB_READERS, synchronous=DB_SYNCHRONOUS)
+
+# Live pothole events for /api/stream subscribers
+hub = EventHub(queue_size=STREAM_QUEUE_SIZE, max_subscribers=MAX_STREAM_CLIENTS)
+
+# Encoded map cluster tiles, patched per written cell
+tile_cache = tiles.TileCache(max_tiles=int(os.environ.get("POTHOLE_TILE_CACHE", "4096")))
+
+# Encoded GET /api/potholes responses, invalidated by the rows each write touches
+response_cache = ResponseCache(max_entries=int(os.environ.get("POTHOLE_RESPONSE_CACHE", "1024")),
+                               max_bytes=int(os.environ.get("POTHOLE_RESPONSE_CACHE_MB", "64")) * 1024 * 1024)
+
+# Thumbnail / preview rendering off the event loop
+thumbnails = derivatives.DerivativePipeline(DERIVED_DIR, workers=THUMB_WORKERS)
+
+# Prometheus metrics (/metrics)
+registry = metrics.Registry()
+http_duration = registry.histogram("pothole_http_request_duration_seconds",
+                                   "HTTP request latency by route template and status",
+                                   ("method", "route", "status"))
+db_duration = registry.histogram("pothole_db_call_duration_seconds",
+                                 "SQLite time per named query function (writes include the commit)",
+                                 ("mode", "query"))
+db.observer = lambda mode, name, seconds: db_duration.observe((mode, name), seconds)
+upload_bytes = registry.counter("pothole_upload_bytes_total", "Image bytes received by upload_image")
+uploads = registry.counter("pothole_uploads_total", "Stored image uploads by duplicate kind", ("duplicate",))
+loop_lag = registry.gauge("pothole_event_loop_lag_last_seconds", "Latest event loop wake-up delay")
+loop_lag_hist = registry.histogram("pothole_event_loop_lag_seconds", "Event loop wake-up delay")
+registry.gauge("pothole_ingest_queue_depth", "Reports waiting in the write-behind queue",
+               lambda: len(ingest_queue) if ingest_queue is not None else 0)
+registry.counter("pothole_ingest_rejected_total", "Reports refused with 429 because the queue was full",
+                 fn=lambda: ingest_queue.rejected if ingest_queue is not None else 0)
+registry.gauge("pothole_thumbnail_jobs", "Thumbnail jobs queued or running", lambda: len(thumbnails))
+registry.gauge("pothole_stream_subscribers", "Connected /api/stream clients", lambda: len(hub))
+registry.counter("pothole_stream_evictions_total", "Stream clients dropped for falling behind",
+                 fn=lambda: hub.evictions)
+registry.counter("pothole_response_cache_hits_total", "Listing responses served from cache",
+                 fn=lambda: response_cache.hits)
+registry.counter("pothole_response_cache_misses_total", "Listing responses built from the database",
+                 fn=lambda: response_cache.misses)
+registry.gauge("pothole_response_cache_bytes", "Bytes held by the listing response cache",
+               lambda: response_cache.stats()["bytes"])
+archived = registry.counter("pothole_archived_total", "Repaired potholes moved to archive partitions")
+registry.counter("pothole_tile_cache_hits_total", "Map tiles served from cache", fn=lambda: tile_cache.hits)
+registry.counter("pothole_tile_cache_misses_total", "Map tiles built from the database", fn=lambda: tile_cache.misses)
+registry.counter("pothole_tile_cache_patches_total", "Cached map tiles patched with re-read cells",
+                 fn=lambda: tile_cache.patches)
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db()
+    lag_monitor = asyncio.create_task(metrics.monitor_loop_lag(loop_lag, loop_lag_hist))
+    archiver = asyncio.create_task(_archive_loop()) if ARCHIVE_AFTER_DAYS > 0 else None
+    yield
+    lag_monitor.cancel()
+    if archiver is not None:
+        archiver.cancel()
+    if ingest_queue is not None:
+        await ingest_queue.close()
+    await thumbnails.close()
+    db.close()
+
+app = FastAPI(title="Smart Pothole Detection API (SQLite Mode)", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -15,113 +138,731 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Outermost, so it also times CORS handling
+app.add_middleware(metrics.MetricsMiddleware, histogram=http_duration)
 
-DB_FILE = "pothole_system.db"
-UPLOAD_DIR = "uploads"
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    """422 like FastAPI's default, without echoing the input: NaN or Infinity would not encode as JSON."""
+    errors = [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in exc.errors()]
+    return JSONResponse(status_code=422, content={"detail": errors})
 
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
-# Initialize Database
+# Initialize Database: versioned migrations (migrations.py), run once at startup
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Create valid table with new schema
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS potholes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        latitude REAL,
-        longitude REAL,
-        depth REAL,
-        length REAL DEFAULT 0,
-        width REAL DEFAULT 0,
-        severity_level TEXT,
-        image_url TEXT,
-        status TEXT DEFAULT 'Red',
-        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        repaired_at TIMESTAMP NULL
-    )
-    """)
-    
-    # Attempt migration for existing databases
-    try:
-        cursor.execute("ALTER TABLE potholes ADD COLUMN length REAL DEFAULT 0")
-    except: pass
-    try:
-        cursor.execute("ALTER TABLE potholes ADD COLUMN width REAL DEFAULT 0")
-    except: pass
-
-    conn.commit()
-    conn.close()
-
-init_db()
+    migrations.migrate(DB_FILE)
 
 class PotholeData(BaseModel):
-    latitude: float
-    longitude: float
+    # NaN or out of range coordinates would make the dedup search span the whole globe
+    latitude: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    longitude: float = Field(ge=-180, le=180, allow_inf_nan=False)
     depth: float
     length: float = 0.0
     width: float = 0.0
     severity: str
     timestamp: float
+    event_id: Optional[str] = None  # ties the report to the ESP32-CAM image of the same detection
+
+class StatusUpdate(BaseModel):
+    status: Literal["Red", "Yellow", "Green"]
+    actor: Optional[str] = None  # crew or user making the change, kept in the audit log
+    note: Optional[str] = None
+
+class BulkStatusUpdate(StatusUpdate):
+    ids: List[int]
+
+INSERT_POTHOLE_SQL = """
+INSERT INTO potholes (latitude, longitude, depth, length, width, severity_level, status, cell, tile, last_seen_at)
+VALUES (?, ?, ?, ?, ?, ?, 'Red', ?, ?, CURRENT_TIMESTAMP)
+"""
+
+INSERT_OBSERVATION_SQL = """
+INSERT INTO observations (pothole_id, latitude, longitude, depth, length, width, severity_level, reported_at, event_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE_OBSERVED_SQL = """
+UPDATE potholes SET
+    severity_level = CASE WHEN ? > depth THEN ? ELSE severity_level END,
+    depth = MAX(depth, ?),
+    length = MAX(length, ?),
+    width = MAX(width, ?),
+    last_seen_at = CURRENT_TIMESTAMP,
+    observation_count = observation_count + 1,
+    growth_rate = COALESCE(?, growth_rate)
+WHERE id = ?
+"""
+
+def _pothole_params(data):
+    return (data.latitude, data.longitude, data.depth, data.length, data.width, data.severity,
+            geo.cell_key(data.latitude, data.longitude), tiles.tile_key(data.latitude, data.longitude))
+
+def _observation_params(pothole_id, data):
+    return (pothole_id, data.latitude, data.longitude, data.depth, data.length, data.width,
+            data.severity, data.timestamp, data.event_id)
+
+def _insert_potholes(conn, items):
+    """Insert many reports as new potholes in the caller's transaction; returns their ids in order."""
+    if not items:
+        return []
+    conn.executemany(INSERT_POTHOLE_SQL, [_pothole_params(d) for d in items])
+    # Writes are serialised by the single writer connection and potholes.id is
+    # AUTOINCREMENT, so the ids of one executemany() are contiguous.
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    ids = list(range(last_id - len(items) + 1, last_id + 1))
+    conn.executemany(INSERT_OBSERVATION_SQL, [_observation_params(i, d) for i, d in zip(ids, items)])
+    return ids
+
+# One R*Tree search per report box; CROSS JOIN keeps the boxes as the outer loop
+DUPLICATE_CANDIDATES_SQL = """
+SELECT q.key, p.id, p.latitude, p.longitude
+FROM json_each(?) q CROSS JOIN potholes_rtree r CROSS JOIN potholes p
+WHERE r.max_lat >= json_extract(q.value, '$[1]') AND r.min_lat <= json_extract(q.value, '$[3]')
+  AND r.max_lon >= json_extract(q.value, '$[0]') AND r.min_lon <= json_extract(q.value, '$[2]')
+  AND p.id = r.id AND p.status != 'Green'
+"""
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row # Allows dictionary-like access
-    return conn
+FIRST_OBSERVATION_SQL = """
+SELECT q.value, o.depth, julianday('now') - julianday(o.observed_at)
+FROM json_each(?) q JOIN observations o ON o.id = (
+    SELECT id FROM observations WHERE pothole_id = q.value ORDER BY observed_at, id LIMIT 1)
+"""
+
+def _find_duplicates(conn, items):
+    """Nearest open pothole within DEDUP_RADIUS_M of each report (or None), from a single query."""
+    boxes = json.dumps([geo.box_around(d.latitude, d.longitude, DEDUP_RADIUS_M) for d in items])
+    best = [None] * len(items)
+    for i, pothole_id, lat, lon in conn.execute(DUPLICATE_CANDIDATES_SQL, (boxes,)):
+        data = items[i]
+        dist = geo.haversine_m(data.latitude, data.longitude, lat, lon)
+        if dist <= DEDUP_RADIUS_M and (best[i] is None or dist < best[i][0]):
+            best[i] = (dist, pothole_id)
+    return [b[1] if b else None for b in best]
+
+def _growth_rate(first, depth):
+    """Depth growth in cm/day since the first observation (depth, age in days), or None if too early to tell."""
+    if first is None or first[0] is None or first[1] < 1.0 / 24:
+        return None
+    return round((depth - first[0]) / first[1], 4)
+
+def _record_observations(conn, matches):
+    """
+    Add matched reports, [(pothole_id, data), ...] in report order, to their potholes'
+    history and fold them into the canonical rows, with one executemany() each.
+    """
+    if not matches:
+        return
+    ids = json.dumps(sorted({pothole_id for pothole_id, _ in matches}))
+    depths = dict(conn.execute("SELECT id, depth FROM potholes WHERE id IN (SELECT value FROM json_each(?))", (ids,)))
+    first = {pothole_id: (depth, age) for pothole_id, depth, age in conn.execute(FIRST_OBSERVATION_SQL, (ids,))}
+    conn.executemany(INSERT_OBSERVATION_SQL, [_observation_params(i, d) for i, d in matches])
+    updates = []
+    for pothole_id, data in matches:
+        # Later reports of the same pothole in the batch see the depth the earlier ones left
+        depths[pothole_id] = max_depth = max(data.depth, depths.get(pothole_id) or 0)
+        updates.append((data.depth, data.severity, data.depth, data.length, data.width,
+                        _growth_rate(first.get(pothole_id), max_depth), pothole_id))
+    conn.executemany(UPDATE_OBSERVED_SQL, updates)
+
+def _ingest_reports(conn, items):
+    """
+    Ingest reports in the caller's transaction. Each report either becomes a new pothole
+    or an observation of an open one within DEDUP_RADIUS_M (including one created
+    earlier in the same batch). Candidates come from one R*Tree query for the whole
+    batch, and new potholes and observations are each written with one executemany().
+
+    Returns ([(id, matched), ...], rows) where rows are the touched potholes as committed.
+    """
+    if DEDUP_RADIUS_M <= 0:
+        outcomes = [(i, False) for i in _insert_potholes(conn, items)]
+    else:
+        new, matches = [], []          # indices of new potholes / (index, db id or None, new slot)
+        batch_cells = {}               # grid cell -> slots in `new`
+        for i, (data, pothole_id) in enumerate(zip(items, _find_duplicates(conn, items))):
+            if pothole_id is not None:
+                matches.append((i, pothole_id, None))
+                continue
+            slot = None
+            cells = geo.cells_within(data.latitude, data.longitude, DEDUP_RADIUS_M)
+            # Too many cells to look up (near a pole): compare with every new pothole of the batch
+            candidates = range(len(new)) if cells is None else (c for cell in cells for c in batch_cells.get(cell, ()))
+            for candidate in candidates:
+                other = items[new[candidate]]
+                if geo.haversine_m(data.latitude, data.longitude, other.latitude, other.longitude) <= DEDUP_RADIUS_M:
+                    slot = candidate
+                    break
+            if slot is not None:
+                matches.append((i, None, slot))
+            else:
+                batch_cells.setdefault(geo.cell_key(data.latitude, data.longitude), []).append(len(new))
+                new.append(i)
+
+        outcomes = [None] * len(items)
+        new_ids = _insert_potholes(conn, [items[i] for i in new])
+        for i, pothole_id in zip(new, new_ids):
+            outcomes[i] = (pothole_id, False)
+        observed = []
+        for i, pothole_id, slot in matches:
+            pothole_id = pothole_id if pothole_id is not None else new_ids[slot]
+            observed.append((pothole_id, items[i]))
+            outcomes[i] = (pothole_id, True)
+        _record_observations(conn, observed)
+
+    images.claim_pending_images(conn, [(pothole_id, data.event_id, data.latitude, data.longitude)
+                                       for (pothole_id, _), data in zip(outcomes, items)],
+                                IMAGE_MATCH_WINDOW_S, IMAGE_MATCH_RADIUS_M)
+
+    rows = listing.fetch_by_ids(conn, sorted({i for i, _ in outcomes}))
+    return outcomes, rows
+
+def _publish_changes(op, rows):
+    """Fan out committed pothole rows to derived state: stream clients, map tiles and cached listings."""
+    for row in rows:
+        tile_cache.mark_point(row["latitude"], row["longitude"])
+    response_cache.invalidate(op, rows)
+    hub.publish_potholes(op, rows)
+
+async def _archive_repaired():
+    """Move every repaired pothole past the cutoff to its partition, one batch per write."""
+    total = 0
+    while True:
+        rows, released = await db.write(partitions.archive_batch, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH)
+        if not rows:
+            return total
+        await db.write(images.drop_blobs, released, UPLOAD_DIR, DERIVED_DIR)
+        _publish_changes("delete", rows)
+        archived.inc(amount=len(rows))
+        total += len(rows)
+
+async def _archive_loop():
+    while True:
+        try:
+            moved = await _archive_repaired()
+            if moved:
+                print(f"Archived {moved} repaired potholes to {ARCHIVE_DIR}/")
+        except Exception as e:
+            print(f"Error archiving potholes: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_S)
+
+def _publish_ingest(outcomes, rows):
+    matched = {i for i, m in outcomes if m}
+    _publish_changes("insert", [r for r in rows if r["id"] not in matched])
+    _publish_changes("update", [r for r in rows if r["id"] in matched])
+
+async def _write_reports(items):
+    outcomes, rows = await db.write(_ingest_reports, items)
+    _publish_ingest(outcomes, rows)
+    return [{"id": pothole_id, "matched": matched} for pothole_id, matched in outcomes]
+
+# Write-behind ingest (POTHOLE_INGEST_MODE=queued), flushed on shutdown
+ingest_queue = None
+if INGEST_MODE == "queued":
+    ingest_queue = ingest.WriteBehindQueue(_write_reports, max_items=INGEST_QUEUE_SIZE,
+                                           max_batch=INGEST_BATCH_SIZE, max_delay=INGEST_BATCH_DELAY_MS / 1000)
+
+def _register_image(conn, size, digest, phash, pothole_id, event_id, lat, lon):
+    blob, duplicate = images.acquire_blob(conn, digest, size, phash, PHASH_MAX_DISTANCE, PHASH_WINDOW_S)
+    url = f"/uploads/{images.blob_name(blob)}"
+    # Identical bytes seen before: reuse the derivatives already on disk
+    cached = derivatives.existing(DERIVED_DIR, blob)
+    derived = _derived_urls(cached)
+    image_id, pothole_id, matched_by = images.register_image(
+        conn, url, size, pothole_id, event_id, lat, lon, IMAGE_MATCH_WINDOW_S, IMAGE_MATCH_RADIUS_M,
+        blob, derived.get("thumb"), derived.get("preview"))
+    # A retried capture of the same event replaces the earlier upload
+    released = images.release_superseded(conn, event_id, image_id) if event_id else []
+    rows = listing.fetch_by_ids(conn, [pothole_id]) if pothole_id is not None else []
+    return {"image_id": image_id, "pothole_id": pothole_id, "matched_by": matched_by, "url": url,
+            "blob": blob, "duplicate": duplicate, "cached": cached is not None, "derived": derived, "rows": rows,
+            "released": released}
+
+def _derived_urls(names):
+    return {variant: f"/derived/{name}" for variant, name in (names or {}).items()}
+
+def _attach_derivatives(conn, url, derived):
+    ids = images.attach_derivatives(conn, url, derived.get("thumb"), derived.get("preview"))
+    return listing.fetch_by_ids(conn, ids) if ids else []
+
+def _on_derivatives(url):
+    async def done(names):
+        rows = await db.write(_attach_derivatives, url, _derived_urls(names))
+        _publish_changes("update", rows)
+    return done
+
+async def _enqueue(items):
+    """Queue reports for the batching writer. Returns the job, or its outcomes in "commit" durability."""
+    try:
+        job = ingest_queue.submit(items)
+    except ingest.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ingest.QueueClosed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if INGEST_DURABILITY != "commit":
+        return job, None
+    try:
+        return job, await job.wait()
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/potholes")
 async def report_pothole(data: PotholeData):
+    if ingest_queue is not None:
+        job, outcomes = await _enqueue([data])
+        if outcomes is None:
+            return JSONResponse(status_code=202, content={"status": "queued", "ticket": job.ticket})
+        return {"status": "success", **outcomes[0]}
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        query = """
-        INSERT INTO potholes (latitude, longitude, depth, length, width, severity_level, status)
-        VALUES (?, ?, ?, ?, ?, ?, 'Red')
-        """
-        cursor.execute(query, (data.latitude, data.longitude, data.depth, data.length, data.width, data.severity))
-        conn.commit()
-        pothole_id = cursor.lastrowid
-        conn.close()
-        return {"status": "success", "id": pothole_id}
+        outcomes = await _write_reports([data])
+        return {"status": "success", **outcomes[0]}
     except Exception as e:
         print(f"Error saving pothole: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/potholes/batch")
+async def report_potholes_batch(items: List[Any] = Body(...)):
+    """
+    Bulk ingest for vehicles flushing a backlog of detections (e.g. after a GSM dead zone).
+    Valid items are written in one transaction; invalid ones are reported per index.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} items)")
+
+    valid, valid_index, results = [], [], [None] * len(items)
+    for i, item in enumerate(items):
+        try:
+            valid.append(PotholeData.model_validate(item))
+            valid_index.append(i)
+        except ValidationError as e:
+            errors = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+            results[i] = {"index": i, "status": "error", "errors": errors}
+
+    if ingest_queue is not None and valid:
+        job, outcomes = await _enqueue(valid)
+        if outcomes is None:
+            for i in valid_index:
+                results[i] = {"index": i, "status": "queued"}
+            return JSONResponse(status_code=202, content={
+                "status": "queued" if len(valid) == len(items) else "partial",
+                "ticket": job.ticket,
+                "queued": len(valid),
+                "failed": len(items) - len(valid),
+                "results": results,
+            })
+    else:
+        try:
+            outcomes = await _write_reports(valid)
+        except Exception as e:
+            print(f"Error saving pothole batch: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    for i, outcome in zip(valid_index, outcomes):
+        results[i] = {"index": i, "status": "success", **outcome}
+
+    return {
+        "status": "success" if len(outcomes) == len(items) else "partial",
+        "inserted": len(outcomes),
+        "failed": len(items) - len(outcomes),
+        "results": results,
+    }
+
+def _change_status(conn, ids, update):
+    changed = repairs.change_status(conn, ids, update.status, update.actor, update.note)
+    return changed, listing.fetch_by_ids(conn, changed)
+
+async def _apply_status(ids, update):
+    """Run a status change and publish the updated rows; returns them."""
+    try:
+        changed, rows = await db.write(_change_status, ids, update)
+    except repairs.InvalidTransition as e:
+        status_code = 404 if all(err["error"] == "not found" for err in e.errors) else 409
+        raise HTTPException(status_code=status_code, detail={"message": str(e), "errors": e.errors})
+    _publish_changes("update", rows)
+    return changed, rows
+
+@app.patch("/api/potholes/{pothole_id}")
+async def update_pothole(pothole_id: int, update: StatusUpdate):
+    """
+    Move one pothole through the repair workflow (Red -> Yellow -> Green, or back to
+    Red if it reopens). Returns the updated pothole.
+    """
+    _, rows = await _apply_status([pothole_id], update)
+    if not rows:  # already had that status
+        rows = await db.read(listing.fetch_by_ids, [pothole_id])
+    return rows[0]
+
+@app.post("/api/potholes/status")
+async def update_potholes_status(update: BulkStatusUpdate):
+    """
+    Bulk status change for repair crews: every id moves in one transaction, or none
+    does (the response then lists the ids that failed and why).
+    """
+    if len(update.ids) > MAX_STATUS_BATCH:
+        raise HTTPException(status_code=413, detail=f"Too many ids (max {MAX_STATUS_BATCH})")
+    changed, _ = await _apply_status(update.ids, update)
+    return {"status": "success", "changed": len(changed), "unchanged": len(set(update.ids)) - len(changed),
+            "ids": changed}
+
+@app.get("/api/ingest/{ticket}")
+async def get_ingest_ticket(ticket: str):
+    """Outcome of a queued submission: pending, success (with ids, in submission order) or error."""
+    result = ingest_queue.status(ticket) if ingest_queue is not None else None
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired ticket")
+    return {"ticket": ticket, **result}
+
 @app.post("/api/upload_image")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(
+    request: Request,
+    pothole_id: Optional[int] = Query(None, description="Attach to this pothole"),
+    event_id: Optional[str] = Query(None, description="Detection event id shared with the report"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+):
+    """
+    Accepts either a raw image/jpeg body (what esp32cam.ino POSTs) or a multipart
+    form with a `file` part. The body is streamed to disk in chunks and capped at
+    MAX_UPLOAD_BYTES. pothole_id / event_id may also be sent as X-Pothole-Id /
+    X-Event-Id headers.
+    """
+    if pothole_id is None and request.headers.get("x-pothole-id"):
+        try:
+            pothole_id = int(request.headers["x-pothole-id"])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Pothole-Id")
+    event_id = event_id or request.headers.get("x-event-id") or None
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        form = await request.form(max_files=1)
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=400, detail="Missing 'file' part")
+        chunks = images.iter_upload_file(upload)
+    elif content_type in ("image/jpeg", "application/octet-stream", ""):
+        declared = request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+        chunks = request.stream()
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+
+    try:
+        temp_path, size, digest = await images.store_stream(chunks, UPLOAD_DIR, MAX_UPLOAD_BYTES)
+    except images.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    phash = None
+    if PHASH_MAX_DISTANCE > 0:
+        try:
+            phash = await asyncio.to_thread(images.dhash, temp_path)
+        except Exception as e:
+            print(f"dHash failed for upload {digest}: {e}")
+
     try:
-        file_name = f"{uuid.uuid4()}.jpg"
-        file_path = os.path.join(UPLOAD_DIR, file_name)
-        
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Correlate with last pothole
-        cursor.execute("UPDATE potholes SET image_url = ? WHERE id = (SELECT MAX(id) FROM potholes)", (f"/uploads/{file_name}",))
-        conn.commit()
-        conn.close()
-        
-        return {"status": "success", "url": f"/uploads/{file_name}"}
+        result = await db.write(_register_image, size, digest, phash, pothole_id, event_id, lat, lon)
+    except LookupError as e:
+        os.remove(temp_path)
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
+        os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
+    # Only a new blob keeps its file; duplicates just hold a reference to the stored one
+    path = images.finalize(temp_path, UPLOAD_DIR, result["blob"], keep=result["blob"] == digest)
+    if result["released"]:
+        await db.write(images.drop_blobs, result["released"], UPLOAD_DIR, DERIVED_DIR)
+    upload_bytes.inc(amount=size)
+    uploads.inc((result["duplicate"] or "none",))
+    _publish_changes("update", result["rows"])
+    if not result["cached"]:
+        thumbnails.submit(path, result["blob"], _on_derivatives(result["url"]))
+
+    return {"status": "success", "url": result["url"], "image_id": result["image_id"],
+            "pothole_id": result["pothole_id"], "matched_by": result["matched_by"],
+            "duplicate": result["duplicate"],
+            "thumbnail_url": result["derived"].get("thumb"), "preview_url": result["derived"].get("preview")}
+
+@app.get("/derived/{name}")
+async def get_derived_image(name: str, request: Request):
+    """
+    Thumbnails and previews. Names contain the SHA-256 of the original image, so
+    the bytes behind a URL never change and clients may cache them for good.
+    """
+    match = derivatives.NAME_RE.match(name)
+    if not match:
+        raise HTTPException(status_code=404, detail="Not found")
+    path = derivatives.derived_path(DERIVED_DIR, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    digest, variant, ext = match.groups()
+    headers = {"ETag": f'"{digest[:32]}-{variant}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=derivatives.MEDIA_TYPES[ext], headers=headers)
+
+def _etag(seq, request):
+    """
+    Strong validator for read endpoints. Every change to potholes bumps the change
+    sequence, so (sequence, URL query) fully determines the response body.
+    """
+    key = f"{seq}|{request.url.path}|{request.url.query}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+def _not_modified(request, etag):
+    client = request.headers.get("if-none-match")
+    return client is not None and etag in [t.strip() for t in client.split(",")]
+
+@app.get("/api/potholes/changes")
+async def get_pothole_changes(
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0, description="cursor from the previous response; 0 for a full sync"),
+    limit: int = Query(listing.DEFAULT_PAGE_SIZE, ge=1, le=listing.MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Comma separated column projection"),
+):
+    """
+    Delta feed for polling clients: every pothole inserted, updated (status changes,
+    repairs) or deleted after `since`. Idle polls with If-None-Match get a 304; a
+    cursor past the end of the feed (the database was replaced) gets a 410, and the
+    client should reload everything.
+    """
+    try:
+        projection = listing.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    seq = await db.read(listing.current_seq)
+    if since > seq:
+        raise HTTPException(status_code=410, detail="Cursor is ahead of the change feed; reload")
+    etag = _etag(seq, request)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    items, cursor, has_more = await db.read(listing.changes_since, since, limit, projection)
+    response.headers["ETag"] = etag
+    return {"cursor": cursor, "has_more": has_more, "changes": items}
 
 @app.get("/api/potholes")
-async def get_potholes():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM potholes ORDER BY detected_at DESC")
-    rows = cursor.fetchall()
-    results = [dict(row) for row in rows]
-    conn.close()
-    return results
+async def get_potholes(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    near: Optional[str] = Query(None, description="lat,lon"),
+    k: int = Query(10, ge=1, le=MAX_NEAREST_K),
+    limit: int = Query(listing.DEFAULT_PAGE_SIZE, ge=1, le=listing.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    status: Optional[str] = None,
+    severity_level: Optional[str] = None,
+    min_depth: Optional[float] = None,
+    max_depth: Optional[float] = None,
+    since: Optional[str] = Query(None, description="ISO 8601 or unix seconds (inclusive)"),
+    until: Optional[str] = Query(None, description="ISO 8601 or unix seconds (exclusive)"),
+    is_open: Optional[bool] = Query(None, alias="open", description="true: Red or Yellow only; false: repaired only"),
+    archive: bool = Query(False, description="also search archived (long repaired) potholes"),
+    fields: Optional[str] = Query(None, description="Comma separated column projection"),
+):
+    """
+    Newest-first pothole listing. The body stays a plain JSON array; when more rows
+    are available the cursor for the next page is returned in X-Next-Cursor.
+    """
+    if bbox and near:
+        raise HTTPException(status_code=400, detail="Use either bbox or near, not both")
+    if archive and near:
+        raise HTTPException(status_code=400, detail="near does not search the archive")
+    try:
+        filters = listing.build_filters(status, severity_level, min_depth, max_depth, since, until, is_open)
+        projection = listing.parse_fields(fields)
+        point = geo.parse_point(near) if near else None
+        area = geo.parse_bbox(bbox) if bbox else None
+        after = listing.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filter_key = tuple(sorted(filters.items()))
+    if point:
+        key = ("near", point, k, filter_key, projection)
+    else:
+        key = ("page", area, limit, after, filter_key, projection, archive)
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation
+        if point:
+            items = await db.read(listing.nearest, point[0], point[1], k, filters, projection)
+            radius = items[-1]["distance_m"] + 0.01 if len(items) >= k else None
+            entry = response_cache.put(key, items, NearScope(point[0], point[1], filters, radius), generation)
+        else:
+            if archive:
+                items, next_cursor = await db.read(partitions.list_page, ARCHIVE_DIR, filters, limit, after,
+                                                   projection, area)
+            else:
+                items, next_cursor = await db.read(listing.list_page, filters, limit, after, projection, area)
+            lower = listing.decode_cursor(next_cursor) if next_cursor else None
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+            entry = response_cache.put(key, items, PageScope(filters, area, after, lower), generation, headers)
+
+    body, etag, headers, _ = entry
+    headers = {"ETag": etag, **headers}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/export")
+async def export_potholes(
+    fmt: str = Query("geojson", alias="format", description="geojson | csv | parquet"),
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    status: Optional[str] = None,
+    severity_level: Optional[str] = None,
+    min_depth: Optional[float] = None,
+    max_depth: Optional[float] = None,
+    since: Optional[str] = Query(None, description="ISO 8601 or unix seconds (inclusive)"),
+    until: Optional[str] = Query(None, description="ISO 8601 or unix seconds (exclusive)"),
+    is_open: Optional[bool] = Query(None, alias="open", description="true: Red or Yellow only; false: repaired only"),
+    archive: bool = Query(False, description="also include archived (long repaired) potholes"),
+):
+    """
+    The whole (filtered) dataset as one streamed download, in id order. Rows added
+    while the export runs are not included. With archive the archived potholes
+    follow, one month partition after another.
+    """
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {fmt!r} (use {', '.join(export.FORMATS)})")
+    if fmt == "parquet" and not export.HAVE_PYARROW:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+    try:
+        filters = listing.build_filters(status, severity_level, min_depth, max_depth, since, until, is_open)
+        area = geo.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    last_id = await db.read(listing.max_id)
+    months = partitions.window_months(ARCHIVE_DIR, filters) if archive else []
+    enc = export.encoder(fmt)
+
+    async def body():
+        yield enc.begin()
+        after = 0
+        while True:
+            chunk, after = await db.read(export.encode_chunk, enc, filters, after, last_id, area)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+        for month in reversed(months):
+            month_last = await db.read(partitions.on_partition, ARCHIVE_DIR, month, listing.max_id)
+            after = 0
+            while True:
+                chunk, after = await db.read(partitions.on_partition, ARCHIVE_DIR, month, export.encode_chunk,
+                                             enc, filters, after, month_last, area)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        yield enc.end()
+
+    media_type, ext = export.FORMATS[fmt]
+    file_name = f"potholes-{datetime.utcnow():%Y%m%d}.{ext}"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
+@app.get("/api/stats")
+async def get_stats(
+    since: Optional[str] = Query(None, description="first day of by_day, ISO 8601 or unix seconds (default 30 days ago)"),
+    until: Optional[str] = Query(None, description="end of by_day, exclusive (default tomorrow)"),
+    areas: int = Query(20, ge=0, le=1000, description="how many of the busiest area cells to return"),
+):
+    """
+    Pothole counts with average and max depth: overall, per status, per severity,
+    per day of detection and per ~1 km area cell. Served from rollup tables kept
+    current by every write, so the cost does not grow with the table.
+    """
+    try:
+        since_day = (listing.parse_time(since) or "")[:10]
+        until_day = (listing.parse_time(until) or "")[:10]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    today = datetime.utcnow().date()
+    since_day = since_day or (today - timedelta(days=STATS_DEFAULT_DAYS - 1)).isoformat()
+    until_day = until_day or (today + timedelta(days=1)).isoformat()
+    return await db.read(rollups.read_stats, since_day, until_day, areas)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition format."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters of the in-process caches, for sizing them."""
+    return {
+        "responses": response_cache.stats(),
+        "tiles": tile_cache.stats(),
+    }
+
+@app.get("/api/potholes/{pothole_id}/observations")
+async def get_pothole_observations(pothole_id: int,
+                                   limit: int = Query(listing.DEFAULT_PAGE_SIZE, ge=1, le=listing.MAX_PAGE_SIZE)):
+    """Every report matched to this pothole, oldest first (depth over time)."""
+    return await db.read(listing.observations, pothole_id, limit)
+
+@app.get("/api/potholes/{pothole_id}/history")
+async def get_pothole_history(pothole_id: int):
+    """Audit trail of status changes for this pothole, oldest first."""
+    return await db.read(repairs.history, pothole_id)
+
+@app.get("/api/stream")
+async def stream_potholes(bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat")):
+    """
+    Server-Sent Events feed of pothole inserts/updates as they are committed.
+    The first event, `ready`, carries the change seq the stream starts from: every
+    later change reaches the client either here or in /api/potholes/changes after
+    that seq. Clients that fall behind are evicted (an `evicted` event, then EOF);
+    they reconnect and replay the changes since the last seq they saw.
+    """
+    try:
+        area = geo.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sub = hub.subscribe(area)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Too many stream clients")
+    # Read after subscribing, so a change is never both after seq and missing from the queue
+    try:
+        seq = await db.read(listing.current_seq)
+    except Exception:
+        hub.unsubscribe(sub)
+        raise
+    return StreamingResponse(
+        hub.stream(sub, ready={"seq": seq}),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/tiles/{z}/{x}/{y}")
+async def get_tile(z: int, x: int, y: int, request: Request):
+    """Pre-aggregated pothole clusters for one slippy-map tile (JSON)."""
+    if not (0 <= z <= tiles.MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    key = (z, x, y)
+    entry = tile_cache.get(key)
+    if entry is not None and entry[2]:
+        # Cells written since the tile was cached: re-read just those
+        dirty = entry[2]
+        entry = tile_cache.patch(key, await db.read(tiles.read_cells, z, list(dirty)), dirty)
+    if entry is None:
+        generation = tile_cache.generation
+        entry = tile_cache.put(key, await db.read(tiles.build_tile, z, x, y), generation)
+    body, etag = entry[:2]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # Serve the uploaded images
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Serve the Dashboard
 if os.path.exists("../dashboard"):
@@ -0,0 +1,332 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+MIGRATIONS is an ordered list of (version, description, function). migrate()
+applies the ones newer than the version recorded in `schema_version`, each in
+its own BEGIN IMMEDIATE transaction together with its schema_version row: a
+failed step leaves the database at the previous version, and a second process
+starting at the same time waits for the lock and then finds nothing left to do.
+main.py runs migrate() once from the app lifespan; `python migrations.py [db]`
+does the same from the command line.
+
+Version 1 is the schema as it stood before versioning. Databases created by
+earlier releases have no schema_version table; version 1 only creates and adds
+what is missing, so they upgrade in place like new files.
+
+Migrations must not use executescript(), which commits the open transaction;
+_script() runs multi-statement SQL inside it instead.
+"""
+import os
+import sqlite3
+import sys
+
+import geo
+import rollups
+import tiles
+
+
+def _script(conn, sql):
+    """Run each complete statement of sql (trigger bodies included) in the current transaction."""
+    statement = ""
+    for part in sql.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                conn.execute(statement)
+            statement = ""
+
+
+def _add_columns(conn, table, columns):
+    """ALTER TABLE ... ADD COLUMN for each 'name TYPE ...' definition the table lacks."""
+    have = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column in columns:
+        if column.split()[0] not in have:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+
+def _baseline(conn):
+    _script(conn, """
+    CREATE TABLE IF NOT EXISTS potholes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        latitude REAL,
+        longitude REAL,
+        depth REAL,
+        length REAL DEFAULT 0,
+        width REAL DEFAULT 0,
+        severity_level TEXT,
+        image_url TEXT,
+        status TEXT DEFAULT 'Red',
+        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        repaired_at TIMESTAMP NULL
+    );
+    """)
+    _add_columns(conn, "potholes", ("length REAL DEFAULT 0", "width REAL DEFAULT 0", "cell INTEGER",
+                                    "last_seen_at TIMESTAMP", "observation_count INTEGER DEFAULT 1",
+                                    "growth_rate REAL DEFAULT 0", "thumbnail_url TEXT", "preview_url TEXT"))
+
+    # Repeat detections of the same hole: matched through the grid cell index and
+    # recorded as observations of the canonical pothole row.
+    _script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_potholes_cell ON potholes(cell);
+    CREATE TABLE IF NOT EXISTS observations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pothole_id INTEGER NOT NULL REFERENCES potholes(id),
+        latitude REAL,
+        longitude REAL,
+        depth REAL,
+        length REAL DEFAULT 0,
+        width REAL DEFAULT 0,
+        severity_level TEXT,
+        reported_at REAL,
+        observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_observations_pothole ON observations(pothole_id, observed_at);
+    """)
+    _add_columns(conn, "observations", ("event_id TEXT",))
+
+    # Uploaded images; pothole_id stays NULL until a report claims the image
+    _script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_observations_event ON observations(event_id) WHERE event_id IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_potholes_last_seen ON potholes(last_seen_at);
+    CREATE TABLE IF NOT EXISTS images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pothole_id INTEGER REFERENCES potholes(id),
+        event_id TEXT,
+        url TEXT NOT NULL,
+        size INTEGER,
+        latitude REAL,
+        longitude REAL,
+        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_images_pothole ON images(pothole_id);
+    CREATE INDEX IF NOT EXISTS idx_images_pending ON images(received_at) WHERE pothole_id IS NULL;
+    """)
+    _add_columns(conn, "images", ("content_hash TEXT", "thumbnail_url TEXT", "preview_url TEXT"))
+    # Content-addressed image files (uploads/ab/cd/<sha256>.jpg), one row per stored file
+    _script(conn, """
+    CREATE INDEX IF NOT EXISTS idx_images_url ON images(url);
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        size INTEGER,
+        phash INTEGER,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_blobs_created ON blobs(created_at) WHERE phash IS NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_potholes_image_url ON potholes(image_url) WHERE image_url IS NOT NULL;
+    """)
+    conn.execute("UPDATE potholes SET cell = pothole_cell(latitude, longitude) WHERE cell IS NULL")
+    conn.execute("UPDATE potholes SET last_seen_at = detected_at WHERE last_seen_at IS NULL")
+    conn.execute("""
+    INSERT INTO observations (pothole_id, latitude, longitude, depth, length, width, severity_level, observed_at)
+    SELECT id, latitude, longitude, depth, length, width, severity_level, detected_at FROM potholes
+    WHERE id NOT IN (SELECT pothole_id FROM observations)
+    """)
+
+    # Spatial index: R*Tree over point "boxes", kept in sync by triggers so
+    # bbox / nearest queries never scan the potholes table.
+    _script(conn, """
+    CREATE VIRTUAL TABLE IF NOT EXISTS potholes_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
+    );
+    CREATE TRIGGER IF NOT EXISTS potholes_rtree_ai AFTER INSERT ON potholes BEGIN
+        INSERT INTO potholes_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END;
+    CREATE TRIGGER IF NOT EXISTS potholes_rtree_au AFTER UPDATE OF latitude, longitude ON potholes BEGIN
+        UPDATE potholes_rtree SET min_lat = new.latitude, max_lat = new.latitude,
+            min_lon = new.longitude, max_lon = new.longitude WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS potholes_rtree_ad AFTER DELETE ON potholes BEGIN
+        DELETE FROM potholes_rtree WHERE id = old.id;
+    END;
+    """)
+    # Keyset pagination index for the newest-first listing
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_potholes_detected_at ON potholes(detected_at, id)")
+
+    # Backfill databases created before the index existed
+    conn.execute("""
+    INSERT INTO potholes_rtree
+    SELECT id, latitude, latitude, longitude, longitude FROM potholes
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+      AND id NOT IN (SELECT id FROM potholes_rtree)
+    """)
+
+    # Change log for the delta feed: one row per pothole holding the sequence
+    # number of its latest insert/update/delete. Deleted rows stay as tombstones.
+    _script(conn, """
+    CREATE TABLE IF NOT EXISTS pothole_changes (
+        pothole_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_pothole_changes_seq ON pothole_changes(seq);
+    CREATE TRIGGER IF NOT EXISTS pothole_changes_ai AFTER INSERT ON potholes BEGIN
+        INSERT OR REPLACE INTO pothole_changes (pothole_id, seq, deleted)
+        VALUES (new.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM pothole_changes), 0);
+    END;
+    CREATE TRIGGER IF NOT EXISTS pothole_changes_au AFTER UPDATE ON potholes BEGIN
+        INSERT OR REPLACE INTO pothole_changes (pothole_id, seq, deleted)
+        VALUES (new.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM pothole_changes), 0);
+    END;
+    CREATE TRIGGER IF NOT EXISTS pothole_changes_ad AFTER DELETE ON potholes BEGIN
+        INSERT OR REPLACE INTO pothole_changes (pothole_id, seq, deleted)
+        VALUES (old.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM pothole_changes), 1);
+    END;
+    """)
+    conn.execute("""
+    INSERT INTO pothole_changes (pothole_id, seq, deleted)
+    SELECT id, (SELECT COALESCE(MAX(seq), 0) FROM pothole_changes) + ROW_NUMBER() OVER (ORDER BY id), 0
+    FROM potholes WHERE id NOT IN (SELECT pothole_id FROM pothole_changes)
+    """)
+
+
+def _query_indexes(conn):
+    _script(conn, """
+    -- Listings filtered by status or severity, newest first: a range scan that also
+    -- yields the ORDER BY. A bound status value (p.status = ?) can use these, which a
+    -- partial index on status = 'Red' could not.
+    CREATE INDEX IF NOT EXISTS idx_potholes_status_detected ON potholes(status, detected_at, id);
+    CREATE INDEX IF NOT EXISTS idx_potholes_severity_detected ON potholes(severity_level, detected_at, id);
+
+    -- Dedup lookup on every report (cell IN (...) AND status != 'Green'): partial on
+    -- open potholes and covering, so it never reads the table. status has to be a
+    -- column too: SQLite does not count the partial WHERE towards covering.
+    CREATE INDEX IF NOT EXISTS idx_potholes_open_cell ON potholes(cell, latitude, longitude, status)
+        WHERE status != 'Green';
+    DROP INDEX IF EXISTS idx_potholes_cell;
+
+    -- Reports claiming their image by event id only ever look at unclaimed images
+    CREATE INDEX IF NOT EXISTS idx_images_pending_event ON images(event_id)
+        WHERE pothole_id IS NULL AND event_id IS NOT NULL;
+    """)
+
+
+def _rollups(conn):
+    _script(conn, rollups.schema_sql())
+    rollups.rebuild(conn)
+
+
+def _repairs(conn):
+    _script(conn, """
+    CREATE TABLE IF NOT EXISTS pothole_status_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pothole_id INTEGER NOT NULL,
+        from_status TEXT,
+        to_status TEXT NOT NULL,
+        actor TEXT,
+        note TEXT,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_status_log_pothole ON pothole_status_log(pothole_id, id);
+
+    -- Open potholes (listing ?open=true), newest first. Repaired rows pile up over
+    -- the years; this index only holds the ones still on the road.
+    CREATE INDEX IF NOT EXISTS idx_potholes_open_detected ON potholes(detected_at, id)
+        WHERE status != 'Green';
+    """)
+
+
+def _partitions(conn):
+    _script(conn, """
+    -- Archival candidates: repaired potholes by repair time
+    CREATE INDEX IF NOT EXISTS idx_potholes_repaired ON potholes(repaired_at) WHERE status = 'Green';
+    -- Statistics of potholes moved to the archive partitions (see rollups.py)
+    CREATE TABLE IF NOT EXISTS pothole_rollups_archive (
+        dim TEXT NOT NULL,
+        key NOT NULL,
+        count INTEGER NOT NULL,
+        depth_sum REAL NOT NULL,
+        depth_max REAL NOT NULL,
+        PRIMARY KEY (dim, key)
+    ) WITHOUT ROWID;
+    """)
+
+
+def _spatial_listing(conn):
+    _script(conn, """
+    -- Bbox pages over a dense area walk newest first and test the point on the way
+    -- (listing.page_rows): with it in the index, rows outside the box are skipped
+    -- without reading the table. Supersede the plain (detected_at, id) indexes.
+    CREATE INDEX IF NOT EXISTS idx_potholes_detected_point ON potholes(detected_at, id, latitude, longitude);
+    DROP INDEX IF EXISTS idx_potholes_detected_at;
+    CREATE INDEX IF NOT EXISTS idx_potholes_open_detected_point
+        ON potholes(detected_at, id, latitude, longitude, status) WHERE status != 'Green';
+    DROP INDEX IF EXISTS idx_potholes_open_detected;
+    """)
+
+
+def _tile_cells(conn):
+    # Map cluster aggregates per zoom level, kept by triggers (see tiles.py)
+    _add_columns(conn, "potholes", ("tile INTEGER",))
+    # Before the triggers exist; rebuild() then counts every row once
+    conn.execute("UPDATE potholes SET tile = pothole_tile(latitude, longitude) WHERE tile IS NULL")
+    _script(conn, tiles.schema_sql())
+    tiles.rebuild(conn)
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "status/severity listing indexes, covering dedup index", _query_indexes),
+    (3, "analytics rollups", _rollups),
+    (4, "status audit log, open potholes index", _repairs),
+    (5, "archive partitions", _partitions),
+    (6, "newest-first indexes covering the point", _spatial_listing),
+    (7, "map cluster cells per zoom level", _tile_cells),
+]
+
+
+def current_version(conn):
+    """Highest applied version, 0 for a database that has never been migrated."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone() is None:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(path, busy_timeout_ms=5000):
+    """Bring the database at path up to the latest version. Returns the versions applied."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        # WAL is persistent in the file, so every pooled connection inherits it
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.create_function("pothole_cell", 2, geo.cell_key, deterministic=True)
+        conn.create_function("pothole_tile", 2, tiles.tile_key, deterministic=True)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        latest = MIGRATIONS[-1][0]
+        applied = []
+        for version, description, fn in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock: another process may have got here first
+                have = current_version(conn)
+                if have > latest:
+                    raise RuntimeError(f"Database schema v{have} is newer than this code (v{latest})")
+                if version <= have:
+                    conn.execute("COMMIT")
+                    continue
+                fn(conn)
+                conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                             (version, description))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"Applied schema migration {version}: {description}")
+            applied.append(version)
+        return applied
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("POTHOLE_DB", "pothole_system.db")
+    migrate(target)
+    conn = sqlite3.connect(target)
+    print(f"{target}: schema v{current_version(conn)}")
+    conn.close()
@@ -0,0 +1,213 @@
+"""
+Monthly cold partitions for repaired potholes.
+
+The main database file is the hot partition: every write goes there, and it
+holds the open potholes plus repaired ones until they are some days past their
+repair. Older repaired potholes move, with their observations and status log,
+into one SQLite file per month of detection (archive/potholes-YYYY-MM.db) that
+is ATTACHed only while a query or the archiver needs it. The hot file stays
+close to the working set (SQLite reuses the freed pages for new rows) and cold
+files, which only change while their month is being archived, can be backed up
+once and left alone.
+
+Reads opt in with ?archive=true. A newest-first page visits the partitions from
+the newest month down and stops as soon as no older month can contribute, so a
+query with a time window only opens the months inside it.
+
+An archive batch commits the copy into the cold file before deleting the hot
+rows. A crash in between leaves a duplicate, which reads drop by id and the next
+run overwrites; it never loses a row. The deletes reach the change feed as
+tombstones and the statistics through rollups.add_archived(). Archived potholes
+give up their images: the cold copy keeps no image URLs and the blobs are
+released, so the files go once nothing else references them.
+"""
+import heapq
+import os
+import re
+import sys
+from datetime import date
+
+import images
+import listing
+import repairs
+import rollups
+
+MONTH_RE = re.compile(r"^potholes-(\d{4}-\d{2})\.db$")
+
+OBSERVATION_COLUMNS = ("id", "pothole_id", "latitude", "longitude", "depth", "length", "width",
+                       "severity_level", "reported_at", "observed_at", "event_id")
+
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {a}.potholes (
+    id INTEGER PRIMARY KEY,
+    latitude REAL, longitude REAL, depth REAL, length REAL, width REAL, severity_level TEXT,
+    image_url TEXT, thumbnail_url TEXT, preview_url TEXT, status TEXT,
+    detected_at TIMESTAMP, repaired_at TIMESTAMP, last_seen_at TIMESTAMP,
+    observation_count INTEGER, growth_rate REAL
+);
+CREATE INDEX IF NOT EXISTS {a}.idx_potholes_detected_at ON potholes(detected_at, id);
+CREATE TABLE IF NOT EXISTS {a}.observations (
+    id INTEGER PRIMARY KEY,
+    pothole_id INTEGER NOT NULL,
+    latitude REAL, longitude REAL, depth REAL, length REAL, width REAL, severity_level TEXT,
+    reported_at REAL, observed_at TIMESTAMP, event_id TEXT
+);
+CREATE INDEX IF NOT EXISTS {a}.idx_observations_pothole ON observations(pothole_id, observed_at);
+CREATE TABLE IF NOT EXISTS {a}.pothole_status_log (
+    id INTEGER PRIMARY KEY,
+    pothole_id INTEGER NOT NULL,
+    from_status TEXT, to_status TEXT, actor TEXT, note TEXT, changed_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS {a}.idx_status_log_pothole ON pothole_status_log(pothole_id, id);
+"""
+
+
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"potholes-{month}.db")
+
+
+def months(archive_dir):
+    """Months ('YYYY-MM') that have a partition file, oldest first."""
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(m.group(1) for m in map(MONTH_RE.match, os.listdir(archive_dir)) if m)
+
+
+def month_bounds(month):
+    """['YYYY-MM-01 00:00:00', first day of the next month) in detected_at format."""
+    year, mon = map(int, month.split("-"))
+    end = date(year + mon // 12, mon % 12 + 1, 1)
+    return f"{month}-01 00:00:00", f"{end.isoformat()} 00:00:00"
+
+
+def attach(conn, archive_dir, month, create=False):
+    """ATTACH a partition (outside any transaction) and return its schema name."""
+    alias = "arc_" + month.replace("-", "_")
+    path = partition_path(archive_dir, month)
+    if create:
+        os.makedirs(archive_dir, exist_ok=True)
+    elif not os.path.exists(path):
+        raise LookupError(f"No archive partition for {month}")
+    conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+    if create:
+        for statement in PARTITION_SCHEMA.format(a=alias).split(";"):
+            if statement.strip():
+                conn.execute(statement)
+    return alias
+
+
+def on_partition(conn, archive_dir, month, fn, *args):
+    """Run fn(conn, *args, table=<partition>.potholes) with the month's partition attached."""
+    alias = attach(conn, archive_dir, month)
+    try:
+        return fn(conn, *args, table=f"{alias}.potholes")
+    finally:
+        conn.execute(f"DETACH DATABASE {alias}")
+
+
+def _cold_possible(filters):
+    """Archived potholes are all repaired: open or Red/Yellow filters never match them."""
+    return not filters.get("open") and filters.get("status") in (None, "Green")
+
+
+def window_months(archive_dir, filters, newest=None):
+    """
+    Partitions that can hold rows matching the since/until filters and detected no
+    later than newest (a page cursor), newest month first.
+    """
+    if not _cold_possible(filters):
+        return []
+    since, until = filters.get("since"), filters.get("until")
+    selected = []
+    for month in reversed(months(archive_dir)):
+        start, end = month_bounds(month)
+        if (until is None or start < until) and (since is None or end > since) \
+                and (newest is None or start <= newest):
+            selected.append(month)
+    return selected
+
+
+def list_page(conn, archive_dir, filters, limit=listing.DEFAULT_PAGE_SIZE, cursor=None, fields=None, bbox=None):
+    """listing.list_page() over the hot table and the archive partitions, merged newest first."""
+    cols, rows = listing.page_rows(conn, filters, limit, cursor, fields, bbox)
+    key = (cols.index("detected_at"), cols.index("id"))
+    seen = {row[key[1]] for row in rows}
+    for month in window_months(archive_dir, filters, cursor[0] if cursor is not None else None):
+        start, end = month_bounds(month)
+        if len(rows) > limit and rows[limit][key[0]] >= end:
+            break  # this month and every older one sort after the page
+        _, cold = on_partition(conn, archive_dir, month, listing.page_rows, filters, limit, cursor, fields, bbox)
+        cold = [row for row in cold if row[key[1]] not in seen]
+        seen.update(row[key[1]] for row in cold)
+        rows = list(heapq.merge(rows, cold, key=lambda r: (r[key[0]], r[key[1]]), reverse=True))[:limit + 1]
+    return listing.finish_page(cols, rows, limit, fields)
+
+
+def archive_batch(conn, archive_dir, after_days, limit=2000):
+    """
+    Move up to limit potholes repaired more than after_days ago, all detected in
+    the same month, to that month's partition. Runs on the writer connection and
+    commits itself (cold copy first). Returns (moved rows, digests of the blobs
+    their images released, for images.drop_blobs()); ([], []) when done.
+    """
+    cutoff = f"-{int(after_days)} days"
+    first = conn.execute(
+        "SELECT strftime('%Y-%m', detected_at) FROM potholes WHERE status = 'Green' "
+        "AND repaired_at < datetime('now', ?) AND detected_at IS NOT NULL "
+        "ORDER BY repaired_at LIMIT 1", (cutoff,)).fetchone()
+    if first is None:
+        return [], []
+    month = first[0]
+    start, end = month_bounds(month)
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM potholes WHERE status = 'Green' AND repaired_at < datetime('now', ?) "
+        "AND detected_at >= ? AND detected_at < ? LIMIT ?", (cutoff, start, end, limit))]
+
+    alias = attach(conn, archive_dir, month, create=True)
+    marks = ",".join("?" * len(ids))
+    columns = ", ".join(listing.COLUMNS)
+    observation_columns = ", ".join(OBSERVATION_COLUMNS)
+    log_columns = ", ".join(repairs.LOG_COLUMNS)
+    try:
+        conn.execute(f"INSERT OR REPLACE INTO {alias}.potholes ({columns}) "
+                     f"SELECT {columns} FROM main.potholes WHERE id IN ({marks})", ids)
+        conn.execute(f"UPDATE {alias}.potholes SET image_url = NULL, thumbnail_url = NULL, preview_url = NULL "
+                     f"WHERE id IN ({marks})", ids)
+        conn.execute(f"INSERT OR REPLACE INTO {alias}.observations ({observation_columns}) "
+                     f"SELECT {observation_columns} FROM main.observations WHERE pothole_id IN ({marks})", ids)
+        conn.execute(f"INSERT OR REPLACE INTO {alias}.pothole_status_log ({log_columns}) "
+                     f"SELECT {log_columns} FROM main.pothole_status_log WHERE pothole_id IN ({marks})", ids)
+        # The cold copy is durable before the hot rows go
+        conn.commit()
+        conn.execute(f"DELETE FROM main.observations WHERE pothole_id IN ({marks})", ids)
+        conn.execute(f"DELETE FROM main.pothole_status_log WHERE pothole_id IN ({marks})", ids)
+        rows = conn.execute(f"DELETE FROM main.potholes WHERE id IN ({marks}) RETURNING {columns}", ids).fetchall()
+        rollups.add_archived(conn, f"{alias}.potholes", ids)
+        released = images.release_pothole_images(conn, ids)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"DETACH DATABASE {alias}")
+    return [dict(zip(listing.COLUMNS, row)) for row in rows], released
+
+
+if __name__ == "__main__":
+    import sqlite3
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("POTHOLE_DB", "pothole_system.db")
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else int(os.environ.get("POTHOLE_ARCHIVE_AFTER_DAYS", "90"))
+    archive_dir = os.environ.get("POTHOLE_ARCHIVE_DIR", "archive")
+    upload_dir = os.environ.get("POTHOLE_UPLOAD_DIR", "uploads")
+    derived_dir = os.environ.get("POTHOLE_DERIVED_DIR", "derived")
+    conn = sqlite3.connect(path)
+    total = 0
+    while True:
+        moved, released = archive_batch(conn, archive_dir, days)
+        if not moved:
+            break
+        images.drop_blobs(conn, released, upload_dir, derived_dir)
+        total += len(moved)
+    print(f"{path}: archived {total} potholes repaired over {days} days ago into {archive_dir}/")
+    conn.close()
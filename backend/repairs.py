@@ -0,0 +1,90 @@
+"""
+Repair workflow: status transitions of potholes, with an audit trail.
+
+A pothole is Red (open) when detected, Yellow while a crew is on it and Green
+once repaired. Moving to Green stamps repaired_at; leaving Green (the hole came
+back) clears it. Every change is logged to `pothole_status_log` in the same
+transaction as the update, and the rollup, change feed and R*Tree triggers on
+`potholes` see it like any other write.
+
+Bulk changes are all or nothing: every id is checked before anything is
+written, and a single unknown id or disallowed transition rejects the lot.
+Setting a pothole to the status it already has is not an error, so a crew app
+can safely retry a request.
+"""
+STATUSES = ("Red", "Yellow", "Green")
+OPEN_STATUSES = ("Red", "Yellow")
+
+# from -> statuses it may move to
+TRANSITIONS = {
+    "Red": ("Yellow", "Green"),
+    "Yellow": ("Green", "Red"),
+    "Green": ("Red",),
+}
+
+UPDATE_STATUS_SQL = """
+UPDATE potholes SET status = ?,
+    repaired_at = CASE WHEN ? = 'Green' THEN CURRENT_TIMESTAMP ELSE NULL END
+WHERE id = ?
+"""
+
+INSERT_LOG_SQL = """
+INSERT INTO pothole_status_log (pothole_id, from_status, to_status, actor, note)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+LOG_COLUMNS = ("id", "pothole_id", "from_status", "to_status", "actor", "note", "changed_at")
+
+# Ids per SELECT ... IN (...), well below SQLite's bound parameter limit
+_CHUNK = 500
+
+
+class InvalidTransition(Exception):
+    """Raised with the per-id problems when a status change cannot be applied."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} pothole(s) cannot change status")
+        self.errors = errors
+
+
+def _current(conn, ids):
+    statuses = {}
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        statuses.update(conn.execute(
+            f"SELECT id, status FROM potholes WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+    return statuses
+
+
+def change_status(conn, ids, status, actor=None, note=None):
+    """
+    Move the potholes to status in the caller's transaction. Returns the ids that
+    changed (in the order given); raises InvalidTransition without writing
+    anything if an id is unknown or its transition is not allowed.
+    """
+    ids = list(dict.fromkeys(ids))
+    current = _current(conn, ids)
+    errors, changed = [], []
+    for pothole_id in ids:
+        old = current.get(pothole_id)
+        if pothole_id not in current:
+            errors.append({"id": pothole_id, "error": "not found"})
+        elif old == status:
+            continue
+        elif status not in TRANSITIONS.get(old, STATUSES):
+            errors.append({"id": pothole_id, "error": f"{old} -> {status} is not allowed"})
+        else:
+            changed.append(pothole_id)
+    if errors:
+        raise InvalidTransition(errors)
+
+    conn.executemany(UPDATE_STATUS_SQL, [(status, status, i) for i in changed])
+    conn.executemany(INSERT_LOG_SQL, [(i, current[i], status, actor, note) for i in changed])
+    return changed
+
+
+def history(conn, pothole_id):
+    """Status changes of one pothole, oldest first."""
+    rows = conn.execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM pothole_status_log WHERE pothole_id = ? "
+                        "ORDER BY id", (pothole_id,)).fetchall()
+    return [dict(zip(LOG_COLUMNS, row)) for row in rows]
@@ -0,0 +1,203 @@
+"""
+Incrementally maintained pothole statistics for GET /api/stats.
+
+`pothole_rollups` holds one row per (dimension, key) with the pothole count, the
+depth sum (for the average) and the maximum depth, for four dimensions: day of
+detection, severity, status and area (a AREA_STEP_DEG grid cell). Triggers on
+`potholes` keep it current inside the transaction of every insert, update and
+delete, so the endpoint reads a few small index ranges instead of grouping the
+raw table, and costs the same at a thousand rows or ten million.
+
+A count or sum is adjusted in place. A maximum cannot be when the row holding it
+leaves the bucket (status change, repair, delete); the trigger then re-reads it
+with a MAX() over an index on (dimension, depth), which SQLite answers with a
+single seek.
+
+Potholes moved to the cold partitions (partitions.py) leave pothole_rollups
+through the delete trigger and are added to `pothole_rollups_archive`, which
+only ever grows; the endpoint adds the two up. Backfills run with the triggers
+dropped for speed can be reconciled with `python rollups.py [db]`, which
+rebuilds both tables from the hot table and the archive files.
+"""
+import os
+import sqlite3
+import sys
+
+AREA_STEP_DEG = 0.01  # ~1.1 km north-south
+AREA_COLS = int(round(360 / AREA_STEP_DEG))
+
+# dimension -> SQL for its key, "{r}" being the row reference (new., old. or nothing)
+DIMENSIONS = {
+    "day": "date({r}detected_at)",
+    "severity": "{r}severity_level",
+    "status": "{r}status",
+    "area": (f"CAST(({{r}}latitude + 90.0) / {AREA_STEP_DEG} AS INTEGER) * {AREA_COLS} "
+             f"+ CAST(({{r}}longitude + 180.0) / {AREA_STEP_DEG} AS INTEGER)"),
+}
+# Columns an UPDATE must touch to move a row between buckets
+DIMENSION_COLUMNS = {
+    "day": "detected_at",
+    "severity": "severity_level",
+    "status": "status",
+    "area": "latitude, longitude",
+}
+# What the max recompute searches for the old row's bucket ({v}: its raw key): the
+# day range uses idx_potholes_detected_point, the others an index on (key, depth).
+# IS rather than = so the NULL bucket is found too; both can use the index.
+MAX_LOOKUP = {
+    "day": "detected_at >= {v} AND detected_at < date({v}, '+1 day')",
+    "severity": "severity_level IS {v}",
+    "status": "status IS {v}",
+    "area": DIMENSIONS["area"].format(r="") + " IS {v}",
+}
+
+
+def _key(dim, r):
+    # Keys are part of a WITHOUT ROWID primary key, which cannot be NULL
+    return f"COALESCE({DIMENSIONS[dim].format(r=r)}, '')"
+
+
+def _add(dim):
+    return f"""
+        INSERT INTO pothole_rollups (dim, key, count, depth_sum, depth_max)
+        VALUES ('{dim}', {_key(dim, 'new.')}, 1, COALESCE(new.depth, 0), COALESCE(new.depth, 0))
+        ON CONFLICT (dim, key) DO UPDATE SET count = count + 1, depth_sum = depth_sum + excluded.depth_sum,
+            depth_max = MAX(depth_max, excluded.depth_max);"""
+
+
+def _remove(dim):
+    key = _key(dim, "old.")
+    lookup = MAX_LOOKUP[dim].format(v=DIMENSIONS[dim].format(r="old."))
+    return f"""
+        UPDATE pothole_rollups SET count = count - 1, depth_sum = depth_sum - COALESCE(old.depth, 0)
+        WHERE dim = '{dim}' AND key = {key};
+        DELETE FROM pothole_rollups WHERE dim = '{dim}' AND key = {key} AND count <= 0;
+        UPDATE pothole_rollups SET depth_max = COALESCE((SELECT MAX(depth) FROM potholes WHERE {lookup}), 0)
+        WHERE dim = '{dim}' AND key = {key} AND depth_max <= COALESCE(old.depth, 0);"""
+
+
+def schema_sql():
+    """Table, lookup indexes and triggers; every statement is IF NOT EXISTS."""
+    statements = ["""
+    CREATE TABLE IF NOT EXISTS pothole_rollups (
+        dim TEXT NOT NULL,
+        key NOT NULL,
+        count INTEGER NOT NULL,
+        depth_sum REAL NOT NULL,
+        depth_max REAL NOT NULL,
+        PRIMARY KEY (dim, key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_pothole_rollups_count ON pothole_rollups(dim, count);
+    CREATE INDEX IF NOT EXISTS idx_potholes_status_depth ON potholes(status, depth);
+    CREATE INDEX IF NOT EXISTS idx_potholes_severity_depth ON potholes(severity_level, depth);
+    """, f"CREATE INDEX IF NOT EXISTS idx_potholes_area_depth ON potholes({DIMENSIONS['area'].format(r='')}, depth);"]
+    for dim, columns in DIMENSION_COLUMNS.items():
+        changed = f"{_key(dim, 'old.')} IS NOT {_key(dim, 'new.')} OR old.depth IS NOT new.depth"
+        statements.append(f"""
+    CREATE TRIGGER IF NOT EXISTS pothole_rollups_{dim}_ai AFTER INSERT ON potholes BEGIN{_add(dim)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS pothole_rollups_{dim}_au AFTER UPDATE OF {columns}, depth ON potholes
+    WHEN {changed} BEGIN{_remove(dim)}{_add(dim)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS pothole_rollups_{dim}_ad AFTER DELETE ON potholes BEGIN{_remove(dim)}
+    END;""")
+    return "\n".join(statements)
+
+
+def _accumulate(conn, target, source, params=()):
+    """Add the rows of `source` (a FROM clause) to the rollup table target."""
+    for dim in DIMENSIONS:
+        conn.execute(f"""
+        INSERT INTO {target} (dim, key, count, depth_sum, depth_max)
+        SELECT '{dim}', {_key(dim, '')}, COUNT(*), TOTAL(COALESCE(depth, 0)), MAX(COALESCE(depth, 0))
+        FROM {source} GROUP BY 2
+        ON CONFLICT (dim, key) DO UPDATE SET count = count + excluded.count,
+            depth_sum = depth_sum + excluded.depth_sum, depth_max = MAX(depth_max, excluded.depth_max)
+        """, params)
+
+
+def rebuild(conn):
+    """Recompute the hot rollups from the potholes table, in the caller's transaction."""
+    conn.execute("DELETE FROM pothole_rollups")
+    _accumulate(conn, "pothole_rollups", "potholes")
+
+
+def add_archived(conn, table, ids):
+    """Count the potholes with these ids in table (an archive partition) as archived."""
+    marks = ",".join("?" * len(ids))
+    _accumulate(conn, "pothole_rollups_archive", f"{table} WHERE id IN ({marks})", ids)
+
+
+def area_bounds(key):
+    """(min_lon, min_lat, max_lon, max_lat) of an area cell key."""
+    row, col = divmod(key, AREA_COLS)
+    min_lat = row * AREA_STEP_DEG - 90.0
+    min_lon = col * AREA_STEP_DEG - 180.0
+    return (round(min_lon, 6), round(min_lat, 6),
+            round(min_lon + AREA_STEP_DEG, 6), round(min_lat + AREA_STEP_DEG, 6))
+
+
+def _summary(count, depth_sum, depth_max):
+    return {"count": count, "avg_depth": round(depth_sum / count, 2) if count else None, "max_depth": depth_max}
+
+
+def _item(name, key, count, depth_sum, depth_max):
+    return {name: None if key == "" else key, **_summary(count, depth_sum, depth_max)}
+
+
+def _merged(conn, dim, where="", params=(), order="key", limit=-1):
+    """(key, count, depth_sum, depth_max) of one dimension, hot and archived added up."""
+    return conn.execute(f"""
+        SELECT key, SUM(count), SUM(depth_sum), MAX(depth_max) FROM (
+            SELECT key, count, depth_sum, depth_max FROM pothole_rollups WHERE dim = ?1 {where}
+            UNION ALL
+            SELECT key, count, depth_sum, depth_max FROM pothole_rollups_archive WHERE dim = ?1 {where}
+        ) GROUP BY key ORDER BY {order} LIMIT ?2""", (dim, limit, *params)).fetchall()
+
+
+def read_stats(conn, since_day, until_day, top_areas):
+    """
+    Rollups for the dashboard: totals, per status and severity, per day in
+    [since_day, until_day) and the top_areas areas with the most potholes.
+    """
+    status_rows = _merged(conn, "status")
+    by_status = [_item("status", *r) for r in status_rows]
+    by_severity = [_item("severity_level", *r) for r in _merged(conn, "severity")]
+    by_day = [_item("day", *r) for r in _merged(conn, "day", "AND key >= ?3 AND key < ?4", (since_day, until_day))]
+    by_area = []
+    for key, count, depth_sum, depth_max in _merged(conn, "area", order="SUM(count) DESC", limit=top_areas):
+        item = _item("area", key, count, depth_sum, depth_max)
+        item["bbox"] = area_bounds(key) if key != "" else None
+        by_area.append(item)
+
+    # Every pothole has exactly one status bucket, so they add up to the totals
+    total = _summary(sum(r[1] for r in status_rows), sum(r[2] for r in status_rows),
+                     max((r[3] for r in status_rows), default=None))
+    return {
+        "total": total,
+        "by_status": by_status,
+        "by_severity": by_severity,
+        "by_day": by_day,
+        "by_area": by_area,
+    }
+
+
+if __name__ == "__main__":
+    import partitions
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("POTHOLE_DB", "pothole_system.db")
+    archive_dir = os.environ.get("POTHOLE_ARCHIVE_DIR", "archive")
+    conn = sqlite3.connect(path)
+    with conn:
+        rebuild(conn)
+    conn.execute("DELETE FROM pothole_rollups_archive")
+    conn.commit()
+    for month in partitions.months(archive_dir):
+        alias = partitions.attach(conn, archive_dir, month)
+        with conn:
+            _accumulate(conn, "pothole_rollups_archive", f"{alias}.potholes")
+        conn.execute(f"DETACH DATABASE {alias}")
+    count = conn.execute("SELECT (SELECT COUNT(*) FROM pothole_rollups) + "
+                         "(SELECT COUNT(*) FROM pothole_rollups_archive)").fetchone()[0]
+    print(f"{path}: rebuilt {count} rollup rows")
+    conn.close()
@@ -0,0 +1,44 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """
+    Import main against a fresh database and file store under tmp_path, with
+    environment overrides (POTHOLE_* names without the prefix). Archival and the
+    thumbnail workers are off unless a test turns them on.
+    """
+    def make(**env):
+        settings = {"DB": tmp_path / "potholes.db", "UPLOAD_DIR": tmp_path / "uploads",
+                    "DERIVED_DIR": tmp_path / "derived", "ARCHIVE_DIR": tmp_path / "archive",
+                    "ARCHIVE_AFTER_DAYS": 0, "THUMB_WORKERS": 0, **env}
+        for name, value in settings.items():
+            monkeypatch.setenv("POTHOLE_" + name, str(value))
+        # No ../dashboard from here, so main does not mount it
+        monkeypatch.chdir(tmp_path)
+        import main
+        return importlib.reload(main)
+    return make
+
+
+@pytest.fixture
+def main(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(main):
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as c:
+        yield c
+
+
+def report(lat=19.07, lon=72.87, depth=5.0, **fields):
+    return {"latitude": lat, "longitude": lon, "depth": depth, "severity": "Moderate",
+            "timestamp": 1700000000.0, **fields}
@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+import images
+from conftest import report
+
+
+def archive(main, client):
+    main.db.write_sync(lambda conn: conn.execute(
+        "UPDATE potholes SET repaired_at = datetime('now', '-1 day') WHERE status = 'Green'"))
+    return client.portal.call(main._archive_repaired)
+
+
+def test_repaired_potholes_move_to_their_month(main, client, tmp_path):
+    ids = [client.post("/api/potholes", json=report(19.0 + i * 0.01, 72.8)).json()["id"] for i in range(3)]
+    client.post("/api/potholes/status", json={"ids": ids[:2], "status": "Green"})
+    since = client.get("/api/potholes/changes", params={"since": 0}).json()["cursor"]
+
+    assert archive(main, client) == 2
+    assert [p["id"] for p in client.get("/api/potholes").json()] == [ids[2]]
+    archived = client.get("/api/potholes", params={"archive": "true"}).json()
+    assert sorted(p["id"] for p in archived) == ids
+    assert {p["status"] for p in archived if p["id"] in ids[:2]} == {"Green"}
+    assert len(os.listdir(tmp_path / "archive")) == 1
+
+    changes = client.get("/api/potholes/changes", params={"since": since}).json()["changes"]
+    assert sorted(c["id"] for c in changes if c["deleted"]) == ids[:2]
+    assert client.get("/api/stats").json()["total"]["count"] == 3
+    assert archive(main, client) == 0
+
+
+def test_archived_potholes_release_their_images(main, client, tmp_path):
+    pothole = client.post("/api/potholes", json=report(19.0, 72.8, event_id="e1")).json()["id"]
+    client.post("/api/upload_image", params={"event_id": "e1"}, content=b"photo",
+                headers={"Content-Type": "image/jpeg"})
+    client.patch(f"/api/potholes/{pothole}", json={"status": "Green"})
+
+    assert archive(main, client) == 1
+    assert not os.path.exists(tmp_path / "uploads" / images.blob_name(hashlib.sha256(b"photo").hexdigest()))
+    [cold] = client.get("/api/potholes", params={"archive": "true"}).json()
+    assert cold["id"] == pothole and cold["image_url"] is None
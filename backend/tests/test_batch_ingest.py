@@ -0,0 +1,22 @@
+from conftest import report
+
+
+def test_batch_inserts_valid_items_and_reports_invalid_ones(client):
+    items = [report(19.0 + i * 0.01, 72.8) for i in range(3)] + [{"latitude": "north"}]
+    body = client.post("/api/potholes/batch", json=items).json()
+
+    assert body["status"] == "partial"
+    assert (body["inserted"], body["failed"]) == (3, 1)
+    assert [r["status"] for r in body["results"]] == ["success"] * 3 + ["error"]
+    ids = [r["id"] for r in body["results"][:3]]
+    assert len(set(ids)) == 3
+    listed = client.get("/api/potholes").json()
+    assert sorted(p["id"] for p in listed) == sorted(ids)
+
+
+def test_batch_size_is_capped(make_app):
+    from fastapi.testclient import TestClient
+    main = make_app(MAX_BATCH=2)
+    with TestClient(main.app) as client:
+        response = client.post("/api/potholes/batch", json=[report()] * 3)
+    assert response.status_code == 413
@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), "..", "benchmarks")
+
+
+def test_suite_runs_a_small_city(tmp_path):
+    output = tmp_path / "results.json"
+    env = {**os.environ, "POTHOLE_UPLOAD_DIR": str(tmp_path / "uploads"),
+           "POTHOLE_DERIVED_DIR": str(tmp_path / "derived"), "POTHOLE_THUMB_WORKERS": "0"}
+    subprocess.run([sys.executable, os.path.join(BENCHMARKS, "bench_suite.py"), "--db", str(tmp_path / "bench.db"),
+                    "--rows", "500",
+                    "--requests", "20", "--concurrency", "2", "--scenarios", "ingest,batch,list_cached,near",
+                    "--output", str(output)], env=env, cwd=tmp_path, check=True, capture_output=True, timeout=120)
+
+    results = json.loads(output.read_text())
+    assert results["meta"]["rows"] == 500
+    assert [r["scenario"] for r in results["results"]] == ["ingest", "batch", "list_cached", "near"]
+    assert all(r["errors"] == 0 and r["p50_ms"] <= r["p99_ms"] for r in results["results"])
@@ -0,0 +1,49 @@
+import hashlib
+import os
+
+import images
+from conftest import report
+
+
+def upload(client, data, **params):
+    return client.post("/api/upload_image", params=params, content=data,
+                       headers={"Content-Type": "image/jpeg"}).json()
+
+
+def stored(tmp_path, data):
+    return os.path.exists(tmp_path / "uploads" / images.blob_name(hashlib.sha256(data).hexdigest()))
+
+
+def blobs(main):
+    return main.db.read_sync(lambda conn: [tuple(r) for r in conn.execute("SELECT hash, refcount FROM blobs")])
+
+
+def test_identical_uploads_share_one_blob(main, client, tmp_path):
+    first = upload(client, b"frame one", lat=19.0, lon=72.8)
+    again = upload(client, b"frame one", lat=19.0, lon=72.8)
+    assert first["url"] == again["url"] and [first["duplicate"], again["duplicate"]] == [None, "exact"]
+    assert blobs(main) == [(hashlib.sha256(b"frame one").hexdigest(), 2)]
+    assert stored(tmp_path, b"frame one")
+
+
+def test_retried_capture_releases_the_earlier_blob(main, client, tmp_path):
+    pothole = client.post("/api/potholes", json=report(19.0, 72.8, event_id="e1")).json()["id"]
+    first = upload(client, b"blurred", event_id="e1")
+    retry = upload(client, b"sharp", event_id="e1")
+    assert first["pothole_id"] == retry["pothole_id"] == pothole
+    assert not stored(tmp_path, b"blurred") and stored(tmp_path, b"sharp")
+    assert blobs(main) == [(hashlib.sha256(b"sharp").hexdigest(), 1)]
+    assert client.get("/api/potholes").json()[0]["image_url"] == retry["url"]
+
+
+def test_a_blob_other_images_use_keeps_its_file(main, client, tmp_path):
+    upload(client, b"shared", event_id="e1")
+    upload(client, b"shared", event_id="e2")
+    upload(client, b"other", event_id="e1")
+    assert stored(tmp_path, b"shared") and stored(tmp_path, b"other")
+    assert sorted(blobs(main)) == sorted([(hashlib.sha256(b"shared").hexdigest(), 1),
+                                          (hashlib.sha256(b"other").hexdigest(), 1)])
+
+
+def test_near_duplicates_are_not_shared_by_default(main):
+    assert main.PHASH_MAX_DISTANCE == 0
@@ -0,0 +1,41 @@
+from conftest import report
+
+
+def test_idle_poll_is_304_until_something_changes(client):
+    first = client.post("/api/potholes", json=report()).json()["id"]
+    full = client.get("/api/potholes/changes", params={"since": 0}).json()
+    assert [c["id"] for c in full["changes"]] == [first]
+    cursor = full["cursor"]
+
+    caught_up = client.get("/api/potholes/changes", params={"since": cursor})
+    assert caught_up.json()["changes"] == []
+    etag = caught_up.headers["ETag"]
+    idle = client.get("/api/potholes/changes", params={"since": cursor}, headers={"If-None-Match": etag})
+    assert idle.status_code == 304 and idle.content == b""
+
+    second = client.post("/api/potholes", json=report(19.5, 73.0)).json()["id"]
+    client.patch(f"/api/potholes/{first}", json={"status": "Yellow"})
+    delta = client.get("/api/potholes/changes", params={"since": cursor}, headers={"If-None-Match": etag})
+    assert delta.status_code == 200 and delta.headers["ETag"] != etag
+    changes = delta.json()["changes"]
+    assert [c["id"] for c in changes] == [second, first]
+    assert changes[1]["status"] == "Yellow"
+
+
+def test_changes_page_with_has_more(client):
+    client.post("/api/potholes/batch", json=[report(19.0 + i * 0.01, 72.8) for i in range(5)])
+    cursor, seen = 0, []
+    while True:
+        page = client.get("/api/potholes/changes", params={"since": cursor, "limit": 2}).json()
+        seen += [c["id"] for c in page["changes"]]
+        cursor = page["cursor"]
+        if not page["has_more"]:
+            break
+    assert len(seen) == 5 == len(set(seen))
+
+
+def test_cursor_past_the_feed_is_410(client):
+    client.post("/api/potholes", json=report())
+    cursor = client.get("/api/potholes/changes", params={"since": 0}).json()["cursor"]
+    assert client.get("/api/potholes/changes", params={"since": cursor}).status_code == 200
+    assert client.get("/api/potholes/changes", params={"since": cursor + 1}).status_code == 410
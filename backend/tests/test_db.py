@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from db import Database
+
+
+def test_readers_are_pooled_read_only_wal(tmp_path):
+    db = Database(str(tmp_path / "t.db"), readers=2)
+    db.write_sync(lambda conn: conn.execute("CREATE TABLE t (x)"))
+    db.write_sync(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+
+    assert db.read_sync(lambda conn: conn.execute("PRAGMA journal_mode").fetchone()[0]) == "wal"
+    assert db.read_sync(lambda conn: conn.execute("SELECT x FROM t").fetchall()[0][0]) == 1
+    # Sequential reads come back on the same pooled connection
+    assert len({db.read_sync(lambda conn: id(conn)) for _ in range(5)}) == 1
+    with pytest.raises(sqlite3.OperationalError):
+        db.read_sync(lambda conn: conn.execute("INSERT INTO t VALUES (2)"))
+    db.close()
+
+
+def test_failed_write_rolls_back(tmp_path):
+    db = Database(str(tmp_path / "t.db"))
+    db.write_sync(lambda conn: conn.execute("CREATE TABLE t (x)"))
+
+    def insert_then_fail(conn):
+        conn.execute("INSERT INTO t VALUES (1)")
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        db.write_sync(insert_then_fail)
+    assert db.read_sync(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 0
+    db.close()
+
+
+def test_reads_overlap_and_pool_is_capped(tmp_path):
+    db = Database(str(tmp_path / "t.db"), readers=2)
+    db.write_sync(lambda conn: conn.execute("CREATE TABLE t (x)"))
+    seen = set()
+
+    def slow_read(conn):
+        seen.add(id(conn))
+        conn.execute("SELECT COUNT(*) FROM t").fetchone()
+        return len(seen)
+
+    async def run():
+        return await asyncio.gather(*(db.read(slow_read) for _ in range(8)))
+
+    asyncio.run(run())
+    assert 1 <= len(seen) <= 2
+    db.close()
@@ -0,0 +1,51 @@
+import pytest
+
+import geo
+from conftest import report
+
+
+def test_repeat_detection_becomes_an_observation(client):
+    first = client.post("/api/potholes", json=report(19.0, 72.8, depth=4.0, event_id="a")).json()
+    # ~1 m away and deeper: the same pothole, seen again
+    again = client.post("/api/potholes", json=report(19.00001, 72.8, depth=6.0, event_id="b")).json()
+    # ~100 m away: a different one
+    other = client.post("/api/potholes", json=report(19.001, 72.8)).json()
+
+    assert first["matched"] is False and again == {**first, "status": "success", "matched": True}
+    assert other["id"] != first["id"]
+    observations = client.get(f"/api/potholes/{first['id']}/observations").json()
+    assert sorted(o["depth"] for o in observations) == [4.0, 6.0]
+    pothole = client.get("/api/potholes", params={"near": "19.0,72.8", "k": 1}).json()[0]
+    assert pothole["depth"] == 6.0 and pothole["observation_count"] == 2
+
+
+def test_duplicates_inside_one_batch_collapse(client):
+    body = client.post("/api/potholes/batch", json=[report(19.0, 72.8), report(19.00001, 72.80001)]).json()
+    ids = [r["id"] for r in body["results"]]
+    assert ids[0] == ids[1] and [r["matched"] for r in body["results"]] == [False, True]
+
+
+def test_repaired_potholes_are_not_matched(client):
+    first = client.post("/api/potholes", json=report(19.0, 72.8)).json()["id"]
+    client.patch(f"/api/potholes/{first}", json={"status": "Green"})
+    again = client.post("/api/potholes", json=report(19.0, 72.8)).json()
+    assert again["id"] != first and again["matched"] is False
+
+
+def test_non_finite_or_out_of_range_coordinates_are_rejected(client):
+    for lat, lon in (("NaN", "72.8"), ("19.0", "Infinity"), ("91.0", "72.8"), ("19.0", "-180.5")):
+        body = ('{"latitude": %s, "longitude": %s, "depth": 5.0, "severity": "Moderate", "timestamp": 1700000000}'
+                % (lat, lon))
+        response = client.post("/api/potholes", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 422, (lat, lon)
+        batch = client.post("/api/potholes/batch", content=f"[{body}]", headers={"Content-Type": "application/json"})
+        assert batch.json()["results"][0]["status"] == "error"
+    assert client.get("/api/potholes").json() == []
+
+
+def test_reports_near_a_pole_are_deduplicated(client):
+    body = client.post("/api/potholes/batch", json=[report(89.9999, 10.0), report(89.9999, 10.001)]).json()
+    assert [r["matched"] for r in body["results"]] == [False, True]
+    assert geo.cells_within(89.9999, 10.0, 3.0) is None
+    with pytest.raises(ValueError):
+        geo.box_around(float("nan"), 72.8, 3.0)
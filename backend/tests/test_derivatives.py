@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+import derivatives
+from conftest import report
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+
+def jpeg(size=(2000, 1500)):
+    out = io.BytesIO()
+    Image.new("RGB", size, (120, 90, 60)).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def test_render_writes_every_variant_once(tmp_path):
+    src = tmp_path / "photo.jpg"
+    src.write_bytes(jpeg())
+    digest = "ab" * 32
+    assert derivatives.existing(tmp_path, digest) is None
+    names = derivatives.render(src, tmp_path, digest)
+    assert derivatives.existing(tmp_path, digest) == names
+    for variant, (max_px, _) in derivatives.VARIANTS.items():
+        with Image.open(derivatives.derived_path(tmp_path, names[variant])) as im:
+            assert max(im.size) == max_px
+
+    derivatives.remove(tmp_path, digest)
+    assert derivatives.existing(tmp_path, digest) is None
+
+
+def test_upload_gets_thumbnail_and_preview_urls(make_app):
+    from fastapi.testclient import TestClient
+    main = make_app(THUMB_WORKERS=1)
+    with TestClient(main.app) as client:
+        pothole = client.post("/api/potholes", json=report(event_id="e1")).json()["id"]
+        body = client.post("/api/upload_image", params={"event_id": "e1"}, content=jpeg(),
+                           headers={"Content-Type": "image/jpeg"}).json()
+        assert body["thumbnail_url"] is None
+        client.portal.call(main.thumbnails.close)
+
+        [row] = client.get("/api/potholes").json()
+        assert row["id"] == pothole and row["thumbnail_url"] and row["preview_url"]
+        thumb = client.get(row["thumbnail_url"])
+        assert thumb.status_code == 200 and "immutable" in thumb.headers["Cache-Control"]
+        assert client.get(row["thumbnail_url"], headers={"If-None-Match": thumb.headers["ETag"]}).status_code == 304
+
+        # The same bytes again reuse the derivatives already on disk
+        again = client.post("/api/upload_image", content=jpeg(), headers={"Content-Type": "image/jpeg"}).json()
+        assert again["thumbnail_url"] == row["thumbnail_url"]
@@ -0,0 +1,38 @@
+import csv
+import io
+import json
+
+import pytest
+
+import export
+from conftest import report
+
+
+@pytest.fixture
+def seeded(client, monkeypatch):
+    # Small chunks so the export spans several reads
+    monkeypatch.setattr(export, "CHUNK_ROWS", 3)
+    client.post("/api/potholes/batch", json=[report(19.0 + i * 0.01, 72.8, depth=float(i)) for i in range(10)])
+    return client
+
+
+def test_geojson_export_has_every_row_in_id_order(seeded):
+    response = seeded.get("/api/export", params={"format": "geojson"})
+    assert response.headers["content-type"].startswith("application/geo+json")
+    assert "attachment" in response.headers["content-disposition"]
+    collection = json.loads(response.content)
+    features = collection["features"]
+    assert collection["type"] == "FeatureCollection" and len(features) == 10
+    ids = [f["properties"]["id"] for f in features]
+    assert ids == sorted(ids)
+    assert features[3]["geometry"] == {"type": "Point", "coordinates": [72.8, 19.03]}
+
+
+def test_csv_export_applies_filters(seeded):
+    text = seeded.get("/api/export", params={"format": "csv", "min_depth": 6}).text
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert [float(r["depth"]) for r in rows] == [6.0, 7.0, 8.0, 9.0]
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.get("/api/export", params={"format": "xlsx"}).status_code == 400
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import ingest
+from conftest import report
+
+
+def test_queue_groups_submissions_and_isolates_a_failing_one():
+    writes = []
+
+    async def write(items):
+        writes.append(list(items))
+        if "bad" in items:
+            raise ValueError("bad report")
+        return [item.upper() for item in items]
+
+    async def run():
+        queue = ingest.WriteBehindQueue(write, max_items=5, max_delay=0.05)
+        jobs = [queue.submit(["a", "b"]), queue.submit(["bad"]), queue.submit(["c"])]
+        with pytest.raises(ingest.QueueFull):
+            queue.submit(["d", "e", "f"])
+        await queue.close()
+        with pytest.raises(ingest.QueueClosed):
+            queue.submit(["g"])
+        return queue, jobs
+
+    queue, jobs = asyncio.run(run())
+    assert writes[0] == ["a", "b", "bad", "c"]
+    assert [queue.status(job.ticket)["status"] for job in jobs] == ["success", "error", "success"]
+    assert jobs[0].outcomes == ["A", "B"] and jobs[2].outcomes == ["C"]
+    assert (queue.written, queue.failed, queue.rejected, len(queue)) == (3, 1, 3, 0)
+
+
+def test_queued_reports_are_written_by_ticket(make_app):
+    from fastapi.testclient import TestClient
+    with TestClient(make_app(INGEST_MODE="queued").app) as client:
+        response = client.post("/api/potholes/batch", json=[report(19.0, 72.8), {"latitude": "x"}])
+        assert response.status_code == 202
+        ticket = response.json()["ticket"]
+        assert [r["status"] for r in response.json()["results"]] == ["queued", "error"]
+        single = client.post("/api/potholes", json=report(19.5, 73.0))
+        assert single.status_code == 202
+
+        for _ in range(100):
+            status = client.get(f"/api/ingest/{ticket}").json()
+            if status["status"] != "pending":
+                break
+            client.portal.call(asyncio.sleep, 0.01)
+        assert status["status"] == "success" and status["results"][0]["matched"] is False
+        assert client.get("/api/ingest/unknown").status_code == 404
+    # Shutdown flushes whatever is still queued
+    with TestClient(make_app().app) as client:
+        assert len(client.get("/api/potholes").json()) == 2
+
+
+def test_commit_durability_answers_with_ids(make_app):
+    from fastapi.testclient import TestClient
+    with TestClient(make_app(INGEST_MODE="queued", INGEST_DURABILITY="commit").app) as client:
+        body = client.post("/api/potholes", json=report()).json()
+        assert body["status"] == "success" and body["id"] == client.get("/api/potholes").json()[0]["id"]
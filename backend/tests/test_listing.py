@@ -0,0 +1,40 @@
+from conftest import report
+
+
+def seed(main, client, n=25):
+    client.post("/api/potholes/batch", json=[report(19.0 + i * 0.001, 72.8, depth=i) for i in range(n)])
+    # Spread detection times so the keyset has ties and distinct times alike
+    main.db.write_sync(lambda conn: conn.execute(
+        "UPDATE potholes SET detected_at = datetime('2024-01-01', '+' || (id / 2) || ' hours')"))
+
+
+def test_cursor_pages_cover_every_row_once_newest_first(main, client):
+    seed(main, client)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/potholes", params=params)
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert len(seen) == 25 and len({p["id"] for p in seen}) == 25
+    keys = [(p["detected_at"], p["id"]) for p in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_filters_and_projection(main, client):
+    seed(main, client)
+    deep = client.get("/api/potholes", params={"min_depth": 20, "fields": "id,depth"}).json()
+
+    assert sorted(p["depth"] for p in deep) == [20, 21, 22, 23, 24]
+    assert all(set(p) == {"id", "depth"} for p in deep)
+    assert client.get("/api/potholes", params={"fields": "id,nope"}).status_code == 400
+    assert client.get("/api/potholes", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_out_of_range_times_are_400(client):
+    for value in ("inf", "nan", "1e30", "-1e20", "not a date"):
+        for url in ("/api/potholes", "/api/stats", "/api/export"):
+            assert client.get(url, params={"since": value}).status_code == 400, (url, value)
@@ -0,0 +1,29 @@
+import metrics
+from conftest import report
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(("read",), value)
+    registry.counter("ops_total", "Ops", fn=lambda: 7)
+    lines = registry.render().splitlines()
+    assert 'op_seconds_bucket{op="read",le="0.1"} 1' in lines
+    assert 'op_seconds_bucket{op="read",le="1.0"} 2' in lines
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 3' in lines
+    assert 'op_seconds_count{op="read"} 3' in lines
+    assert "ops_total 7" in lines
+
+
+def test_requests_are_labelled_by_route_template(client):
+    pothole = client.post("/api/potholes", json=report()).json()["id"]
+    client.get(f"/api/potholes/{pothole}/observations")
+    client.get(f"/api/potholes/{pothole + 1}/observations")
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    route = 'method="GET",route="/api/potholes/{pothole_id}/observations",status="200"'
+    assert f"pothole_http_request_duration_seconds_count{{{route}}} 2" in text
+    assert f"/api/potholes/{pothole}/observations" not in text
+    assert 'pothole_db_call_duration_seconds_count{mode="write",query="_ingest_reports"} 1' in text
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+import geo
+import migrations
+import rollups
+import tiles
+
+# potholes as the app created it before versioned migrations
+LEGACY_SCHEMA = """
+CREATE TABLE potholes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude REAL, longitude REAL, depth REAL, length REAL DEFAULT 0, width REAL DEFAULT 0,
+    severity_level TEXT, image_url TEXT, status TEXT DEFAULT 'Red',
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, repaired_at TIMESTAMP NULL
+)
+"""
+
+
+def test_fresh_database_gets_every_version_once(tmp_path):
+    path = tmp_path / "fresh.db"
+    versions = [v for v, _, _ in migrations.MIGRATIONS]
+    assert migrations.migrate(path) == versions
+    assert migrations.migrate(path) == []
+    conn = sqlite3.connect(path)
+    assert migrations.current_version(conn) == versions[-1]
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO potholes (latitude, longitude, depth, severity_level, status) VALUES (?, ?, ?, ?, ?)",
+                     [(19.0, 72.8, 4.0, "Moderate", "Red"), (19.1, 72.9, 8.0, "Critical", "Green")])
+    conn.commit()
+    conn.close()
+
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT latitude, longitude, cell, tile FROM potholes ORDER BY id").fetchall()
+    assert [r[2:4] for r in rows] == [(geo.cell_key(lat, lon), tiles.tile_key(lat, lon)) for lat, lon, *_ in rows]
+    assert conn.execute("SELECT COUNT(*) FROM potholes_rtree").fetchone()[0] == 2
+    assert conn.execute("SELECT count FROM tile_cells WHERE z = 0").fetchone()[0] == 2
+    stats = rollups.read_stats(conn, "2000-01-01", "2100-01-01", 10)
+    assert stats["total"]["count"] == 2 and stats["total"]["max_depth"] == 8.0
+
+
+def test_listing_queries_use_their_indexes(tmp_path):
+    path = tmp_path / "plans.db"
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+
+    def plan(sql):
+        return " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql))
+
+    by_status = plan("SELECT id FROM potholes WHERE status = 'Red' ORDER BY detected_at DESC, id DESC LIMIT 10")
+    assert "idx_potholes_status_detected" in by_status and "TEMP B-TREE" not in by_status
+    assert "TEMP B-TREE" not in plan("SELECT id FROM potholes ORDER BY detected_at DESC, id DESC LIMIT 10")
+
+
+def test_newer_schema_is_refused(tmp_path):
+    path = tmp_path / "newer.db"
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO schema_version (version, description) VALUES (999, 'from the future')")
+    conn.commit()
+    with pytest.raises(RuntimeError, match="newer"):
+        migrations.migrate(path)
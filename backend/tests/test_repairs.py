@@ -0,0 +1,54 @@
+import listing
+import repairs
+from conftest import report
+
+
+def new_potholes(client, n):
+    body = client.post("/api/potholes/batch", json=[report(19.0 + i * 0.01, 72.8) for i in range(n)]).json()
+    return [r["id"] for r in body["results"]]
+
+
+def test_repair_stamps_and_reopening_clears_repaired_at(client):
+    [pothole] = new_potholes(client, 1)
+    started = client.patch(f"/api/potholes/{pothole}", json={"status": "Yellow", "actor": "crew 4"}).json()
+    assert started["status"] == "Yellow" and started["repaired_at"] is None
+    repaired = client.patch(f"/api/potholes/{pothole}", json={"status": "Green", "note": "patched"}).json()
+    assert repaired["status"] == "Green" and repaired["repaired_at"]
+    assert client.patch(f"/api/potholes/{pothole}", json={"status": "Red"}).json()["repaired_at"] is None
+
+    history = client.get(f"/api/potholes/{pothole}/history").json()
+    assert [(h["from_status"], h["to_status"]) for h in history] == [
+        ("Red", "Yellow"), ("Yellow", "Green"), ("Green", "Red")]
+    assert history[0]["actor"] == "crew 4" and history[1]["note"] == "patched"
+
+
+def test_bulk_change_is_all_or_nothing(client):
+    ids = new_potholes(client, 3)
+    client.patch(f"/api/potholes/{ids[0]}", json={"status": "Green"})
+
+    # Green -> Yellow is not a transition: nothing moves
+    refused = client.post("/api/potholes/status", json={"ids": ids, "status": "Yellow"})
+    assert refused.status_code == 409
+    assert refused.json()["detail"]["errors"] == [{"id": ids[0], "error": "Green -> Yellow is not allowed"}]
+    assert {p["status"] for p in client.get("/api/potholes", params={"status": "Yellow"}).json()} == set()
+
+    done = client.post("/api/potholes/status", json={"ids": ids + [ids[1]], "status": "Green"}).json()
+    assert (done["changed"], done["unchanged"], done["ids"]) == (2, 1, ids[1:])
+    assert len(client.get("/api/potholes", params={"open": "true"}).json()) == 0
+
+
+def test_unknown_ids_are_404(client):
+    assert client.patch("/api/potholes/12345", json={"status": "Green"}).status_code == 404
+    assert client.post("/api/potholes/status", json={"ids": [12345], "status": "Green"}).status_code == 404
+
+
+def test_rows_for_more_ids_than_one_query_binds(client, main, monkeypatch):
+    ids = new_potholes(client, 5)
+    monkeypatch.setattr(listing, "_CHUNK", 2)
+    monkeypatch.setattr(repairs, "_CHUNK", 2)
+
+    rows = main.db.read_sync(listing.fetch_by_ids, ids[::-1] + [ids[0], 12345])
+    assert [r["id"] for r in rows] == ids
+    done = client.post("/api/potholes/status", json={"ids": ids, "status": "Yellow"}).json()
+    assert done["changed"] == 5
+    assert {p["status"] for p in client.get("/api/potholes").json()} == {"Yellow"}
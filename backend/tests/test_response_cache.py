@@ -0,0 +1,70 @@
+from conftest import report
+
+EAST = "72.79,18.99,72.81,19.01"
+WEST = "73.09,19.49,73.11,19.51"
+
+
+def test_repeat_listing_is_served_from_cache(main, client):
+    client.post("/api/potholes", json=report(19.0, 72.8))
+    first = client.get("/api/potholes", params={"bbox": EAST, "limit": 10})
+    # Same query, parameters in another order
+    again = client.get("/api/potholes", params={"limit": 10, "bbox": EAST})
+    assert again.content == first.content and again.headers["ETag"] == first.headers["ETag"]
+    assert main.response_cache.hits == 1
+    assert client.get("/api/potholes", params={"bbox": EAST, "limit": 10},
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_a_write_drops_only_the_listings_it_touches(main, client):
+    client.post("/api/potholes", json=report(19.0, 72.8))
+    client.post("/api/potholes", json=report(19.5, 73.1))
+    east = client.get("/api/potholes", params={"bbox": EAST}).headers["ETag"]
+    west = client.get("/api/potholes", params={"bbox": WEST}).headers["ETag"]
+    near = client.get("/api/potholes", params={"near": "19.5,73.1", "k": 1}).json()
+
+    client.post("/api/potholes", json=report(19.001, 72.8))
+    assert main.response_cache.invalidations == 1
+    assert client.get("/api/potholes", params={"bbox": WEST}).headers["ETag"] == west
+    assert client.get("/api/potholes", params={"near": "19.5,73.1", "k": 1}).json() == near
+    fresh = client.get("/api/potholes", params={"bbox": EAST})
+    assert fresh.headers["ETag"] != east and len(fresh.json()) == 2
+
+    client.patch(f"/api/potholes/{near[0]['id']}", json={"status": "Yellow"})
+    assert client.get("/api/potholes", params={"bbox": WEST}).json()[0]["status"] == "Yellow"
+    stats = client.get("/api/cache/stats").json()["responses"]
+    # The near query covered the repaired pothole too
+    assert stats["entries"] == 2 and stats["hits"] == 2
+
+
+class Scope:
+    def __init__(self, bbox):
+        self.bbox = bbox
+        self.checked = 0
+
+    def bounds(self):
+        return self.bbox
+
+    def affected(self, row, op):
+        self.checked += 1
+        return True
+
+
+def row(lat, lon):
+    return {"id": 1, "latitude": lat, "longitude": lon}
+
+
+def test_writes_only_check_the_entries_near_them():
+    from cache import ResponseCache
+    cache = ResponseCache(max_checks=100)
+    here, elsewhere, everywhere = Scope((72.79, 18.99, 72.81, 19.01)), Scope((73.09, 19.49, 73.11, 19.51)), Scope(None)
+    for key, scope in (("here", here), ("elsewhere", elsewhere), ("everywhere", everywhere)):
+        cache.put(key, [], scope, cache.generation)
+
+    cache.invalidate("insert", [row(19.0, 72.8)])
+    assert (here.checked, elsewhere.checked, everywhere.checked) == (1, 0, 1)
+    assert len(cache) == 1 and cache.get("elsewhere") is not None
+
+    # More checks than max_checks: everything goes without looking
+    cache.put("everywhere", [], everywhere, cache.generation)
+    cache.invalidate("insert", [row(19.5, 73.1 + i * 1e-4) for i in range(60)])
+    assert len(cache) == 0 and cache.stats()["flushes"] == 1 and elsewhere.checked == 0
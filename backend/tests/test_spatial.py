@@ -0,0 +1,87 @@
+import math
+import random
+
+import pytest
+
+import geo
+import listing
+from conftest import report
+
+
+@pytest.fixture
+def city(client):
+    """200 potholes around one point, 20 m to 2 km away, inserted in one batch."""
+    rng = random.Random(1)
+    items = [report(19.0 + rng.uniform(-0.02, 0.02), 72.8 + rng.uniform(-0.02, 0.02)) for _ in range(200)]
+    client.post("/api/potholes/batch", json=items)
+    return client
+
+
+def in_box(p, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return min_lat <= p["latitude"] <= max_lat and min_lon <= p["longitude"] <= max_lon
+
+
+def test_bbox_returns_only_points_inside_newest_first(city):
+    bbox = (72.79, 18.99, 72.81, 19.01)
+    everything = city.get("/api/potholes", params={"limit": 1000}).json()
+    inside = city.get("/api/potholes", params={"bbox": ",".join(map(str, bbox)), "limit": 1000}).json()
+
+    assert inside and [p["id"] for p in inside] == [p["id"] for p in everything if in_box(p, bbox)]
+
+
+@pytest.mark.parametrize("match_cost", [0.001, 1e9])
+def test_rtree_and_index_walk_agree(city, main, monkeypatch, match_cost):
+    # A tiny cost makes every box look sparse (R*Tree), a huge one dense (index walk)
+    bbox = (72.785, 18.985, 72.815, 19.015)
+    expected = main.db.read_sync(listing.list_page, {}, 1000)[0]
+    expected = [p["id"] for p in expected if in_box(p, bbox)]
+    monkeypatch.setattr(listing, "RTREE_MATCH_COST", match_cost)
+
+    pages, cursor = [], None
+    while True:
+        items, cursor = main.db.read_sync(listing.list_page, {}, 7, cursor and listing.decode_cursor(cursor),
+                                          None, bbox)
+        pages += [p["id"] for p in items]
+        if cursor is None:
+            break
+    assert pages == expected
+
+
+def test_near_returns_k_closest_by_distance(city):
+    point = (19.003, 72.797)
+    everything = city.get("/api/potholes", params={"limit": 1000}).json()
+    closest = sorted(everything, key=lambda p: geo.haversine_m(*point, p["latitude"], p["longitude"]))[:5]
+    near = city.get("/api/potholes", params={"near": f"{point[0]},{point[1]}", "k": 5}).json()
+
+    assert [p["id"] for p in near] == [p["id"] for p in closest]
+    assert [p["distance_m"] for p in near] == sorted(p["distance_m"] for p in near)
+
+
+def destination(lat, lon, bearing_deg, distance_m):
+    """Point distance_m from (lat, lon) along bearing_deg on haversine_m's sphere."""
+    d, b, p1 = distance_m / geo.EARTH_RADIUS_M, math.radians(bearing_deg), math.radians(lat)
+    p2 = math.asin(math.sin(p1) * math.cos(d) + math.cos(p1) * math.sin(d) * math.cos(b))
+    dl = math.atan2(math.sin(b) * math.sin(d) * math.cos(p1), math.cos(d) - math.sin(p1) * math.sin(p2))
+    return math.degrees(p2), lon + math.degrees(dl)
+
+
+def test_box_around_holds_the_whole_circle():
+    rng = random.Random(3)
+    for _ in range(2000):
+        lat, lon = rng.uniform(-89, 89), rng.uniform(-170, 170)
+        radius = rng.choice((3.0, 100.0, 5000.0, 500000.0))
+        p = destination(lat, lon, rng.uniform(0, 360), radius * 0.99999)
+        assert geo.haversine_m(lat, lon, *p) <= radius
+        min_lon, min_lat, max_lon, max_lat = geo.box_around(lat, lon, radius)
+        assert min_lat <= p[0] <= max_lat and (min_lon <= p[1] <= max_lon or p[1] > 180 or p[1] < -180)
+
+
+def test_near_finds_a_point_on_the_edge_of_the_first_box(client):
+    # Due north just inside the first 100 m search, and a farther one in the box's corner
+    point = (19.0, 72.8)
+    edge, corner = destination(*point, 0, 99.95), destination(*point, 45, 99.98)
+    client.post("/api/potholes/batch", json=[report(*corner), report(*edge)])
+    near = client.get("/api/potholes", params={"near": f"{point[0]},{point[1]}", "k": 1}).json()
+
+    assert [p["distance_m"] for p in near] == [99.95]
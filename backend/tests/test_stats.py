@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+import rollups
+from conftest import report
+
+
+def raw_stats(conn):
+    rows = conn.execute("SELECT status, COUNT(*), AVG(depth), MAX(depth) FROM potholes GROUP BY status")
+    return {status: (count, avg, max_depth) for status, count, avg, max_depth in rows}
+
+
+def summaries(stats):
+    return [(name, [(i["count"], pytest.approx(i["avg_depth"], abs=0.01), i["max_depth"]) for i in items])
+            for name, items in sorted(stats.items()) if name != "total"]
+
+
+def test_rollups_follow_inserts_updates_and_observations(main, client):
+    rng = random.Random(5)
+    reports = [report(19.0 + rng.random() * 0.2, 72.8 + rng.random() * 0.2, depth=round(rng.uniform(1, 15), 1))
+               for _ in range(60)]
+    ids = [r["id"] for r in client.post("/api/potholes/batch", json=reports).json()["results"]]
+    client.post("/api/potholes/status", json={"ids": ids[:10], "status": "Green"})
+    client.post("/api/potholes/status", json={"ids": ids[10:20], "status": "Yellow"})
+    # A deeper repeat detection raises the pothole's depth
+    client.post("/api/potholes", json={**reports[30], "depth": 40.0})
+
+    stats = client.get("/api/stats", params={"areas": 5}).json()
+    by_status = {s["status"]: (s["count"], s["avg_depth"], s["max_depth"]) for s in stats["by_status"]}
+    raw = main.db.read_sync(raw_stats)
+    assert by_status == {status: (count, pytest.approx(avg, abs=0.01), max_depth)
+                         for status, (count, avg, max_depth) in raw.items()}
+    assert stats["total"]["count"] == 60 and stats["total"]["max_depth"] == 40.0
+    assert len(stats["by_area"]) == 5
+
+    # Incremental state equals a rebuild from scratch
+    before = main.db.read_sync(rollups.read_stats, "2000-01-01", "2100-01-01", 100)
+    main.db.write_sync(rollups.rebuild)
+    assert summaries(main.db.read_sync(rollups.read_stats, "2000-01-01", "2100-01-01", 100)) == summaries(before)
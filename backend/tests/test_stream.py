@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+from events import EventHub
+
+
+def frames(sub):
+    out = []
+    while not sub.queue.empty():
+        frame = sub.queue.get_nowait()
+        out.append(frame if frame is None else json.loads(frame.decode().split("data: ", 1)[1]))
+    return out
+
+
+def test_published_rows_reach_subscribers_in_their_bbox():
+    async def run():
+        hub = EventHub(queue_size=8)
+        everywhere, mumbai = hub.subscribe(), hub.subscribe(bbox=(72.7, 18.8, 73.1, 19.3))
+        hub.publish_potholes("insert", [{"id": 1, "latitude": 19.0, "longitude": 72.9},
+                                        {"id": 2, "latitude": 28.6, "longitude": 77.2}])
+        return frames(everywhere), frames(mumbai)
+
+    everywhere, mumbai = asyncio.run(run())
+    assert [f["pothole"]["id"] for f in everywhere] == [1, 2]
+    assert [(f["op"], f["pothole"]["id"]) for f in mumbai] == [("insert", 1)]
+
+
+def test_slow_subscriber_is_evicted_not_buffered():
+    async def run():
+        hub = EventHub(queue_size=2)
+        slow = hub.subscribe()
+        hub.publish_potholes("update", [{"id": i, "latitude": 19.0, "longitude": 72.9} for i in range(3)])
+        return hub, slow
+
+    hub, slow = asyncio.run(run())
+    assert slow.evicted and hub.evictions == 1 and len(hub) == 0
+    # The queue only holds the sentinel that makes the stream send `evicted` and close
+    assert frames(slow) == [None]
+
+
+def test_subscriber_limit():
+    hub = EventHub(max_subscribers=1)
+    assert hub.subscribe() is not None
+    assert hub.subscribe() is None
+
+
+def test_stream_starts_with_ready_seq():
+    async def run():
+        hub = EventHub()
+        stream = hub.stream(hub.subscribe(), ready={"seq": 7})
+        first = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return hub, first
+
+    hub, (connected, ready) = asyncio.run(run())
+    assert connected == b": connected\n\n" and ready == b'event: ready\ndata: {"seq":7}\n\n'
+    assert len(hub) == 0
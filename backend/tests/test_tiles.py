@@ -0,0 +1,59 @@
+import random
+
+import tiles
+from conftest import report
+
+
+def tile_url(z, lat=19.0, lon=72.8):
+    x, y = tiles.tile_for(lat, lon, z)
+    return f"/tiles/{z}/{x}/{y}"
+
+
+def test_cells_stay_equal_to_a_rebuild(main, client):
+    rng = random.Random(2)
+    reports = [report(19.0 + rng.gauss(0, 0.01), 72.8 + rng.gauss(0, 0.01), depth=rng.uniform(1, 20))
+               for _ in range(300)]
+    ids = [r["id"] for r in client.post("/api/potholes/batch", json=reports).json()["results"]]
+    client.post("/api/potholes/status", json={"ids": ids[:50], "status": "Yellow"})
+    client.post("/api/potholes/status", json={"ids": ids[:20], "status": "Green"})
+    main.db.write_sync(lambda conn: conn.execute("DELETE FROM potholes WHERE id IN (SELECT id FROM potholes LIMIT 30)"))
+
+    def cells(conn):
+        return sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                      for row in conn.execute("SELECT * FROM tile_cells"))
+
+    incremental = main.db.read_sync(cells)
+    main.db.write_sync(tiles.rebuild)
+    assert incremental == main.db.read_sync(cells)
+
+
+def test_tile_counts_match_the_rows_at_every_zoom(client):
+    client.post("/api/potholes/batch", json=[report(19.0 + i * 0.003, 72.8 + i * 0.002) for i in range(40)])
+    points = [(p["latitude"], p["longitude"]) for p in client.get("/api/potholes").json()]
+    for z in (3, 10, 14, 15, 18):
+        tile = client.get(tile_url(z)).json()
+        x, y = tiles.tile_for(19.0, 72.8, z)
+        inside = sum(1 for lat, lon in points if tiles.tile_for(lat, lon, z) == (x, y))
+        assert tile["count"] == inside == sum(c["count"] for c in tile["clusters"]), z
+        assert len(tile["clusters"]) <= tiles.GRID ** 2
+
+
+def test_writes_patch_cached_tiles(main, client):
+    first = client.post("/api/potholes", json=report(19.0, 72.8, depth=9.0)).json()["id"]
+    cached = client.get(tile_url(10))
+    assert cached.json()["count"] == 1
+    assert client.get(tile_url(10), headers={"If-None-Match": cached.headers["ETag"]}).status_code == 304
+
+    client.post("/api/potholes", json=report(19.0005, 72.8005, depth=4.0))
+    client.patch(f"/api/potholes/{first}", json={"status": "Green"})
+    tile = client.get(tile_url(10), headers={"If-None-Match": cached.headers["ETag"]})
+    assert tile.status_code == 200 and main.tile_cache.patches == 1
+    clusters = tile.json()["clusters"]
+    assert sum(c["count"] for c in clusters) == 2 and max(c["max_depth"] for c in clusters) == 9.0
+    assert sum(c["status"]["Green"] for c in clusters) == 1
+
+    main.db.write_sync(lambda conn: conn.execute("DELETE FROM potholes WHERE id = ?", (first,)))
+    main.tile_cache.mark_point(19.0, 72.8)
+    clusters = client.get(tile_url(10)).json()["clusters"]
+    [cluster] = clusters
+    assert cluster["count"] == 1 and cluster["max_depth"] == 4.0 and main.tile_cache.patches == 2
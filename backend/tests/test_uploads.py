@@ -0,0 +1,37 @@
+from conftest import report
+
+
+def upload(client, data=b"jpeg bytes", **params):
+    return client.post("/api/upload_image", params=params, content=data, headers={"Content-Type": "image/jpeg"})
+
+
+def test_upload_matches_its_report_by_event_id(client):
+    pothole = client.post("/api/potholes", json=report(event_id="ev1")).json()["id"]
+    body = upload(client, event_id="ev1").json()
+    assert body["pothole_id"] == pothole and body["matched_by"] == "event_id"
+    assert client.get(body["url"]).content == b"jpeg bytes"
+    assert client.get("/api/potholes").json()[0]["image_url"] == body["url"]
+
+
+def test_upload_without_coordinates_or_event_id_stays_pending(client):
+    client.post("/api/potholes", json=report())
+    body = upload(client).json()
+    assert body["pothole_id"] is None and body["matched_by"] is None
+    assert client.get("/api/potholes").json()[0]["image_url"] is None
+
+
+def test_image_uploaded_first_is_claimed_by_its_report(client):
+    early = upload(client, event_id="ev2").json()
+    nearby = upload(client, b"other bytes", lat=19.0, lon=72.8).json()
+    assert early["pothole_id"] is None and nearby["pothole_id"] is None
+    with_event = client.post("/api/potholes", json=report(event_id="ev2")).json()["id"]
+    by_place = client.post("/api/potholes", json=report(19.0001, 72.8)).json()["id"]
+    images = {p["id"]: p["image_url"] for p in client.get("/api/potholes").json()}
+    assert images == {with_event: early["url"], by_place: nearby["url"]}
+
+
+def test_upload_size_is_capped(make_app):
+    from fastapi.testclient import TestClient
+    with TestClient(make_app(MAX_UPLOAD_BYTES=1024).app) as client:
+        assert upload(client, b"x" * 2048).status_code == 413
+        assert upload(client, b"x" * 1024).status_code == 200
@@ -0,0 +1,361 @@
+"""
+Zoom-aware cluster tiles for the dashboard map (/tiles/{z}/{x}/{y}).
+
+Tiles use the standard slippy-map (Web Mercator) z/x/y scheme. Each tile is a
+JSON document of clusters: the potholes inside the tile are bucketed into a
+GRID x GRID raster and every non-empty bucket reports its count, centroid and
+depth/severity/status aggregates. From CLUSTER_MAX_ZOOM up, buckets are small
+enough that the dashboard switches to individual markers.
+
+Below CLUSTER_MAX_ZOOM the buckets are the tiles GRID_BITS zoom levels down, and
+`tile_cells` holds their aggregates for every zoom: each pothole stores the key
+of its CELL_ZOOM tile (`potholes.tile`, see tile_key()) and triggers add it to
+and remove it from its cell at every level inside the transaction of the write,
+like rollups.py does for the statistics. A tile reads at most GRID x GRID rows
+whatever the number of potholes under it. Tiles from CLUSTER_MAX_ZOOM up cover
+a few streets and are aggregated from the rows through the R*Tree.
+
+Encoded tiles are kept in an in-memory LRU. A write does not drop them: it
+marks the pothole's cell dirty in the cached tile of each zoom, and the next
+request re-reads just those cells (read_cells) and patches the tile.
+`python tiles.py [db]` rebuilds the cells, e.g. after a backfill that did not
+set potholes.tile.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+MAX_ZOOM = 20
+CLUSTER_MAX_ZOOM = 15
+GRID_BITS = 3
+GRID = 2 ** GRID_BITS
+# Zoom of the finest cells: the buckets of a CLUSTER_MAX_ZOOM - 1 tile
+CELL_ZOOM = CLUSTER_MAX_ZOOM - 1 + GRID_BITS
+CELL_MASK = 2 ** CELL_ZOOM - 1
+
+
+def tile_bounds(z, x, y):
+    """(min_lon, min_lat, max_lon, max_lat) of a tile."""
+    n = 2 ** z
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tile_for(lat, lon, z):
+    """(x, y) of the tile containing a point at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_key(lat, lon):
+    """potholes.tile: x and y of the CELL_ZOOM tile containing a point, in one integer."""
+    if lat is None or lon is None:
+        return None
+    x, y = tile_for(lat, lon, CELL_ZOOM)
+    return x << CELL_ZOOM | y
+
+
+def cell_of(key, z):
+    """(cx, cy) of the bucket holding a tile_key() in a zoom z tile: the zoom z + GRID_BITS tile."""
+    shift = CELL_ZOOM - GRID_BITS - z
+    return (key >> CELL_ZOOM) >> shift, (key & CELL_MASK) >> shift
+
+
+CELL_COLUMNS = ("count", "lat_sum", "lon_sum", "depth_sum", "depth_max",
+                "minor", "moderate", "critical", "red", "yellow", "green")
+SEVERITIES = ("Minor", "Moderate", "Critical")
+STATUSES = ("Red", "Yellow", "Green")
+# The cluster zoom levels as a table of one column, `column1`
+LEVELS = "(VALUES " + ", ".join(f"({z})" for z in range(CLUSTER_MAX_ZOOM)) + ")"
+
+
+def _cell_sql(r, z="column1"):
+    """SQL for (cx, cy) of row reference r's cell at zoom z (cell_of() in SQL)."""
+    shift = CELL_ZOOM - GRID_BITS - z if isinstance(z, int) else f"({CELL_ZOOM - GRID_BITS} - {z})"
+    return f"({r}tile >> {CELL_ZOOM}) >> {shift}", f"({r}tile & {CELL_MASK}) >> {shift}"
+
+
+def _values(r):
+    """One pothole's contribution to each of CELL_COLUMNS after count."""
+    return ([f"{r}latitude", f"{r}longitude", f"COALESCE({r}depth, 0)", f"COALESCE({r}depth, 0)"]
+            + [f"({r}severity_level IS '{s}')" for s in SEVERITIES] + [f"({r}status IS '{s}')" for s in STATUSES])
+
+
+def _add():
+    cx, cy = _cell_sql("new.")
+    sums = ", ".join(f"{c} = {c} + excluded.{c}" for c in CELL_COLUMNS if c != "depth_max")
+    return f"""
+        INSERT INTO tile_cells (z, cx, cy, {", ".join(CELL_COLUMNS)})
+        SELECT column1, {cx}, {cy}, 1, {", ".join(_values("new."))} FROM {LEVELS} WHERE new.tile IS NOT NULL
+        ON CONFLICT (z, cx, cy) DO UPDATE SET {sums}, depth_max = MAX(depth_max, excluded.depth_max);"""
+
+
+def _remove(moved=None):
+    """
+    Take the old row out of its cells. A cell maximum held by the row is re-read
+    finest first: from the index on (tile, depth) for the CELL_ZOOM cell, then as
+    the maximum of the four cells below for each coarser one, unless the
+    condition `moved` says the row kept its place and depth.
+    """
+    cx, cy = _cell_sql("old.")
+    diffs = ", ".join(f"{c} = {c} - {v}" for c, v in zip(CELL_COLUMNS, ["1"] + _values("old.")) if c != "depth_max")
+    cells = f"(z, cx, cy) IN (SELECT column1, {cx}, {cy} FROM {LEVELS})"
+    sql = f"""
+        UPDATE tile_cells SET {diffs} WHERE old.tile IS NOT NULL AND {cells};
+        DELETE FROM tile_cells WHERE old.tile IS NOT NULL AND {cells} AND count <= 0;"""
+    for z in reversed(range(CLUSTER_MAX_ZOOM)):
+        cx, cy = _cell_sql("old.", z)
+        if z == CLUSTER_MAX_ZOOM - 1:
+            lookup = "SELECT MAX(depth) FROM potholes WHERE tile = old.tile"
+        else:
+            lookup = (f"SELECT MAX(depth_max) FROM tile_cells WHERE z = {z + 1} "
+                      f"AND cx BETWEEN ({cx}) * 2 AND ({cx}) * 2 + 1 AND cy BETWEEN ({cy}) * 2 AND ({cy}) * 2 + 1")
+        sql += f"""
+        UPDATE tile_cells SET depth_max = COALESCE(({lookup}), 0)
+        WHERE z = {z} AND cx = {cx} AND cy = {cy} AND depth_max <= COALESCE(old.depth, 0){f" AND {moved}" if moved else ""};"""
+    return sql
+
+
+def schema_sql():
+    """Cell table, the (tile, depth) index and the triggers; every statement is IF NOT EXISTS."""
+    changed = " OR ".join(f"old.{c} IS NOT new.{c}"
+                          for c in ("tile", "latitude", "longitude", "depth", "severity_level", "status"))
+    return f"""
+    CREATE TABLE IF NOT EXISTS tile_cells (
+        z INTEGER NOT NULL,
+        cx INTEGER NOT NULL,
+        cy INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        lat_sum REAL NOT NULL,
+        lon_sum REAL NOT NULL,
+        depth_sum REAL NOT NULL,
+        depth_max REAL NOT NULL,
+        minor INTEGER NOT NULL,
+        moderate INTEGER NOT NULL,
+        critical INTEGER NOT NULL,
+        red INTEGER NOT NULL,
+        yellow INTEGER NOT NULL,
+        green INTEGER NOT NULL,
+        PRIMARY KEY (z, cx, cy)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_potholes_tile_depth ON potholes(tile, depth) WHERE tile IS NOT NULL;
+    CREATE TRIGGER IF NOT EXISTS tile_cells_ai AFTER INSERT ON potholes BEGIN{_add()}
+    END;
+    CREATE TRIGGER IF NOT EXISTS tile_cells_au AFTER UPDATE OF tile, latitude, longitude, depth, severity_level, status
+    ON potholes WHEN {changed} BEGIN{_remove("(old.tile IS NOT new.tile OR old.depth IS NOT new.depth)")}{_add()}
+    END;
+    CREATE TRIGGER IF NOT EXISTS tile_cells_ad AFTER DELETE ON potholes BEGIN{_remove()}
+    END;"""
+
+
+def rebuild(conn):
+    """Recompute tile_cells from the potholes table, in the caller's transaction."""
+    cx, cy = _cell_sql("")
+    totals = ", ".join(f"TOTAL({v})" if i < 3 else (f"MAX({v})" if i == 3 else f"SUM({v})")
+                       for i, v in enumerate(_values("")))
+    conn.execute("DELETE FROM tile_cells")
+    conn.execute(f"""
+    INSERT INTO tile_cells (z, cx, cy, {", ".join(CELL_COLUMNS)})
+    SELECT column1, {cx}, {cy}, COUNT(*), {totals}
+    FROM potholes, {LEVELS} WHERE tile IS NOT NULL GROUP BY 1, 2, 3
+    """)
+
+
+def _cluster(cx, cy, count, lat_sum, lon_sum, depth_sum, depth_max, *counts):
+    return {
+        "cell": [cx, cy],
+        "count": count,
+        "latitude": lat_sum / count,
+        "longitude": lon_sum / count,
+        "max_depth": depth_max,
+        "avg_depth": round(depth_sum / count, 2),
+        "severity": dict(zip(SEVERITIES, counts[:3])),
+        "status": dict(zip(STATUSES, counts[3:])),
+    }
+
+
+CELLS_SQL = f"SELECT cx, cy, {', '.join(CELL_COLUMNS)} FROM tile_cells WHERE z = ?"
+
+
+def read_cells(conn, z, cells):
+    """Clusters of the given (cx, cy) cells of zoom z tiles; empty cells map to None."""
+    marks = ", ".join("(?, ?)" for _ in cells)
+    found = {(r[0], r[1]): _cluster(*r) for r in conn.execute(
+        f"{CELLS_SQL} AND (cx, cy) IN (VALUES {marks})", (z, *(v for cell in cells for v in cell)))}
+    return {cell: found.get(cell) for cell in cells}
+
+
+CLUSTER_SQL = """
+SELECT CAST((p.longitude - ?) / ? AS INTEGER) AS gx,
+       CAST((? - p.latitude) / ? AS INTEGER) AS gy,
+       COUNT(*), AVG(p.latitude), AVG(p.longitude), MAX(p.depth), AVG(p.depth),
+       SUM(p.severity_level = 'Minor'), SUM(p.severity_level = 'Moderate'),
+       SUM(p.severity_level = 'Critical'),
+       SUM(p.status = 'Red'), SUM(p.status = 'Yellow'), SUM(p.status = 'Green')
+FROM potholes_rtree r JOIN potholes p ON p.id = r.id
+WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+  AND p.latitude >= ? AND p.latitude < ? AND p.longitude >= ? AND p.longitude < ?
+GROUP BY gx, gy
+"""
+
+
+def _clusters_from_rows(conn, z, x, y):
+    """Aggregate the rows of a small tile. Latitude is bucketed linearly inside the tile."""
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    step_lon = (max_lon - min_lon) / GRID
+    step_lat = (max_lat - min_lat) / GRID
+    rows = conn.execute(CLUSTER_SQL, (min_lon, step_lon, max_lat, step_lat,
+                                      min_lat, max_lat, min_lon, max_lon,
+                                      min_lat, max_lat, min_lon, max_lon)).fetchall()
+    clusters = []
+    for row in rows:
+        clusters.append({
+            "count": row[2],
+            "latitude": row[3],
+            "longitude": row[4],
+            "max_depth": row[5],
+            "avg_depth": round(row[6], 2) if row[6] is not None else None,
+            "severity": {"Minor": row[7], "Moderate": row[8], "Critical": row[9]},
+            "status": {"Red": row[10], "Yellow": row[11], "Green": row[12]},
+        })
+    return clusters
+
+
+def _tile(z, x, y, clusters):
+    return {"z": z, "x": x, "y": y, "count": sum(c["count"] for c in clusters), "clusters": clusters}
+
+
+def build_tile(conn, z, x, y):
+    """One tile: GRID x GRID rows of tile_cells below CLUSTER_MAX_ZOOM, the potholes themselves from there on."""
+    if z >= CLUSTER_MAX_ZOOM:
+        return _tile(z, x, y, _clusters_from_rows(conn, z, x, y))
+    columns = [(x << GRID_BITS) + i for i in range(GRID)]
+    rows = conn.execute(f"{CELLS_SQL} AND cx IN ({', '.join('?' * GRID)}) AND cy >= ? AND cy < ?",
+                        (z, *columns, y << GRID_BITS, (y + 1) << GRID_BITS)).fetchall()
+    return _tile(z, x, y, [_cluster(*row) for row in rows])
+
+
+class _Entry:
+    __slots__ = ("tile", "body", "etag", "dirty")
+
+    def __init__(self, tile):
+        self.tile = tile
+        self.dirty = {}  # (cx, cy) -> mark of the latest write in the cell
+        self.encode()
+
+    def encode(self):
+        self.body = json.dumps(self.tile, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+
+
+class TileCache:
+    """
+    Thread-safe LRU of encoded tiles: (z, x, y) -> (body bytes, etag).
+
+    mark_point() flags the cell a written pothole falls in, in every cached
+    cluster tile around it, and drops the row-built tiles from CLUSTER_MAX_ZOOM
+    up. get() hands out the flagged cells with the tile, and patch() splices in
+    their re-read clusters.
+    """
+
+    def __init__(self, max_tiles=4096):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._marks = 0
+        self.hits = 0
+        self.misses = 0
+        self.patches = 0
+        # Bumped by every write; a tile built across a write is served but not cached
+        self.generation = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._tiles), "max_entries": self.max_tiles,
+                    "hits": self.hits, "misses": self.misses, "patches": self.patches}
+
+    def get(self, key):
+        """(body, etag, dirty) of a cached tile, or None; dirty maps the cells to re-read to their marks."""
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return entry.body, entry.etag, dict(entry.dirty)
+
+    def put(self, key, tile, generation):
+        entry = _Entry(tile)
+        with self._lock:
+            if generation != self.generation:
+                return entry.body, entry.etag
+            self._tiles[key] = entry
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return entry.body, entry.etag
+
+    def patch(self, key, clusters, dirty):
+        """
+        Replace the cells read for dirty (a get() result) with clusters, a
+        read_cells() result. A cell written again meanwhile stays dirty. Returns
+        (body, etag), or None when the tile has left the cache.
+        """
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None:
+                return None
+            by_cell = {tuple(c["cell"]): c for c in entry.tile["clusters"]}
+            for cell, cluster in clusters.items():
+                if entry.dirty.get(cell) == dirty[cell]:
+                    del entry.dirty[cell]
+                if cluster is None:
+                    by_cell.pop(cell, None)
+                else:
+                    by_cell[cell] = cluster
+            z, x, y = key
+            entry.tile = _tile(z, x, y, [by_cell[cell] for cell in sorted(by_cell)])
+            entry.encode()
+            self.patches += 1
+            return entry.body, entry.etag
+
+    def mark_point(self, lat, lon):
+        """A pothole at (lat, lon) was written: flag its cell in the cached tiles, drop the row-built ones."""
+        if lat is None or lon is None:
+            return
+        key = tile_key(lat, lon)
+        with self._lock:
+            self.generation += 1
+            self._marks += 1
+            for z in range(MAX_ZOOM + 1):
+                tile = (z,) + tile_for(lat, lon, z)
+                if z >= CLUSTER_MAX_ZOOM:
+                    self._tiles.pop(tile, None)
+                    continue
+                entry = self._tiles.get(tile)
+                if entry is not None:
+                    entry.dirty[cell_of(key, z)] = self._marks
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("POTHOLE_DB", "pothole_system.db")
+    conn = sqlite3.connect(path)
+    conn.create_function("pothole_tile", 2, tile_key, deterministic=True)
+    with conn:
+        conn.execute("UPDATE potholes SET tile = pothole_tile(latitude, longitude) WHERE tile IS NULL")
+        rebuild(conn)
+    count = conn.execute("SELECT COUNT(*) FROM tile_cells").fetchone()[0]
+    print(f"{path}: rebuilt {count} tile cells")
+    conn.close()
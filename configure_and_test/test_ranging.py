@@ -0,0 +1,85 @@
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'raspi')))
+
+import types
+
+# Stands in for a pigpio daemon on this machine: only the real backend may open it
+opened = []
+sys.modules["pigpio"] = types.SimpleNamespace(pi=lambda *a: opened.append(a) or types.SimpleNamespace(connected=False))
+
+import hal
+import simulate
+from ranging import RangeFilter, NO_ECHO, OUT_OF_RANGE, OUTLIER, SPARSE
+from sensors import Ultrasonic, PING_HZ
+from simulation import Scenario, SimBackend
+
+# Runs anywhere (no GPIO needed): the interrupt driven HC-SR04 ranging engine
+# on the simulated backend, and its median filter on made up readings.
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}: {name}{' - ' + detail if detail else ''}")
+    return ok
+
+def ranging(scenario, seconds=10):
+    backend = hal.use(SimBackend(scenario))
+    sensor = Ultrasonic(17, 18)
+    backend.clock.sleep(seconds)
+    sensor.stop()
+    return sensor, sensor.read_samples()
+
+if __name__ == "__main__":
+    print("=== Ultrasonic ranging engine ===")
+    results = []
+
+    # Filter: a 2 ping spike is dropped, a step passes after window // 2 + 1 pings
+    f = RangeFilter(window=5)
+    readings = [3.0] * 5 + [150.0, 150.0] + [3.0] * 3 + [9.0] * 5
+    out = [f.update(i, r) for i, r in enumerate(readings)]
+    results.append(check("median drops a short spike", all(s.cm == 3.0 for s in out[5:10]),
+                         f"{[s.cm for s in out[5:10]]}"))
+    results.append(check("spike flagged as outlier", bool(out[5].flags & OUTLIER and out[6].flags & OUTLIER)))
+    results.append(check("step passes after 3 pings", [s.cm for s in out[10:13]] == [3.0, 3.0, 9.0]))
+    f = RangeFilter(window=5)
+    flags = [f.update(i, r).flags for i, r in enumerate([None, 500.0, 3.0, 3.0, 3.0])]
+    results.append(check("no echo / out of range / sparse flags",
+                         flags[0] == NO_ECHO | SPARSE and flags[1] == OUT_OF_RANGE | SPARSE and flags[4] == 0,
+                         f"{flags}"))
+
+    # The simulated backend times pings and echoes itself, even where a pigpio daemon runs
+    sensor, samples = ranging(Scenario(ground_cm=10.0), seconds=1)
+    results.append(check("sim backend never opens pigpio", not opened and len(samples) > 0, f"{len(samples)} pings"))
+
+    # Engine on a flat road
+    sensor, samples = ranging(Scenario(ground_cm=10.0, noise_cm=0.2))
+    rate = (len(samples) - 1) / ((samples[-1].t - samples[0].t) / 1e9)
+    intervals = [(b.t - a.t) / 1e6 for a, b in zip(samples, samples[1:])]
+    settled = [s for s in samples if s.cm is not None]
+    error = max(abs(s.cm - 10.0) for s in settled)
+    results.append(check("fixed ping cadence", abs(rate - PING_HZ) < 0.5 and max(intervals) - min(intervals) < 0.1,
+                         f"{rate:.1f} Hz, interval {min(intervals):.2f}-{max(intervals):.2f} ms"))
+    results.append(check("distance from edge timestamps", error < 0.6, f"max error {error:.2f} cm"))
+
+    # Stray echoes are filtered out
+    sensor, samples = ranging(Scenario(ground_cm=10.0, spike_rate=0.05, seed=2))
+    spikes = sum(1 for s in samples if s.flags & OUTLIER)
+    error = max(abs(s.cm - 10.0) for s in samples if s.cm is not None)
+    results.append(check("stray echoes flagged and filtered", spikes > 0 and error < 0.6,
+                         f"{spikes} outliers, max error {error:.2f} cm"))
+
+    # Nothing in range: 38 ms no-echo pulses keep the sensor busy, no distance is published
+    sensor, samples = ranging(Scenario(ground_cm=600.0), seconds=2)
+    results.append(check("out of range reports no distance",
+                         samples and all(s.cm is None and s.flags & OUT_OF_RANGE for s in samples)
+                         and sensor.stats["busy"] > 0, f"{len(samples)} pings, {sensor.stats}"))
+
+    # Whole system on a road with stray echoes
+    drive = simulate.run(Scenario.random(10, seed=7, spike_rate=0.05), quiet=True)
+    results.append(check("drive with stray echoes: every pothole, no extra reports",
+                         drive["detected"] == drive["potholes"] == len(drive["reports"]),
+                         f"{drive['detected']}/{drive['potholes']} potholes, {len(drive['reports'])} reports"))
+
+    print(f"\n{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,112 @@
+import sys
+import os
+import random
+import time
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'raspi')))
+
+from softuart import SoftUartReceiver, frame_edges
+
+# Runs anywhere (no GPIO needed): feeds the Software Serial receiver a simulated
+# RX line, with timing jitter, and checks what it decodes.
+
+def send(rx, data, baud, t0=0, gap_bits=0.0, jitter=0.0, seed=1):
+    """Feed data as RX edges; jitter is the max edge displacement in bit times."""
+    rng = random.Random(seed)
+    bit_ns = 1e9 / baud
+    edges, end = frame_edges(data, baud, t0, gap_bits)
+    for level, t in edges:
+        rx.edge(level, t + int(rng.uniform(-jitter, jitter) * bit_ns))
+    # The line then stays idle, as a pigpio watchdog would report
+    rx.idle(end + int(2 * bit_ns))
+    return end
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}: {name}{' - ' + detail if detail else ''}")
+    return ok
+
+def check_decode(baud, jitter):
+    rx = SoftUartReceiver(baud, timeout=0.5)
+    data = bytes(range(256)) + bytes([0x59, 0x59, 0x2C, 0x01, 0, 0, 0, 0, 0xDF])
+    send(rx, data, baud, gap_bits=0.3, jitter=jitter)
+    got = rx.read(len(data))
+    rx.close()
+    return check(f"{baud} baud, jitter +/-{jitter:.0%} bit", got == data and rx.stats["framing_errors"] == 0,
+                 f"{len(got)}/{len(data)} bytes, {rx.stats}")
+
+def check_last_byte_flush():
+    # The final byte of a burst ends on a high stop bit with no edge after it:
+    # the receiver stamps its own idle mark from the clock of the edges
+    rx = SoftUartReceiver(9600, timeout=0.5, clock=time.monotonic_ns)
+    edges, _ = frame_edges(b"OK\xff", 9600, time.monotonic_ns())
+    for level, t in edges:
+        rx.edge(level, t)
+    got = rx.read(3)
+    rx.close()
+    return check("last byte completed on idle line", got == b"OK\xff", repr(got))
+
+def check_framing_error():
+    rx = SoftUartReceiver(9600, timeout=0.2)
+    bit_ns = 1e9 / 9600
+    # 0x00 with its stop bit held low (a break), then a good byte
+    rx.edge(0, 0)
+    rx.edge(1, int(12 * bit_ns))
+    send(rx, b"A", 9600, t0=int(20 * bit_ns))
+    got = rx.read(2)
+    rx.close()
+    return check("framing error counted and skipped", got == b"A" and rx.stats["framing_errors"] == 1,
+                 f"{got!r} {rx.stats}")
+
+def check_glitch():
+    rx = SoftUartReceiver(9600, timeout=0.2)
+    bit_ns = 1e9 / 9600
+    rx.edge(0, 0)
+    rx.edge(1, int(0.2 * bit_ns))
+    send(rx, b"B", 9600, t0=int(5 * bit_ns))
+    got = rx.read(2)
+    rx.close()
+    return check("glitch ignored", got == b"B" and rx.stats["glitches"] == 1, f"{got!r} {rx.stats}")
+
+def check_overrun_and_timeout():
+    rx = SoftUartReceiver(115200, capacity=16, timeout=0.1)
+    send(rx, bytes(40), 115200)
+    time.sleep(0.05)
+    waiting = rx.in_waiting
+    start = time.monotonic()
+    got = rx.read(20)
+    waited = time.monotonic() - start
+    rx.close()
+    return check("ring buffer bounded, read times out", waiting == 16 and len(got) == 16
+                 and rx.stats["overruns"] == 24 and 0.08 < waited < 0.5,
+                 f"in_waiting={waiting}, read {len(got)} in {waited * 1000:.0f} ms, {rx.stats}")
+
+def check_throughput():
+    # Decode cost per byte, to compare with the line rate
+    rx = SoftUartReceiver(115200, capacity=1 << 20, timeout=5)
+    data = bytes(random.Random(2).randrange(256) for _ in range(100000))
+    start = time.perf_counter()
+    send(rx, data, 115200)
+    got = rx.read(len(data))
+    elapsed = time.perf_counter() - start
+    rx.close()
+    return check("100 kB decoded", got == data,
+                 f"{len(data) / elapsed:.0f} bytes/s decoded vs {115200 // 10} bytes/s line rate")
+
+if __name__ == "__main__":
+    print("=== Software Serial receiver (simulated RX line) ===")
+    results = [
+        check_decode(9600, 0.0),
+        check_decode(9600, 0.2),
+        check_decode(115200, 0.0),
+        # pigpiod -s 1 timestamps are within 1 us, about 12% of a bit at 115200;
+        # centre sampling tolerates up to 25% per edge
+        check_decode(115200, 0.2),
+        check_last_byte_flush(),
+        check_framing_error(),
+        check_glitch(),
+        check_overrun_and_timeout(),
+        check_throughput(),
+    ]
+    print(f"\n{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
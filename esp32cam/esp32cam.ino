@@ -27,6 +27,7 @@ const char* serverUrl = "http://195.35.23.26/api/upload_image";
 
 void setup() {
   Serial.begin(115200);
+  Serial.setTimeout(50); // Event id follows the 'c' command immediately, if at all
   
   // WiFi Setup
   WiFi.begin(ssid, password);
@@ -76,7 +77,7 @@ void setup() {
   }
 }
 
-void captureAndUpload() {
+void captureAndUpload(const String& eventId) {
   camera_fb_t * fb = esp_camera_fb_get();
   if(!fb) return;
   
@@ -84,6 +85,8 @@ void captureAndUpload() {
     HTTPClient http;
     http.begin(serverUrl);
     http.addHeader("Content-Type", "image/jpeg");
+    // Lets the backend attach the photo to the report of the same detection
+    if (eventId.length() > 0) http.addHeader("X-Event-Id", eventId);
     int code = http.POST(fb->buf, fb->len);
     if(code > 0) Serial.printf("Upload Status: %d\n", code);
     http.end();
@@ -96,8 +99,11 @@ void loop() {
   if (Serial.available()) {
     char cmd = Serial.read();
     if (cmd == 'c' || cmd == 'C') {
+        // Optional event id from the Pi: "c<event_id>\n"
+        String eventId = Serial.readStringUntil('\n');
+        eventId.trim();
         Serial.println("Taking Picture...");
-        captureAndUpload();
+        captureAndUpload(eventId);
     }
   }
   delay(50);
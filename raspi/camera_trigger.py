@@ -1,17 +1,15 @@
-import RPi.GPIO as GPIO
-import time
-import serial
-from communication import SoftwareSerial
+import hal
 
 class ESP32Trigger:
     def __init__(self, port=None, tx=None, rx=None, baud=115200):
         self.ser = None
         self.is_serial = False
+        hw = hal.backend()
         
         # 1. Try specified hardware port (if any)
         if port:
             try:
-                self.ser = serial.Serial(port, baud, timeout=1)
+                self.ser = hw.serial(port, baud, timeout=1)
                 self.is_serial = True
                 print(f"ESP32-CAM: Connected on {port}")
             except:
@@ -22,7 +20,7 @@ class ESP32Trigger:
             ports = ["/dev/ttyUSB0", "/dev/ttyUSB1", "/dev/ttyACM0"]
             for p in ports:
                 try:
-                    self.ser = serial.Serial(p, baud, timeout=1)
+                    self.ser = hw.serial(p, baud, timeout=1)
                     self.is_serial = True
                     print(f"ESP32-CAM: Connected via USB Auto-Detect on {p}")
                     break
@@ -33,7 +31,7 @@ class ESP32Trigger:
         if not self.ser and tx is not None and rx is not None:
             print(f"ESP32-CAM: Using Software Serial on TX={tx}, RX={rx}")
             try:
-                self.ser = SoftwareSerial(tx, rx, baud)
+                self.ser = hw.soft_serial(tx, rx, baud)
                 self.is_serial = True # Treat as serial
             except Exception as e:
                 print(f"ESP32-CAM: SW Serial Init Failed: {e}")
@@ -42,14 +40,14 @@ class ESP32Trigger:
         if not self.ser:
             print("ESP32-CAM: Formatting error - No valid connection method found.")
 
-    def trigger(self):
+    def trigger(self, event_id=None):
         if self.ser:
             try:
                 print("Sending CAPTURE command to ESP32...")
-                if isinstance(self.ser, serial.Serial):
-                    self.ser.write(b'c')
-                else:
-                    self.ser.write(b'c') # Software Serial handle bytes or string? Updated SoftwareSerial handles bytes.
+                # 'c' alone still works with older firmware; 'c<event_id>\n' lets the
+                # ESP32 tag its upload so the backend can match it to our report.
+                cmd = b'c' + (event_id.encode() + b'\n' if event_id else b'')
+                self.ser.write(cmd)
             except Exception as e:
                 print(f"ESP32 Trigger Error: {e}")
         else:
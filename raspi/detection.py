@@ -0,0 +1,71 @@
+"""
+Pothole detection state machine, separate from sensor I/O so the same logic
+runs on the car (PotholeSystem.detection_loop) and on recorded traces
+(replay.py).
+"""
+from collections import namedtuple
+
+# Configuration
+POTHOLE_THRESHOLD = 5.0 # cm
+SEVERITY_LEVELS = {"Minor": (1, 3), "Moderate": (3, 7), "Critical": (7, 100)}
+ESTIMATED_SPEED_CM_S = 30.0 # avg speed of toy car
+MAX_VALID_DEPTH = 200.0 # cm; readings outside [0, this] are noise
+DEBOUNCE_S = 1.0 # ignore the road this long after a pothole ends
+
+# start/end: seconds on the clock the samples were taken with
+Pothole = namedtuple("Pothole", "start end max_depth length severity")
+
+
+def calculate_severity(depth, levels=SEVERITY_LEVELS):
+    for level, (low, high) in levels.items():
+        if low <= depth < high: return level
+    return "Critical"
+
+
+class PotholeDetector:
+    """
+    Feed depth samples with update(t, depth). A sample deeper than threshold
+    starts a pothole ("start" is returned, time to trigger the camera); the
+    first one shallower again ends it ("end" is returned and the pothole is in
+    self.last). The length is estimated from the duration at speed_cm_s.
+    Samples within debounce_s after a pothole ends are ignored.
+    """
+
+    def __init__(self, threshold=POTHOLE_THRESHOLD, speed_cm_s=ESTIMATED_SPEED_CM_S, severity_levels=SEVERITY_LEVELS,
+                 debounce_s=DEBOUNCE_S):
+        self.threshold = threshold
+        self.speed_cm_s = speed_cm_s
+        self.severity_levels = severity_levels
+        self.debounce_s = debounce_s
+        self.in_pothole = False
+        self.start_time = 0
+        self.max_depth = 0
+        self.quiet_until = None
+        self.last = None
+
+    def update(self, t, depth):
+        # Filter noise, and the road right after the last hole
+        if depth > MAX_VALID_DEPTH or depth < 0:
+            return None
+        if self.quiet_until is not None and t < self.quiet_until:
+            return None
+
+        if not self.in_pothole:
+            if depth > self.threshold:
+                self.in_pothole = True
+                self.start_time = t
+                self.max_depth = depth
+                return "start"
+        else:
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+            # Out of the pothole once the depth returns to normal
+            if depth < self.threshold:
+                self.in_pothole = False
+                length = (t - self.start_time) * self.speed_cm_s
+                self.last = Pothole(self.start_time, t, self.max_depth, length,
+                                    calculate_severity(self.max_depth, self.severity_levels))
+                self.quiet_until = t + self.debounce_s
+                return "end"
+        return None
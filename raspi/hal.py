@@ -0,0 +1,168 @@
+"""
+Hardware abstraction for the raspi stack.
+
+Everything that touches the vehicle goes through a backend:
+
+    gpio                  RPi.GPIO compatible (setup, output, input, PWM, events, ...)
+    clock                 time(), monotonic(), monotonic_ns(), sleep(), spawn()
+    serial(port, baud)    pyserial compatible port on a hardware UART / USB adapter
+    soft_serial(tx, rx)   the same on two GPIO pins (communication.SoftwareSerial)
+    gps(uart)             adafruit_gps.GPS compatible NMEA receiver on a port
+    edge_callback(pin, fn)  fn(level, t_ns) on both edges of an input pin
+    pulse(pin, us)        a pulse of us microseconds on an output pin
+
+RealBackend wraps the actual libraries and only imports them when created, so
+the modules using the HAL import anywhere. simulation.SimBackend replaces them
+with scripted devices on a virtual clock (see simulate.py).
+
+The backend is picked by POTHOLE_HAL ("real" by default, or "sim") the first
+time backend() is called, or installed explicitly with use() before the
+sensors are created; each device object keeps the backend it was built with.
+Threads that sleep must be started with clock.spawn() so the simulated clock
+can schedule them.
+"""
+import os
+import threading
+import time
+
+
+class SystemClock:
+    """Wall and monotonic time of the machine."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def advance(self, seconds):
+        pass  # real code costs real time by itself
+
+    def spawn(self, target, name=None):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def event(self):
+        return threading.Event()
+
+
+class TickUnwrap:
+    """pigpio ticks are microseconds in 32 bits (wrap every ~72 min): extend them to ns."""
+
+    def __init__(self):
+        self.last = None
+        self.offset = 0
+
+    def __call__(self, tick):
+        if self.last is not None and tick < self.last:
+            self.offset += 1 << 32
+        self.last = tick
+        return (tick + self.offset) * 1000
+
+
+class GPIOEdges:
+    """
+    edge_callback() on RPi.GPIO (or a stand-in): edges are stamped on clock in the
+    callback and level is None, as reading the pin there is too late for short
+    pulses. cancel() removes the callback.
+    """
+
+    def __init__(self, gpio, clock, pin, callback):
+        self.gpio = gpio
+        self.pin = pin
+        gpio.add_event_detect(pin, gpio.BOTH, callback=lambda channel: callback(None, clock.monotonic_ns()))
+
+    def cancel(self):
+        self.gpio.remove_event_detect(self.pin)
+
+
+def gpio_pulse(gpio, clock, pin, us, level=1):
+    """pulse() timed by sleeping on clock between two writes."""
+    gpio.output(pin, level)
+    clock.sleep(us / 1e6)
+    gpio.output(pin, not level)
+
+
+class RealBackend:
+    name = "real"
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.gpio = GPIO
+        self.clock = SystemClock()
+        self._pi = None  # pigpio daemon connection, False once known to be unavailable
+
+    def _daemon(self):
+        if self._pi is None:
+            self._pi = False
+            try:
+                import pigpio
+                pi = pigpio.pi()
+                if pi.connected:
+                    self._pi = pi
+            except ImportError:
+                pass
+        return self._pi or None
+
+    def edge_callback(self, pin, callback):
+        """
+        Call callback(level, t_ns) on both edges of input pin; returns an object
+        whose cancel() stops it. With the pigpio daemon t is its DMA sample tick
+        and level the new one, otherwise see GPIOEdges.
+        """
+        pi = self._daemon()
+        if pi is None:
+            return GPIOEdges(self.gpio, self.clock, pin, callback)
+        import pigpio
+        unwrap = TickUnwrap()
+        return pi.callback(pin, pigpio.EITHER_EDGE, lambda gpio, level, tick: callback(level, unwrap(tick)))
+
+    def pulse(self, pin, us, level=1):
+        """Drive output pin to level for us microseconds (timed by the pigpio daemon when running)."""
+        pi = self._daemon()
+        if pi is None:
+            gpio_pulse(self.gpio, self.clock, pin, us, level)
+        else:
+            pi.gpio_trigger(pin, us, level)
+
+    def serial(self, port, baud, timeout=1.0):
+        import serial
+        return serial.Serial(port, baud, timeout=timeout)
+
+    def soft_serial(self, tx, rx, baud=9600, timeout=1.0):
+        from communication import SoftwareSerial
+        return SoftwareSerial(tx, rx, baud, timeout=timeout)
+
+    def gps(self, uart):
+        import adafruit_gps
+        return adafruit_gps.GPS(uart, debug=False)
+
+
+_backend = None
+
+
+def use(backend):
+    """Install backend for every device created from now on; returns it."""
+    global _backend
+    _backend = backend
+    return backend
+
+
+def backend():
+    if _backend is None:
+        kind = os.environ.get("POTHOLE_HAL", "real")
+        if kind == "sim":
+            from simulation import SimBackend
+            use(SimBackend())
+        elif kind == "real":
+            use(RealBackend())
+        else:
+            raise ValueError(f"Unknown POTHOLE_HAL {kind!r} (use real or sim)")
+    return _backend
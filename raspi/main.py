@@ -1,27 +1,36 @@
+import math
+import os
 import time
-import serial
-import RPi.GPIO as GPIO
-import threading
+import uuid
+import hal
+from detection import PotholeDetector, calculate_severity
 from sensors import LiDAR, Ultrasonic, GPS
-from communication import GSM, SoftwareSerial
+from communication import GSM
 from camera_trigger import ESP32Trigger
 from motors import MotorController
+from scheduler import FixedRate, Worker
+from sensortrace import TraceWriter, EVENT_START, EVENT_END
 
-# Configuration
-POTHOLE_THRESHOLD = 5.0 # cm
-SEVERITY_LEVELS = {"Minor": (1, 3), "Moderate": (3, 7), "Critical": (7, 100)}
-ESTIMATED_SPEED_CM_S = 30.0 # avg speed of toy car
+DETECTION_HZ = 50 # passes over the queued ultrasonic samples (sensors.PING_HZ sets the sample rate)
+REPORT_DRAIN_S = 30 # on shutdown, wait this long for queued reports to be sent
 
 class PotholeSystem:
-    def __init__(self):
-        GPIO.setmode(GPIO.BCM)
+    def __init__(self, trace=None):
+        # Real hardware unless POTHOLE_HAL=sim or another backend was installed (see hal.py)
+        hw = hal.backend()
+        self.hw = hw
+        self.clock = hw.clock
+        hw.gpio.setwarnings(False)
+        hw.gpio.setmode(hw.gpio.BCM)
+        # Optional sensortrace.TraceWriter recording every sample and event of the drive
+        self.trace = trace
         
         # Initialize Sensors (User PINOUT)
         # ultrasonic: Trig=17 (Pin 11), Echo=18 (Pin 12)
         self.ultrasonic = Ultrasonic(17, 18)
         
         # GPS: Defaults to UART0 (GPIO 14/15) which matches User Request
-        self.gps = GPS() 
+        self.gps = GPS(trace=trace) 
         
         # GSM: User defined PINS 20(RX) and 16(TX). 
         # CAUTION: Software Serial at 9600.
@@ -48,11 +57,21 @@ class PotholeSystem:
         
         self.bluetooth = None
         self.running = True
+
+        # Detection state, advanced by detection_step()
+        self.detector = PotholeDetector()
+        self.event_id = None
+        self.detection = FixedRate(self.clock, DETECTION_HZ, self.detection_step, name="detection")
+        # Slow side effects run on their own threads so detection never waits for them
+        self.camera_worker = Worker(self.clock, self.camera.trigger, name="camera", capacity=32,
+                                    overflow="drop_oldest")
+        # Reports are never dropped; any left when shutdown gives up are counted as abandoned
+        self.report_worker = Worker(self.clock, self.gsm.send_data, name="gsm")
         
         # BT Init: User defined PINS 21(RX) and 19(TX).
         print("Bluetooth: Initializing Software Serial on 19(TX), 21(RX)...")
         try:
-            self.bluetooth = SoftwareSerial(tx=19, rx=21, baud=9600)
+            self.bluetooth = hw.soft_serial(tx=19, rx=21, baud=9600)
             print("Bluetooth SoftSerial Started.")
         except Exception as e:
             print(f"Bluetooth Init Failed: {e}") 
@@ -61,7 +80,7 @@ class PotholeSystem:
         if not self.bluetooth:
             for port in ["/dev/ttyAMA2", "/dev/ttyAMA3", "/dev/rfcomm0"]:
                 try:
-                    self.bluetooth = serial.Serial(port, 9600, timeout=1)
+                    self.bluetooth = hw.serial(port, 9600, timeout=1)
                     print(f"Bluetooth connected on {port}")
                     break
                 except:
@@ -78,86 +97,98 @@ class PotholeSystem:
                     elif cmd == 'l': self.motors.left()
                     elif cmd == 'r': self.motors.right()
                     elif cmd == 's': self.motors.stop()
-                time.sleep(0.05)
+                self.clock.sleep(0.05)
             except:
                 break
 
     def detection_loop(self):
         print("Detection loop started...")
-        in_pothole = False
-        start_time = 0
-        max_depth = 0
-        
-        while self.running:
-            current_depth = self.ultrasonic.get_distance()
-            
-            # Filter noise
-            if current_depth > 200 or current_depth < 0: 
-                time.sleep(0.05)
+        # Runs on absolute deadlines (scheduler.FixedRate) until self.running is cleared
+        self.detection.run(lambda: self.running)
+
+    def detection_step(self):
+        if self.trace:
+            now = self.clock.monotonic_ns()
+            for distance, strength in self.lidar.read_frames():
+                self.trace.lidar(now, distance, strength)
+
+        # The ultrasonic pings at its own cadence; handle every sample since the last pass
+        for sample in self.ultrasonic.read_samples():
+            if self.trace:
+                self.trace.ultrasonic(sample.t, math.nan if sample.raw is None else sample.raw)
+            # No trustworthy reading (see ranging.py)
+            if sample.cm is None:
                 continue
 
-            if not in_pothole:
-                if current_depth > POTHOLE_THRESHOLD:
-                    # --- START OF POTHOLE ---
-                    in_pothole = True
-                    start_time = time.time()
-                    max_depth = current_depth
-                    print(f"Pothole Start! Initial Depth: {current_depth:.1f}cm")
-                    
-                    # 1. Trigger Camera Immediately to capture the hole
-                    self.camera.trigger()
-                    
-            else:
-                # We are IN a pothole
-                if current_depth > max_depth:
-                    max_depth = current_depth
+            event = self.detector.update(sample.t / 1e9, sample.cm)
+            if event == "start":
+                # --- START OF POTHOLE ---
+                self.event_id = uuid.uuid4().hex[:16] # Shared by the image upload and the report
+                print(f"Pothole Start! Initial Depth: {sample.cm:.1f}cm")
+                if self.trace:
+                    self.trace.event(sample.t, EVENT_START, sample.cm, 0.0, self.event_id)
                 
-                # Check if we are out of the pothole (depth returns to normal)
-                if current_depth < POTHOLE_THRESHOLD:
-                    # --- END OF POTHOLE ---
-                    in_pothole = False
-                    duration = time.time() - start_time
-                    
-                    # Calculate Dimensions
-                    length = duration * ESTIMATED_SPEED_CM_S
-                    width = 0.0 # Requires image processing, placeholder
+                # 1. Trigger Camera Immediately to capture the hole
+                self.camera_worker.submit(self.event_id)
                     
-                    print(f"Pothole End. Max Depth: {max_depth:.1f}cm, Length: {length:.1f}cm")
-                    
-                    # Get Location
-                    coords = self.gps.get_location()
-                    severity = self.calculate_severity(max_depth)
-                    
-                    # Prepare Payload including Dimensions
-                    data = {
-                        "latitude": coords['lat'],
-                        "longitude": coords['lon'],
-                        "depth": float(f"{max_depth:.2f}"),
-                        "length": float(f"{length:.2f}"),
-                        "width": 0.0, # Placeholder
-                        "severity": severity,
-                        "timestamp": time.time()
-                    }
+            elif event == "end":
+                # --- END OF POTHOLE ---
+                pothole = self.detector.last
+                width = 0.0 # Requires image processing, placeholder
+                
+                print(f"Pothole End. Max Depth: {pothole.max_depth:.1f}cm, Length: {pothole.length:.1f}cm")
+                if self.trace:
+                    self.trace.event(sample.t, EVENT_END, pothole.max_depth, pothole.length, self.event_id)
+                
+                # Get Location
+                coords = self.gps.get_location()
+                
+                # Prepare Payload including Dimensions
+                data = {
+                    "latitude": coords['lat'],
+                    "longitude": coords['lon'],
+                    "depth": float(f"{pothole.max_depth:.2f}"),
+                    "length": float(f"{pothole.length:.2f}"),
+                    "width": 0.0, # Placeholder
+                    "severity": pothole.severity,
+                    "timestamp": self.clock.time(),
+                    "event_id": self.event_id
+                }
+                
+                if coords['fixed']:
+                    print(f"  > Location: {coords['lat']:.5f}, {coords['lon']:.5f}")
+                else:
+                    print("  > Warning: No GPS Fix (Outdoor view needed)")
                     
-                    if coords['fixed']:
-                        print(f"  > Location: {coords['lat']:.5f}, {coords['lon']:.5f}")
-                    else:
-                        print("  > Warning: No GPS Fix (Outdoor view needed)")
-                        
-                    self.gsm.send_data(data)
-                    time.sleep(1) # Debounce next hole
+                # Sent by the GSM worker: the modem takes seconds, sampling goes on meanwhile
+                self.report_worker.submit(data)
+
+    def timing(self):
+        """Rate, overruns and jitter of the sampling loops, and the side effect queues."""
+        return {
+            "ultrasonic": {**self.ultrasonic.scheduler.stats(), **self.ultrasonic.stats},
+            "detection": self.detection.stats(),
+            "camera": self.camera_worker.stats(),
+            "gsm": self.report_worker.stats(),
+        }
 
-            time.sleep(0.05) # Sampling rate (20Hz)
+    def print_timing(self):
+        timing = self.timing()
+        for name in ("ultrasonic", "detection"):
+            t = timing[name]
+            histogram = ", ".join(f"{bucket} {count}" for bucket, count in t["jitter_us"].items() if count)
+            print(f"{name}: {t['achieved_hz']:.2f}/{t['target_hz']} Hz, {t['runs']} runs, {t['overruns']} overruns, "
+                  f"max jitter {t['max_jitter_us'] / 1000:.2f} ms [{histogram}]")
+        for name in ("camera", "gsm"):
+            w = timing[name]
+            print(f"{name}: {w['done']} done, {w['dropped']} dropped, {w['errors']} failed, "
+                  f"{w['abandoned']} abandoned, longest wait {w['max_wait_s']:.1f} s")
 
     def calculate_severity(self, depth):
-        for level, (low, high) in SEVERITY_LEVELS.items():
-            if low <= depth < high: return level
-        return "Critical"
+        return calculate_severity(depth)
 
     def run(self):
-        bt_thread = threading.Thread(target=self.bluetooth_control)
-        bt_thread.daemon = True
-        bt_thread.start()
+        self.clock.spawn(self.bluetooth_control, name="bluetooth")
         try:
             self.detection_loop()
         except KeyboardInterrupt:
@@ -165,10 +196,26 @@ class PotholeSystem:
         finally:
             self.running = False
             self.motors.stop()
+            self.ultrasonic.stop()
+            self.camera_worker.close()
+            if self.report_worker.stats()["queued"]:
+                print("Sending queued reports...")
+            self.report_worker.close(REPORT_DRAIN_S)
+            self.print_timing()
             self.gps.stop()
             self.gsm.close()
-            GPIO.cleanup()
+            if self.trace:
+                self.trace.close()
+            self.hw.gpio.cleanup()
 
 if __name__ == "__main__":
-    sys = PotholeSystem()
+    # POTHOLE_TRACE=<file or directory> records the drive for replay.py
+    trace = None
+    trace_path = os.environ.get("POTHOLE_TRACE")
+    if trace_path:
+        if os.path.isdir(trace_path):
+            trace_path = os.path.join(trace_path, time.strftime("drive-%Y%m%d-%H%M%S.ptr"))
+        trace = TraceWriter(trace_path, hal.backend().clock)
+        print(f"Recording sensor trace to {trace_path}")
+    sys = PotholeSystem(trace=trace)
     sys.run()
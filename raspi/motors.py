@@ -1,5 +1,4 @@
-import RPi.GPIO as GPIO
-import time
+import hal
 
 class MotorController:
     def __init__(self, in1=5, in2=6, in3=17, in4=26, ena=20, enb=21):
@@ -11,6 +10,7 @@ class MotorController:
         self.in4 = in4
         self.ena = ena
         self.enb = enb
+        self.gpio = GPIO = hal.backend().gpio
         
         GPIO.setup(self.in1, GPIO.OUT)
         GPIO.setup(self.in2, GPIO.OUT)
@@ -25,30 +25,35 @@ class MotorController:
         self.p2.start(75)
 
     def forward(self):
+        GPIO = self.gpio
         GPIO.output(self.in1, GPIO.HIGH)
         GPIO.output(self.in2, GPIO.LOW)
         GPIO.output(self.in3, GPIO.HIGH)
         GPIO.output(self.in4, GPIO.LOW)
 
     def backward(self):
+        GPIO = self.gpio
         GPIO.output(self.in1, GPIO.LOW)
         GPIO.output(self.in2, GPIO.HIGH)
         GPIO.output(self.in3, GPIO.LOW)
         GPIO.output(self.in4, GPIO.HIGH)
 
     def left(self):
+        GPIO = self.gpio
         GPIO.output(self.in1, GPIO.LOW)
         GPIO.output(self.in2, GPIO.HIGH)
         GPIO.output(self.in3, GPIO.HIGH)
         GPIO.output(self.in4, GPIO.LOW)
 
     def right(self):
+        GPIO = self.gpio
         GPIO.output(self.in1, GPIO.HIGH)
         GPIO.output(self.in2, GPIO.LOW)
         GPIO.output(self.in3, GPIO.LOW)
         GPIO.output(self.in4, GPIO.HIGH)
 
     def stop(self):
+        GPIO = self.gpio
         GPIO.output(self.in1, GPIO.LOW)
         GPIO.output(self.in2, GPIO.LOW)
         GPIO.output(self.in3, GPIO.LOW)
@@ -0,0 +1,82 @@
+"""
+HC-SR04 sample filtering, separate from the GPIO side in sensors.Ultrasonic so
+replay.py can run recorded raw readings through exactly what the car runs.
+
+Every ping becomes a Sample: t is the ping time (ns on the recording clock),
+raw the distance its echo measured (None without an echo), cm the median of
+the accepted readings among the last `window` pings and flags what went wrong:
+
+    NO_ECHO       no complete echo before the next ping was due
+    OUT_OF_RANGE  echo outside the sensor's 2-400 cm (e.g. nothing reflected)
+    OUTLIER       raw differs from the median by > outlier_cm; not accepted
+    SPARSE        fewer than half of the window is accepted; cm is None
+
+Outliers stay out of the median, so stray echoes do not move it however many
+land in one window. A real step (the edge of a pothole) shows up as a run of
+outliers that agree with each other: after window // 2 + 1 of them the run is
+accepted and replaces the window.
+"""
+import statistics
+from collections import deque, namedtuple
+
+SPEED_OF_SOUND_CM_S = 34300
+MIN_RANGE_CM, MAX_RANGE_CM = 2.0, 400.0
+FILTER_WINDOW = 5 # pings
+OUTLIER_CM = 3.0
+
+NO_ECHO, OUT_OF_RANGE, OUTLIER, SPARSE = 1, 2, 4, 8
+FLAG_NAMES = {NO_ECHO: "no_echo", OUT_OF_RANGE: "out_of_range", OUTLIER: "outlier", SPARSE: "sparse"}
+
+Sample = namedtuple("Sample", "t cm raw flags")
+
+
+def echo_cm(width_ns):
+    """Distance for an echo pulse width: sound travels there and back."""
+    return width_ns * 1e-9 * SPEED_OF_SOUND_CM_S / 2
+
+
+class RangeFilter:
+    """Sliding median over the last window pings; update() once per ping."""
+
+    def __init__(self, window=FILTER_WINDOW, outlier_cm=OUTLIER_CM, min_cm=MIN_RANGE_CM, max_cm=MAX_RANGE_CM):
+        self.outlier_cm = outlier_cm
+        self.min_cm = min_cm
+        self.max_cm = max_cm
+        self._window = deque(maxlen=window)  # (raw cm or None when invalid, outlier) of each ping
+        self._confirm = window // 2 + 1
+        self.counts = dict.fromkeys(FLAG_NAMES.values(), 0)
+
+    def _accepted(self):
+        return [raw for raw, outlier in self._window if raw is not None and not outlier]
+
+    def update(self, t, raw):
+        flags = 0
+        if raw is None:
+            flags = NO_ECHO
+        elif not self.min_cm <= raw <= self.max_cm:
+            flags = OUT_OF_RANGE
+        else:
+            accepted = self._accepted()
+            if len(accepted) >= self._confirm and abs(raw - statistics.median(accepted)) > self.outlier_cm:
+                flags = OUTLIER
+        self._window.append((raw if flags in (0, OUTLIER) else None, flags == OUTLIER))
+
+        if flags == OUTLIER:
+            run = list(self._window)[-self._confirm:]
+            if len(run) == self._confirm and all(outlier for _, outlier in run) and \
+                    max(r for r, _ in run) - min(r for r, _ in run) <= self.outlier_cm:
+                # The level changed: start over from the run
+                self._window.clear()
+                self._window.extend((r, False) for r, _ in run)
+                flags = 0
+
+        accepted = self._accepted()
+        cm = None
+        if len(accepted) >= self._confirm:
+            cm = statistics.median(accepted)
+        else:
+            flags |= SPARSE
+        for flag, name in FLAG_NAMES.items():
+            if flags & flag:
+                self.counts[name] += 1
+        return Sample(t, cm, raw, flags)
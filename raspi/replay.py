@@ -0,0 +1,171 @@
+"""
+Replay a recorded sensor trace through the pothole detector.
+
+    python replay.py drive.ptr [--threshold 4,5,6] [--window 5] [--labels labels.csv] [--json]
+
+Runs the trace's raw ultrasonic readings through ranging.RangeFilter and
+detection.PotholeDetector (debounce included) like the car does, once per
+threshold given (to tune without another drive), and prints:
+
+  * the detected potholes, located with the last GPS fix before each one ends
+  * sampling statistics of the recording (rate, inter-sample intervals, gaps)
+    and how many pings the filter flagged
+  * precision and recall against the ground truth: the trace's label records
+    (simulate.py --trace writes them) or a CSV of start_s,end_s[,depth_cm]
+    in seconds from the start of the trace
+  * how much faster than real time the replay ran
+
+A detection matches a labeled pothole when their intervals overlap, allowing
+MATCH_SLACK_S; every label and detection matches at most once.
+"""
+import argparse
+import bisect
+import csv
+import json
+import math
+import statistics
+import sys
+import time
+
+from detection import ESTIMATED_SPEED_CM_S, POTHOLE_THRESHOLD, PotholeDetector
+from ranging import FILTER_WINDOW, RangeFilter
+from sensortrace import EVENT, EVENT_END, GPS, LABEL, ULTRASONIC, TraceReader
+
+MATCH_SLACK_S = 0.5
+
+
+def load_labels(path):
+    """(start s, end s) rows of a ground truth CSV; a header row is skipped."""
+    labels = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                labels.append((float(row[0]), float(row[1])))
+            except (ValueError, IndexError):
+                continue
+    return labels
+
+
+def sampling_stats(times):
+    """Rate and inter-sample interval statistics of sample times in seconds."""
+    if len(times) < 2:
+        return {"samples": len(times)}
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    ordered = sorted(intervals)
+    median = statistics.median(ordered)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        "samples": len(times),
+        "span_s": times[-1] - times[0],
+        "rate_hz": (len(times) - 1) / (times[-1] - times[0]),
+        "interval_ms": {"p50": median * 1000, "p95": pct(95), "p99": pct(99), "max": ordered[-1] * 1000},
+        "gaps": sum(1 for i in intervals if i > 2 * median),  # samples missed by more than a period
+    }
+
+
+def score(detections, labels, slack=MATCH_SLACK_S):
+    """Match (start, end) detections to labels; precision, recall and the counts."""
+    matched, used = 0, set()
+    for start, end in detections:
+        for i, (label_start, label_end) in enumerate(labels):
+            if i not in used and start <= label_end + slack and end >= label_start - slack:
+                used.add(i)
+                matched += 1
+                break
+    precision = matched / len(detections) if detections else None
+    recall = matched / len(labels) if labels else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else 0.0
+    return {"true_positives": matched, "false_positives": len(detections) - matched,
+            "false_negatives": len(labels) - matched, "precision": precision, "recall": recall, "f1": f1}
+
+
+def replay(path, thresholds=(POTHOLE_THRESHOLD,), labels=None, speed_cm_s=ESTIMATED_SPEED_CM_S,
+           window=FILTER_WINDOW):
+    """Results of replaying the trace at path once per threshold (see the module docstring)."""
+    with TraceReader(path) as reader:
+        t0 = reader.start_ns
+        samples = [(t - t0) / 1e9 for t, _ in reader.records(ULTRASONIC)]
+        raws = [None if math.isnan(cm) else cm for _, cm in reader.records(ULTRASONIC)]  # NaN: no echo
+        fixes = [((t - t0) / 1e9, lat, lon) for t, lat, lon, _, fixed in reader.records(GPS) if fixed]
+        recorded = sum(1 for record in reader.records(EVENT) if record[1] == EVENT_END)
+        if labels is None:
+            labels = [((start - t0) / 1e9, (end - t0) / 1e9) for start, end, _ in reader.records(LABEL)]
+        truncated = reader.truncated
+    fix_times = [fix[0] for fix in fixes]
+
+    runs = []
+    for threshold in thresholds:
+        started = time.perf_counter()
+        ranger = RangeFilter(window)
+        detector = PotholeDetector(threshold, speed_cm_s)
+        found = []
+        for t, raw in zip(samples, raws):
+            cm = ranger.update(t, raw).cm
+            if cm is not None and detector.update(t, cm) == "end":
+                found.append(detector.last)
+        elapsed = time.perf_counter() - started
+
+        potholes = []
+        for p in found:
+            i = bisect.bisect_right(fix_times, p.end) - 1
+            potholes.append({"start_s": p.start, "end_s": p.end, "depth": p.max_depth, "length": p.length,
+                             "severity": p.severity,
+                             "location": [fixes[i][1], fixes[i][2]] if i >= 0 else None})
+        runs.append({
+            "threshold": threshold,
+            "flagged": ranger.counts,
+            "potholes": potholes,
+            "replay_s": elapsed,
+            "speedup": (samples[-1] - samples[0]) / elapsed if len(samples) > 1 and elapsed else None,
+            "score": score([(p.start, p.end) for p in found], labels) if labels else None,
+        })
+    return {"trace": path, "truncated": truncated, "sampling": sampling_stats(samples),
+            "labels": len(labels), "recorded_reports": recorded, "runs": runs}
+
+
+def _fmt(value, spec=".3f"):
+    return "-" if value is None else format(value, spec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("trace")
+    parser.add_argument("--threshold", default=str(POTHOLE_THRESHOLD), help="cm, comma separated to compare several")
+    parser.add_argument("--speed", type=float, default=ESTIMATED_SPEED_CM_S, help="cm/s for the length estimate")
+    parser.add_argument("--window", type=int, default=FILTER_WINDOW, help="median filter length in pings")
+    parser.add_argument("--labels", help="ground truth CSV (default: label records in the trace)")
+    parser.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = parser.parse_args()
+
+    thresholds = [float(t) for t in args.threshold.split(",")]
+    result = replay(args.trace, thresholds, load_labels(args.labels) if args.labels else None, args.speed,
+                    args.window)
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        sys.exit(0)
+
+    s = result["sampling"]
+    if result["truncated"]:
+        print("warning: trace ends in an incomplete chunk (recording interrupted), read up to it")
+    if s["samples"] > 1:
+        print(f"{s['samples']} ultrasonic samples over {s['span_s']:.1f} s: {s['rate_hz']:.1f} Hz, interval "
+              f"p50 {s['interval_ms']['p50']:.1f} ms, p95 {s['interval_ms']['p95']:.1f} ms, "
+              f"p99 {s['interval_ms']['p99']:.1f} ms, max {s['interval_ms']['max']:.0f} ms, {s['gaps']} gaps")
+    flagged = result["runs"][0]["flagged"]
+    print("pings flagged: " + ", ".join(f"{count} {name}" for name, count in flagged.items()))
+    print(f"{result['labels']} labeled potholes, {result['recorded_reports']} reported during the drive")
+    for run in result["runs"]:
+        print(f"\nthreshold {run['threshold']} cm: {len(run['potholes'])} potholes, "
+              f"replayed at {_fmt(run['speedup'], '.0f')}x real time")
+        for p in run["potholes"]:
+            where = "{:.6f},{:.6f}".format(*p["location"]) if p["location"] else "no fix"
+            print(f"  {p['start_s']:8.2f}-{p['end_s']:8.2f} s  depth {p['depth']:5.1f} cm  "
+                  f"length {p['length']:5.1f} cm  {p['severity']:<8}  {where}")
+        if run["score"]:
+            sc = run["score"]
+            print(f"  precision {_fmt(sc['precision'])}  recall {_fmt(sc['recall'])}  f1 {_fmt(sc['f1'])}  "
+                  f"(tp {sc['true_positives']}, fp {sc['false_positives']}, fn {sc['false_negatives']})")
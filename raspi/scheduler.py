@@ -0,0 +1,175 @@
+"""
+Fixed-rate tasks on absolute monotonic deadlines, and workers that keep slow
+side effects (modem, camera) off the sampling path.
+
+FixedRate runs task() every period: the n-th run is due at start + n * period
+on the hal clock, so time spent in the task or oversleeping does not push the
+schedule back the way sleep(period) after the work does. A run that ends past
+the next deadline skips the missed slots (counted as overruns) and keeps the
+phase. Each interval between runs is recorded as jitter, |interval - period|,
+in a histogram with upper bounds JITTER_BUCKETS_US.
+
+Worker runs handler(item) for submitted items, in order, on its own thread;
+submit() never blocks. Both only sleep and wait on the hal clock (an idle
+worker blocks on clock.event(), not a queue.Queue the simulated clock could
+not see), so they run on the simulated backend too.
+"""
+import bisect
+import threading
+from collections import deque
+
+JITTER_BUCKETS_US = (10, 50, 100, 500, 1000, 5000, 20000)
+
+
+def _bucket_names():
+    names = [f"<={bound}us" for bound in JITTER_BUCKETS_US]
+    return names + [f">{JITTER_BUCKETS_US[-1]}us"]
+
+
+class FixedRate:
+    """task() at rate_hz; start() on a new thread or run() on the calling one."""
+
+    def __init__(self, clock, rate_hz, task, name=None):
+        self.clock = clock
+        self.rate_hz = rate_hz
+        self.period_ns = int(1e9 / rate_hz)
+        self.task = task
+        self.name = name
+        self.running = False
+        self.thread = None
+        self.runs = 0
+        self.overruns = 0
+        self.histogram = [0] * (len(JITTER_BUCKETS_US) + 1)
+        self.max_jitter_ns = 0
+        self._first = self._last = None
+
+    def start(self):
+        self.running = True
+        self.thread = self.clock.spawn(self.run, name=self.name)
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def run(self, condition=None):
+        """Run on this thread until stop(), or until condition() is false."""
+        clock = self.clock
+        self.running = True
+        due = clock.monotonic_ns()
+        while self.running and (condition is None or condition()):
+            now = clock.monotonic_ns()
+            if self._last is not None:
+                jitter = abs(now - self._last - self.period_ns)
+                self.histogram[bisect.bisect_left(JITTER_BUCKETS_US, jitter / 1000)] += 1
+                self.max_jitter_ns = max(self.max_jitter_ns, jitter)
+            else:
+                self._first = now
+            self._last = now
+            self.runs += 1
+            self.task()
+
+            due += self.period_ns
+            now = clock.monotonic_ns()
+            if due <= now:
+                missed = (now - due) // self.period_ns + 1
+                self.overruns += missed
+                due += missed * self.period_ns
+            clock.sleep((due - now) / 1e9)
+
+    @property
+    def achieved_hz(self):
+        if self.runs < 2 or self._last == self._first:
+            return 0.0
+        return (self.runs - 1) / ((self._last - self._first) / 1e9)
+
+    def stats(self):
+        return {
+            "target_hz": self.rate_hz,
+            "achieved_hz": self.achieved_hz,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "max_jitter_us": self.max_jitter_ns / 1000,
+            "jitter_us": dict(zip(_bucket_names(), self.histogram)),
+        }
+
+
+class Worker:
+    """
+    Queue of side effects for handler, run one at a time on their own thread,
+    which waits on a clock event while there is nothing to do.
+
+    capacity=None keeps every item. With a capacity, a submit() past it drops
+    the new item, or with overflow="drop_oldest" the longest waiting one (a
+    late camera trigger is worth less than a fresh one). Either way it is
+    counted. Items still queued when close() gives up are counted as abandoned.
+    """
+
+    def __init__(self, clock, handler, name=None, capacity=None, overflow="drop_newest"):
+        if overflow not in ("drop_newest", "drop_oldest"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.clock = clock
+        self.handler = handler
+        self.name = name
+        self.capacity = capacity
+        self.overflow = overflow
+        self.running = True
+        self.done = self.dropped = self.errors = self.abandoned = 0
+        self.max_queued = 0
+        self.max_wait_s = 0.0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wake = clock.event()
+        self._finished = clock.event()
+        self.thread = clock.spawn(self._loop, name=name)
+
+    def submit(self, item):
+        with self._lock:
+            if self.capacity is not None and len(self._queue) >= self.capacity:
+                self.dropped += 1
+                if self.overflow == "drop_newest":
+                    print(f"{self.name}: queue full, dropped an item")
+                    return False
+                self._queue.popleft()
+                print(f"{self.name}: queue full, dropped the oldest item")
+            self._queue.append((self.clock.monotonic(), item))
+            self.max_queued = max(self.max_queued, len(self._queue))
+        self._wake.set()
+        return True
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            with self._lock:
+                entry = self._queue.popleft() if self._queue else None
+            if entry is None:
+                if not self.running:
+                    break
+                self._wake.wait()
+                continue
+            submitted, item = entry
+            self.max_wait_s = max(self.max_wait_s, self.clock.monotonic() - submitted)
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"{self.name}: {e}")
+            self.done += 1
+        self._finished.set()
+
+    def close(self, timeout=30.0):
+        """Stop taking work and wait up to timeout for what is queued to finish."""
+        self.running = False
+        self._wake.set()
+        if self._finished.wait(timeout):
+            return True
+        with self._lock:
+            left = len(self._queue)
+            self.abandoned += left
+            self._queue.clear()
+        if left:
+            print(f"{self.name}: gave up on {left} queued item(s) at shutdown")
+        return False
+
+    def stats(self):
+        return {"done": self.done, "queued": len(self._queue), "dropped": self.dropped, "errors": self.errors,
+                "abandoned": self.abandoned, "max_queued": self.max_queued, "max_wait_s": self.max_wait_s}
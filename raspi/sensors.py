@@ -1,96 +1,145 @@
-import serial
-import RPi.GPIO as GPIO
-import time
 import threading
-import adafruit_gps 
-from communication import SoftwareSerial
+from collections import deque
+import hal
+from ranging import RangeFilter, echo_cm, FILTER_WINDOW
+from scheduler import FixedRate
 
-GPIO.setwarnings(False)
+PING_HZ = 50 # ground is < 1 m away, echoes are over in a few ms
+ECHO_TIMEOUT_NS = 30_000_000 # longest echo in range (400 cm) is 23 ms
+SAMPLE_BUFFER = 1024 # samples kept for read_samples(), ~20 s at PING_HZ
 
 class LiDAR:
     def __init__(self, port="/dev/ttyS0", baud=115200, tx=None, rx=None):
         self.ser = None
         self.dist = 0
+        hw = hal.backend()
         
         if port and not (tx and rx):
             # Hardware UART
             try:
-                self.ser = serial.Serial(port, baud, timeout=1)
+                self.ser = hw.serial(port, baud, timeout=1)
             except Exception as e:
                 print(f"LiDAR init failed on {port}: {e}")
         elif tx is not None and rx is not None:
             # Software UART
-            print(f"LiDAR: Using Software Serial on TX={tx}, RX={rx} (Warning: 115200 baud on SW Serial is unstable)")
+            print(f"LiDAR: Using Software Serial on TX={tx}, RX={rx} (115200 baud needs pigpiod -s 1)")
             try:
-                self.ser = SoftwareSerial(tx, rx, baud)
+                self.ser = hw.soft_serial(tx, rx, baud)
             except Exception as e:
                 print(f"LiDAR SW Init failed: {e}")
         
-    def get_distance(self):
-        if not self.ser: return 0
+    def read_frames(self):
+        """(distance cm, strength) of every complete TF02-Pro frame received since the last call."""
+        # Frame: 59 59 Dist_L Dist_H Strength_L Strength_H Temp_L Temp_H Checksum (9 bytes).
+        # SoftwareSerial buffers in the background like a hardware UART, so both are read the same way.
+        frames = []
+        if not self.ser: return frames
         try:
-            if isinstance(self.ser, serial.Serial):
-                if self.ser.in_waiting >= 9:
-                    if self.ser.read(1) == b'\x59':
-                        if self.ser.read(1) == b'\x59':
-                            d_low = ord(self.ser.read(1))
-                            d_high = ord(self.ser.read(1))
-                            self.dist = d_low + d_high * 256
-                            return self.dist / 100.0
-            else:
-                # Software Serial Strategy
-                # We need to read 9 bytes. This is blocking and unreliable if not synced.
-                # Just try to read 9 bytes?
-                # Ideally, we should sync to 0x59 0x59.
-                # A simple parser for SW Serial:
-                byte = self.ser.read(1)
-                if byte == b'\x59':
-                    byte2 = self.ser.read(1)
-                    if byte2 == b'\x59':
-                        data = self.ser.read(7) # Read remaining 7 bytes
-                        if len(data) == 7:
-                            d_low = data[0]
-                            d_high = data[1]
-                            self.dist = d_low + d_high * 256
-                            return self.dist / 100.0
+            while self.ser.in_waiting >= 9:
+                if self.ser.read(1) != b'\x59' or self.ser.read(1) != b'\x59':
+                    continue
+                data = self.ser.read(7)
+                if len(data) == 7 and (0x59 + 0x59 + sum(data[:6])) & 0xFF == data[6]:
+                    frames.append((data[0] + data[1] * 256, data[2] + data[3] * 256))
         except Exception:
             pass
-        return 0
+        return frames
+
+    def get_distance(self):
+        """Latest distance in meters, 0 if no frame arrived since the last call."""
+        frames = self.read_frames()
+        if not frames: return 0
+        self.dist = frames[-1][0]
+        return self.dist / 100.0
 
 class Ultrasonic:
-    def __init__(self, trig, echo):
+    """
+    HC-SR04 ranging engine. A scheduler.FixedRate thread pings every 1/rate_hz s
+    on absolute deadlines and the echo pulse is timed from edge interrupts, so nothing
+    polls the echo pin: with the pigpio daemon the edges carry its DMA sample
+    ticks, with RPi.GPIO alone they are stamped in the callback. Every ping
+    becomes a ranging.Sample (median filtered cm plus quality flags) and
+    read_samples() returns those since the last call.
+    """
+    def __init__(self, trig, echo, rate_hz=PING_HZ, window=FILTER_WINDOW):
         self.trig = trig
         self.echo = echo
-        GPIO.setup(self.trig, GPIO.OUT)
-        GPIO.setup(self.echo, GPIO.IN)
+        self.hw = hw = hal.backend()
+        self.gpio = hw.gpio
+        self.clock = hw.clock
+        self.gpio.setup(self.trig, self.gpio.OUT)
+        self.gpio.setup(self.echo, self.gpio.IN)
 
-    def get_distance(self):
-        GPIO.output(self.trig, True)
-        time.sleep(0.00001)
-        GPIO.output(self.trig, False)
+        self.filter = RangeFilter(window)
+        self.stats = {"pings": 0, "busy": 0, "dropped": 0}
+        self.latest = None
+        self._lock = threading.Lock()
+        self._samples = deque()
+        self._ping_t = None # monotonic ns of the ping waiting for its echo
+        self._rise = None # echo rise on the edge clock
+        # Without a level (RPi.GPIO) edges alternate after a ping: the echo pin is low when it is sent
+        self._edges = hw.edge_callback(self.echo, self._edge)
+        self.scheduler = FixedRate(self.clock, rate_hz, self._ping, name="ultrasonic").start()
 
-        start_time = time.time()
-        stop_time = time.time()
-        timeout = time.time() + 0.1 
+    def _edge(self, level, t):
+        with self._lock:
+            if self._ping_t is None:
+                return
+            if self._rise is None:
+                if level != 0:
+                    self._rise = t
+            elif level != 1:
+                self._publish(echo_cm(t - self._rise))
 
-        while GPIO.input(self.echo) == 0:
-            start_time = time.time()
-            if start_time > timeout: return 0
+    def _publish(self, raw):
+        # Called with the lock held
+        sample = self.filter.update(self._ping_t, raw)
+        self._ping_t = self._rise = None
+        if len(self._samples) >= SAMPLE_BUFFER:
+            self._samples.popleft()
+            self.stats["dropped"] += 1
+        self._samples.append(sample)
+        self.latest = sample
 
-        while GPIO.input(self.echo) == 1:
-            stop_time = time.time()
-            if stop_time > timeout: return 0
+    def _ping(self):
+        now = self.clock.monotonic_ns()
+        with self._lock:
+            waiting = self._ping_t is not None and now - self._ping_t < ECHO_TIMEOUT_NS
+            if self._ping_t is not None and not waiting:
+                self._publish(None)
+        # The sensor ignores trig until its echo is over (38 ms when nothing reflects)
+        if waiting or self.gpio.input(self.echo):
+            self.stats["busy"] += 1
+            return
+        with self._lock:
+            self._ping_t = now
+            self.stats["pings"] += 1
+        self.hw.pulse(self.trig, 10)
 
-        time_elapsed = stop_time - start_time
-        distance = (time_elapsed * 34300) / 2
-        return distance
+    def read_samples(self):
+        """ranging.Sample of every ping since the last call, oldest first."""
+        with self._lock:
+            samples = list(self._samples)
+            self._samples.clear()
+        return samples
+
+    def get_distance(self):
+        """Latest filtered distance in cm, None without a trustworthy reading."""
+        return self.latest.cm if self.latest else None
+
+    def stop(self):
+        self.scheduler.stop()
+        self._edges.cancel()
 
 class GPS:
-    def __init__(self, port=None):
+    def __init__(self, port=None, trace=None):
         self.uart = None
+        self.trace = trace
         self.gps = None
         self.running = True
         self.latest_data = {'lat': 0.0, 'lon': 0.0, 'alt': 0.0, 'fixed': False}
+        hw = hal.backend()
+        self.clock = hw.clock
         
         # Priority: User Argument -> Standard UART0 -> Mini UART -> USB -> UART5
         potential_ports = []
@@ -99,16 +148,14 @@ class GPS:
         
         for p in potential_ports:
             try:
-                self.uart = serial.Serial(p, baudrate=9600, timeout=1)
-                self.gps = adafruit_gps.GPS(self.uart, debug=False)
+                self.uart = hw.serial(p, 9600, timeout=1)
+                self.gps = hw.gps(self.uart)
                 # PMTK config commands
                 self.gps.send_command(b"PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0")
                 self.gps.send_command(b"PMTK220,1000")
                 print(f"GPS initialized on {p}...")
                 
-                self.thread = threading.Thread(target=self._update_loop)
-                self.thread.daemon = True
-                self.thread.start()
+                self.thread = self.clock.spawn(self._update_loop, name="gps")
                 break
             except Exception as e:
                 pass
@@ -130,9 +177,12 @@ class GPS:
                     }
                 else:
                     self.latest_data['fixed'] = False
-                time.sleep(0.1) 
+                if self.trace:
+                    d = self.latest_data
+                    self.trace.gps(self.clock.monotonic_ns(), d['lat'], d['lon'], d['alt'], d['fixed'])
+                self.clock.sleep(0.1) 
             except:
-                time.sleep(1)
+                self.clock.sleep(1)
 
     def get_location(self):
         return self.latest_data
@@ -0,0 +1,166 @@
+"""
+Binary sensor traces: every timestamped sample and event of a drive, on disk.
+
+A trace file is a 24 byte header followed by append-only chunks. Each chunk
+holds records of one kind, at a fixed size per kind, after a 32 byte chunk
+header with the kind, record size, count, CRC-32 of the records and the first
+and last timestamp:
+
+    file   "PTRC" u16 version, u16 reserved, f64 start epoch, i64 start monotonic ns
+    chunk  "PTCK" u8 kind, u8 reserved, u16 record size, u32 count, u32 crc, i64 t_first, i64 t_last
+
+Timestamps are monotonic nanoseconds on the recording clock; start epoch maps
+them to wall time. Records of a kind are in time order, different kinds
+interleave by chunk. TraceReader maps the file and unpacks whole chunks at a
+time straight from the map (struct.iter_unpack), skipping chunks of kinds
+nobody asked for. The writer closes a chunk every CHUNK_RECORDS records or
+FLUSH_S seconds, so a crash loses at most the last second; a torn last chunk
+fails its length or CRC check and the reader stops before it.
+"""
+import heapq
+import mmap
+import struct
+import threading
+import zlib
+
+MAGIC = b"PTRC"
+CHUNK_MAGIC = b"PTCK"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHHdq")
+CHUNK_HEADER = struct.Struct("<4sBBHIIqq")
+
+CHUNK_RECORDS = 1024
+FLUSH_S = 1.0
+
+# kind -> record layout; every record starts with its i64 timestamp
+ULTRASONIC, LIDAR, GPS, EVENT, LABEL = 1, 2, 3, 4, 5
+RECORDS = {
+    ULTRASONIC: struct.Struct("<qf"),  # t, distance cm
+    LIDAR: struct.Struct("<qfH"),  # t, distance cm, signal strength
+    GPS: struct.Struct("<qdddB"),  # t, lat, lon, altitude m, has fix
+    EVENT: struct.Struct("<qB3xffQ"),  # t, EVENT_* code, depth cm, length cm, event id
+    LABEL: struct.Struct("<qqf"),  # ground truth pothole: t start, t end, depth cm
+}
+KIND_NAMES = {ULTRASONIC: "ultrasonic", LIDAR: "lidar", GPS: "gps", EVENT: "event", LABEL: "label"}
+
+EVENT_START, EVENT_END = 1, 2
+
+
+class TraceWriter:
+    """
+    Records samples into a new trace file at path. Thread safe: the detection
+    loop and the GPS thread write to the same trace.
+    """
+
+    def __init__(self, path, clock, chunk_records=CHUNK_RECORDS, flush_s=FLUSH_S):
+        self.path = path
+        self.clock = clock
+        self.chunk_records = chunk_records
+        self.flush_ns = int(flush_s * 1e9)
+        self.records = 0
+        self._lock = threading.Lock()
+        self._buffers = {kind: [] for kind in RECORDS}
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, clock.time(), clock.monotonic_ns()))
+        self._file.flush()
+        self._flushed = clock.monotonic_ns()
+
+    def _chunk(self, kind):
+        rows = self._buffers[kind]
+        if not rows:
+            return
+        layout = RECORDS[kind]
+        payload = b"".join(layout.pack(*row) for row in rows)
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, kind, 0, layout.size, len(rows), zlib.crc32(payload),
+                                           rows[0][0], rows[-1][0]))
+        self._file.write(payload)
+        rows.clear()
+
+    def _flush(self):
+        for kind in RECORDS:
+            self._chunk(kind)
+        self._file.flush()
+        self._flushed = self.clock.monotonic_ns()
+
+    def write(self, kind, *fields):
+        """Append one record; fields are the layout of RECORDS[kind], timestamp first."""
+        with self._lock:
+            rows = self._buffers[kind]
+            rows.append(fields)
+            self.records += 1
+            if len(rows) >= self.chunk_records:
+                self._chunk(kind)
+                self._file.flush()
+            if fields[0] - self._flushed >= self.flush_ns:
+                self._flush()
+
+    def ultrasonic(self, t_ns, cm):
+        self.write(ULTRASONIC, t_ns, cm)
+
+    def lidar(self, t_ns, cm, strength=0):
+        self.write(LIDAR, t_ns, cm, strength)
+
+    def gps(self, t_ns, lat, lon, alt, fixed):
+        self.write(GPS, t_ns, lat or 0.0, lon or 0.0, alt or 0.0, int(bool(fixed)))
+
+    def event(self, t_ns, code, depth=0.0, length=0.0, event_id=None):
+        self.write(EVENT, t_ns, code, depth, length, int(event_id, 16) if event_id else 0)
+
+    def label(self, start_ns, end_ns, depth):
+        self.write(LABEL, start_ns, end_ns, depth)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+
+class TraceReader:
+    """Read-only view of a trace file; chunks are indexed on open."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.start_epoch, self.start_ns = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} pothole trace")
+        self.chunks = []  # (kind, offset of records, count, record size, t_first, t_last)
+        self.truncated = False
+        offset = FILE_HEADER.size
+        while offset + CHUNK_HEADER.size <= len(self._map):
+            magic, kind, _, size, count, crc, t_first, t_last = CHUNK_HEADER.unpack_from(self._map, offset)
+            start = offset + CHUNK_HEADER.size
+            end = start + size * count
+            if magic != CHUNK_MAGIC or kind not in RECORDS or size != RECORDS[kind].size \
+                    or end > len(self._map) or zlib.crc32(self._map[start:end]) != crc:
+                break
+            self.chunks.append((kind, start, count, size, t_first, t_last))
+            offset = end
+        self.truncated = offset != len(self._map)
+
+    def count(self, kind):
+        return sum(chunk[2] for chunk in self.chunks if chunk[0] == kind)
+
+    def records(self, kind):
+        """Records of one kind as tuples (timestamp first), in time order."""
+        layout = RECORDS[kind]
+        for chunk_kind, start, count, size, _, _ in self.chunks:
+            if chunk_kind == kind:
+                with memoryview(self._map)[start:start + count * size] as records:
+                    yield from layout.iter_unpack(records)
+
+    def merged(self, kinds):
+        """(kind, record) of several kinds, merged into one time ordered stream."""
+        streams = [((kind, record) for record in self.records(kind)) for kind in kinds]
+        return heapq.merge(*streams, key=lambda item: item[1][0])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,7 +2,13 @@
 
 # Update and install dependencies
 sudo apt-get update
-sudo apt-get install -y python3-pip python3-serial python3-rpi.gpio
+sudo apt-get install -y python3-pip python3-serial python3-rpi.gpio pigpio python3-pigpio
+
+# pigpiod timestamps the Software Serial RX edges; 1 us sampling is needed for
+# the 115200 baud LiDAR (the default 5 us is too coarse)
+sudo sed -i 's|^ExecStart=/usr/bin/pigpiod -l$|ExecStart=/usr/bin/pigpiod -l -s 1|' /lib/systemd/system/pigpiod.service
+sudo systemctl daemon-reload
+sudo systemctl enable --now pigpiod
 
 # Install python libraries
 pip3 install -r requirements.txt --break-system-packages
@@ -0,0 +1,88 @@
+"""
+Run PotholeSystem on the simulated backend: a scripted drive over potholes,
+as fast as the CPU allows, then compare what the car reported with the road.
+
+    python simulate.py [--potholes N] [--seed N] [--duration S] [--quiet] [--trace PATH]
+
+With --trace the drive is recorded (see sensortrace.py), together with the
+scripted potholes as ground truth labels, for replay.py.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import hal
+from sensortrace import TraceWriter
+from simulation import Scenario, SimBackend
+
+# A report counts as a pothole if it was sent while the car was over it or
+# within this long after (the detection ends on the first shallow sample)
+MATCH_SLACK_S = 0.5
+
+
+def run(scenario, duration=None, quiet=False, trace_path=None):
+    """Drive the scenario for duration seconds (default: past the last pothole)."""
+    import main  # after the backend is installed, like on the car
+
+    backend = hal.use(SimBackend(scenario))
+    duration = scenario.length_s if duration is None else duration
+    log = io.StringIO()
+    started = time.perf_counter()
+    trace = None
+    if trace_path:
+        trace = TraceWriter(trace_path, backend.clock)
+        for start, end, depth in scenario.intervals():
+            trace.label(int(start * 1e9), int(end * 1e9), depth)
+    with contextlib.redirect_stdout(log) if quiet else contextlib.nullcontext():
+        system = main.PotholeSystem(trace=trace)
+
+        def stop():
+            backend.clock.sleep(duration)
+            system.running = False
+
+        backend.clock.spawn(stop, name="stop")
+        system.run()
+    elapsed = time.perf_counter() - started
+
+    reports = [post["body"] for post in backend.modem.posts]
+    found = set()
+    for report in reports:
+        t = report["timestamp"] - backend.clock.epoch
+        for i, (start, end, _) in enumerate(scenario.intervals()):
+            if start <= t <= end + MATCH_SLACK_S:
+                found.add(i)
+    return {
+        "simulated_s": backend.clock.monotonic(),
+        "wall_s": elapsed,
+        "potholes": len(scenario.potholes),
+        "reports": reports,
+        "detected": len(found),
+        "missed": [p for i, p in enumerate(scenario.potholes) if i not in found],
+        "captures": backend.camera.captures,
+        "timing": system.timing(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--potholes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=None, help="simulated seconds (default: whole drive)")
+    parser.add_argument("--quiet", action="store_true", help="hide PotholeSystem's own log")
+    parser.add_argument("--trace", help="record the drive to this trace file")
+    args = parser.parse_args()
+
+    result = run(Scenario.random(args.potholes, seed=args.seed), args.duration, args.quiet, args.trace)
+    for report in result["reports"]:
+        print(f"report: depth {report['depth']} cm, length {report['length']} cm, {report['severity']}, "
+              f"at {report['latitude']:.6f},{report['longitude']:.6f}")
+    for start, length, depth in result["missed"]:
+        print(f"missed: pothole at {start / 100:.1f} m, {length:.0f} cm long, {depth} cm deep")
+    print(f"{result['detected']}/{result['potholes']} potholes reported ({len(result['reports'])} reports, "
+          f"{len(result['captures'])} camera triggers)")
+    ultrasonic = result["timing"]["ultrasonic"]
+    print(f"ultrasonic: {ultrasonic['achieved_hz']:.2f} Hz, {ultrasonic['overruns']} overruns, "
+          f"max jitter {ultrasonic['max_jitter_us'] / 1000:.2f} ms")
+    print(f"simulated {result['simulated_s']:.1f} s in {result['wall_s']:.2f} s "
+          f"({result['simulated_s'] / result['wall_s']:.0f}x real time)")
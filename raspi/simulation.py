@@ -0,0 +1,621 @@
+"""
+Simulated hardware backend: the raspi stack on a virtual clock.
+
+SimBackend implements the hal interface with models of the parts on the car,
+driven by a Scenario (a scripted drive over a road with potholes):
+
+    HC-SR04 ultrasonic   trig 17 / echo 18, echo width from the road profile
+    TF02-Pro LiDAR       soft serial 6/12, 9 byte frames at 100 Hz
+    NEO-6M GPS           /dev/ttyS0, position along the scripted route
+    SIM800L modem        soft serial 16/20, AT command set, records HTTP POSTs
+    ESP32-CAM            soft serial 23/24, records capture commands
+
+Time is virtual. Threads started with clock.spawn() take turns, only one runs
+at a time, and sleep() hands over to the thread that is due next and jumps the
+clock to its wake-up time instead of waiting. A run is therefore deterministic
+for a given scenario seed and takes as long as the Python code needs, not as
+long as the drive. Busy waits are costed too: every GPIO.input() advances the
+clock by GPIO_INPUT_COST_S, which is about what RPi.GPIO takes on a Pi 4.
+"""
+import functools
+import heapq
+import itertools
+import json
+import math
+import random
+import threading
+from collections import deque
+
+import hal
+
+GPIO_INPUT_COST_S = 2e-6
+SPEED_OF_SOUND_CM_S = 34300
+EARTH_RADIUS_CM = 6_371_000 * 100
+SERIAL_BUFFER = 4096  # bytes a port holds before dropping input, like the tty layer
+
+
+class VirtualClock:
+    """hal clock on simulated time, scheduling the threads it spawns in turn."""
+
+    def __init__(self, epoch=1_700_000_000.0):
+        self.epoch = epoch
+        self._now = 0  # ns
+        self._cond = threading.Condition()
+        self._due = []  # (wake ns, seq, turn key)
+        self._seq = itertools.count()
+        self._turn = None  # key of the thread allowed to run; None: whoever calls first
+        self._local = threading.local()
+
+    def time(self):
+        return self.epoch + self._now / 1e9
+
+    def monotonic(self):
+        return self._now / 1e9
+
+    def monotonic_ns(self):
+        return self._now
+
+    def advance(self, seconds):
+        """The running thread spent seconds of (simulated) CPU time."""
+        self._now += int(seconds * 1e9)
+
+    def _key(self):
+        key = getattr(self._local, "key", None)
+        if key is None:
+            key = self._local.key = object()
+        return key
+
+    def _wait_turn(self, key):
+        while self._turn is not key:
+            self._cond.wait()
+
+    def _next(self):
+        while self._due:
+            wake, _, key = heapq.heappop(self._due)
+            self._now = max(self._now, wake)
+            if callable(key):
+                key()  # call_at() timer: runs on the thread handing over, like an interrupt
+                continue
+            self._turn = key
+            break
+        else:
+            self._turn = None
+        self._cond.notify_all()
+
+    def sleep(self, seconds):
+        key = self._key()
+        with self._cond:
+            heapq.heappush(self._due, (self._now + max(0, int(seconds * 1e9)), next(self._seq), key))
+            self._next()
+            self._wait_turn(key)
+
+    def call_at(self, t_ns, callback):
+        """Run callback() when the clock reaches t_ns (it must not sleep)."""
+        with self._cond:
+            heapq.heappush(self._due, (t_ns, next(self._seq), callback))
+
+    def spawn(self, target, name=None):
+        key = object()
+        with self._cond:
+            heapq.heappush(self._due, (self._now, next(self._seq), key))
+
+        def run():
+            self._local.key = key
+            with self._cond:
+                self._wait_turn(key)
+            try:
+                target()
+            finally:
+                with self._cond:
+                    self._next()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def event(self):
+        return SimEvent(self)
+
+
+class SimEvent:
+    """threading.Event on a VirtualClock: wait() gives the turn away until set() or the timeout."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._flag = False
+        self._waiters = []  # turn keys
+
+    def is_set(self):
+        return self._flag
+
+    def _wake(self, key):
+        self._waiters.remove(key)
+        heapq.heappush(self.clock._due, (self.clock._now, next(self.clock._seq), key))
+
+    def set(self):
+        with self.clock._cond:
+            self._flag = True
+            for key in list(self._waiters):
+                self._wake(key)
+
+    def clear(self):
+        self._flag = False
+
+    def wait(self, timeout=None):
+        clock = self.clock
+        key = clock._key()
+        with clock._cond:
+            if self._flag:
+                return True
+            self._waiters.append(key)
+            if timeout is not None:
+                # Timer rather than a turn of its own, so a set() first leaves nothing behind to run
+                clock.call_at(clock._now + max(0, int(timeout * 1e9)),
+                              lambda: key in self._waiters and self._wake(key))
+            clock._next()
+            clock._wait_turn(key)
+            return self._flag
+
+
+class SimPWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def stop(self):
+        self.duty_cycle = 0
+
+
+class SimGPIO:
+    """RPi.GPIO replacement; pins are plain levels unless a device is attached."""
+    BCM, BOARD = 11, 10
+    IN, OUT = 1, 0
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.mode = None
+        self.levels = {}
+        self.directions = {}
+        self.devices = {}
+        self.pwms = {}
+        self.events = {}  # pin -> (edge, callbacks)
+
+    def attach(self, device, *pins):
+        for pin in pins:
+            self.devices[pin] = device
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.directions[pin] = direction
+        if initial is not None:
+            self.output(pin, initial)
+
+    def output(self, pin, value):
+        level = int(bool(value))
+        self.levels[pin] = level
+        device = self.devices.get(pin)
+        if device is not None:
+            # Devices return the input edges the change causes: (pin, level, ns)
+            for edge_pin, edge_level, t in device.pin_output(pin, level, self.clock.monotonic_ns()) or ():
+                if edge_pin in self.events:
+                    self.clock.call_at(t, functools.partial(self._edge, edge_pin, edge_level))
+
+    def input(self, pin):
+        self.clock.advance(GPIO_INPUT_COST_S)
+        device = self.devices.get(pin)
+        if device is not None:
+            return device.pin_input(pin, self.clock.monotonic_ns())
+        return self.levels.get(pin, 0)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.events[pin] = (edge, [callback] if callback else [])
+
+    def add_event_callback(self, pin, callback):
+        self.events[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.events.pop(pin, None)
+
+    def _edge(self, pin, level):
+        edge, callbacks = self.events.get(pin, (None, ()))
+        if edge in (self.BOTH, self.RISING if level else self.FALLING):
+            for callback in callbacks:
+                callback(pin)
+
+    def PWM(self, pin, frequency):
+        pwm = self.pwms[pin] = SimPWM(pin, frequency)
+        return pwm
+
+    def cleanup(self, *pins):
+        for pin in pins or list(self.directions):
+            self.directions.pop(pin, None)
+            self.events.pop(pin, None)
+
+
+class SimSerial:
+    """
+    pyserial compatible port connected to a device model. Bytes the device sends
+    become readable one character time (10 bits) apart; read() waits on the
+    virtual clock. A soft serial port blocks the writer for the bit-banging time.
+    """
+
+    def __init__(self, clock, device=None, baud=9600, timeout=1.0, blocking_write=False, name=None):
+        self.clock = clock
+        self.device = device
+        self.baud = baud
+        self.timeout = timeout
+        self.blocking_write = blocking_write
+        self.name = name
+        self.is_open = True
+        self.overruns = 0
+        self._char_ns = int(10e9 / baud)
+        self._pending = deque()  # (ns the byte is complete, byte)
+        self._line_free = 0  # when the device side of the line is free again
+
+    def _pull(self):
+        if self.device is None:
+            return
+        for t, data in self.device.output_until(self.clock.monotonic_ns()):
+            t = max(t, self._line_free)
+            for byte in data:
+                t += self._char_ns
+                if len(self._pending) < SERIAL_BUFFER:
+                    self._pending.append((t, byte))
+                else:
+                    self.overruns += 1
+            self._line_free = t
+
+    def _available(self):
+        # Only the bytes of a message still on the wire lie in the future: count from the back
+        now = self.clock.monotonic_ns()
+        count = len(self._pending)
+        for t, _ in reversed(self._pending):
+            if t <= now:
+                break
+            count -= 1
+        return count
+
+    @property
+    def in_waiting(self):
+        self._pull()
+        return self._available()
+
+    def read(self, count=1):
+        deadline = self.clock.monotonic() + (self.timeout or 0)
+        while True:
+            self._pull()
+            available = self._available()
+            if available >= count or self.clock.monotonic() >= deadline:
+                break
+            self.clock.sleep(min(self._char_ns / 1e9, deadline - self.clock.monotonic()))
+        return bytes(self._pending.popleft()[1] for _ in range(min(count, available)))
+
+    def readline(self):
+        line = b""
+        while not line.endswith(b"\n"):
+            byte = self.read(1)
+            if not byte:
+                break
+            line += byte
+        return line
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self.blocking_write:
+            # SoftwareSerial sleeps through every bit, so the writer waits but other threads run
+            self.clock.sleep(len(data) * self._char_ns / 1e9)
+        if self.device is not None:
+            self.device.receive(bytes(data), self.clock.monotonic_ns())
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._pull()
+        self._pending.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+class Scenario:
+    """
+    A scripted drive: constant speed along a straight road from origin on
+    heading_deg, over potholes given as (start_cm, length_cm, depth_cm) from the
+    start of the drive. Sensor noise is seeded, so runs repeat exactly;
+    spike_rate is the share of ultrasonic pings answered by a stray echo.
+    """
+
+    def __init__(self, potholes=(), speed_cm_s=30.0, ground_cm=3.0, noise_cm=0.2, lidar_mount_cm=30.0,
+                 origin=(19.0760, 72.8777), heading_deg=45.0, gps_fix_s=3.0, spike_rate=0.0, seed=0):
+        self.potholes = sorted(potholes)
+        self.speed_cm_s = speed_cm_s
+        self.ground_cm = ground_cm
+        self.noise_cm = noise_cm
+        self.lidar_mount_cm = lidar_mount_cm
+        self.origin = origin
+        self.heading = math.radians(heading_deg)
+        self.gps_fix_s = gps_fix_s
+        self.spike_rate = spike_rate
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def random(cls, count, seed=0, spacing_cm=(300.0, 900.0), length_cm=(20.0, 80.0), depth_cm=(4.0, 15.0), **kwargs):
+        rng = random.Random(seed)
+        potholes, at = [], 200.0
+        for _ in range(count):
+            length = rng.uniform(*length_cm)
+            potholes.append((round(at, 1), round(length, 1), round(rng.uniform(*depth_cm), 1)))
+            at += length + rng.uniform(*spacing_cm)
+        return cls(potholes, seed=seed, **kwargs)
+
+    @property
+    def length_s(self):
+        """Drive time to pass the last pothole with a little road after it."""
+        end = max((start + length for start, length, _ in self.potholes), default=0.0)
+        return (end + 200.0) / self.speed_cm_s
+
+    def intervals(self):
+        """(start s, end s, depth cm) of every pothole along the drive."""
+        return [(start / self.speed_cm_s, (start + length) / self.speed_cm_s, depth)
+                for start, length, depth in self.potholes]
+
+    def depth_at(self, t):
+        x = t * self.speed_cm_s
+        for start, length, depth in self.potholes:
+            if start <= x < start + length:
+                return depth
+            if start > x:
+                break
+        return 0.0
+
+    def ultrasonic_cm(self, t):
+        if self.spike_rate and self.rng.random() < self.spike_rate:
+            return self.rng.uniform(20.0, 300.0)  # multipath or another car's ping
+        return max(0.0, self.ground_cm + self.depth_at(t) + self.rng.gauss(0, self.noise_cm))
+
+    def lidar_cm(self, t):
+        return max(0.0, self.lidar_mount_cm + self.depth_at(t) + self.rng.gauss(0, self.noise_cm))
+
+    def location(self, t):
+        """(lat, lon, altitude m), or None before the receiver has a fix."""
+        if t < self.gps_fix_s:
+            return None
+        x = t * self.speed_cm_s
+        lat = self.origin[0] + math.degrees(x * math.cos(self.heading) / EARTH_RADIUS_CM)
+        lon = self.origin[1] + math.degrees(x * math.sin(self.heading) /
+                                            (EARTH_RADIUS_CM * math.cos(math.radians(self.origin[0]))))
+        return lat, lon, 14.0
+
+
+class HCSR04:
+    """Ultrasonic ranger: a trig pulse starts a ping, echo stays high for the round trip."""
+    LATENCY_S = 450e-6  # 8 bursts at 40 kHz plus processing before echo rises
+    NO_ECHO_S = 0.038  # echo width when nothing reflects
+
+    def __init__(self, clock, trig, echo, distance_cm):
+        self.clock = clock
+        self.trig = trig
+        self.echo = echo
+        self.distance_cm = distance_cm
+        self._trig_high = None
+        self._rise = self._fall = -1
+
+    def pin_output(self, pin, level, t):
+        if pin != self.trig:
+            return
+        if level:
+            self._trig_high = t
+        elif self._trig_high is not None and t >= self._rise and t >= self._fall:
+            distance = self.distance_cm(t / 1e9)
+            width = 2 * distance / SPEED_OF_SOUND_CM_S if 2 <= distance <= 400 else self.NO_ECHO_S
+            self._rise = t + int(self.LATENCY_S * 1e9)
+            self._fall = self._rise + int(width * 1e9)
+            self._trig_high = None
+            return [(self.echo, 1, self._rise), (self.echo, 0, self._fall)]
+
+    def pin_input(self, pin, t):
+        return int(pin == self.echo and self._rise <= t < self._fall)
+
+
+class TF02Lidar:
+    """TF02-Pro in its default mode: 59 59 DistL DistH StrL StrH TempL TempH Sum, at rate Hz."""
+
+    def __init__(self, distance_cm, rate=100):
+        self.distance_cm = distance_cm
+        self.period_ns = int(1e9 / rate)
+        self._next = 0
+
+    def output_until(self, t):
+        frames = []
+        while self._next <= t:
+            distance = int(round(self.distance_cm(self._next / 1e9)))
+            frame = bytes([0x59, 0x59, distance & 0xFF, distance >> 8, 0xE8, 0x03, 0x20, 0x0A])
+            frames.append((self._next, frame + bytes([sum(frame) & 0xFF])))
+            self._next += self.period_ns
+        return frames
+
+    def receive(self, data, t):
+        pass  # configuration commands are accepted and ignored
+
+
+class NeoGPS:
+    """
+    GPS receiver on the scripted route. Stands in for adafruit_gps.GPS as well
+    (SimBackend.gps returns it), so no NMEA is generated or parsed.
+    """
+
+    def __init__(self, clock, location):
+        self.clock = clock
+        self.location = location
+        self.commands = []
+        self.has_fix = False
+        self.latitude = self.longitude = self.altitude_m = None
+
+    def output_until(self, t):
+        return []
+
+    def receive(self, data, t):
+        pass
+
+    def send_command(self, command):
+        self.commands.append(bytes(command))
+
+    def update(self):
+        fix = self.location(self.clock.monotonic())
+        self.has_fix = fix is not None
+        if fix:
+            self.latitude, self.longitude, self.altitude_m = fix
+        return True
+
+
+class SIM800:
+    """
+    SIM800L modem: the AT commands GSM uses, with echo off. HTTP POSTs made
+    through AT+HTTPACTION=1 are recorded in posts as
+    {"t", "url", "content_type", "body"} (body parsed as JSON when it is).
+    """
+    REPLY_S = 0.02
+    HTTP_S = 1.5  # GPRS round trip before +HTTPACTION is reported
+
+    def __init__(self, status=200):
+        self.status = status
+        self.posts = []
+        self.bearer = False
+        self.params = {}
+        self._line = b""
+        self._download = None  # bytes still expected after AT+HTTPDATA
+        self._data = b""
+        self._out = []
+
+    def _reply(self, t, text, delay=REPLY_S):
+        self._out.append((t + int(delay * 1e9), f"\r\n{text}\r\n".encode()))
+
+    def output_until(self, t):
+        due = [item for item in self._out if item[0] <= t]
+        self._out = [item for item in self._out if item[0] > t]
+        return sorted(due)
+
+    def receive(self, data, t):
+        for byte in data:
+            if self._download is not None:
+                if not self._data and byte == ord("\n"):
+                    continue  # rest of the AT+HTTPDATA line terminator
+                self._data += bytes([byte])
+                self._download -= 1
+                if self._download == 0:
+                    self._download = None
+                    self._reply(t, "OK")
+            elif byte in b"\r\n":
+                if self._line:
+                    self._command(self._line.decode(errors="replace").strip(), t)
+                self._line = b""
+            else:
+                self._line += bytes([byte])
+
+    def _command(self, command, t):
+        upper = command.upper()
+        if upper.startswith("AT+SAPBR=1,1"):
+            self.bearer = True
+        elif upper.startswith("AT+SAPBR=0,1"):
+            self.bearer = False
+        elif upper.startswith("AT+HTTPPARA="):
+            key, _, value = command[len("AT+HTTPPARA="):].partition(",")
+            self.params[key.strip('"').upper()] = value.strip('"')
+        elif upper.startswith("AT+HTTPDATA="):
+            self._download = int(command.split("=", 1)[1].split(",")[0])
+            self._data = b""
+            self._reply(t, "DOWNLOAD")
+            return
+        elif upper.startswith("AT+HTTPACTION=1"):
+            self._reply(t, "OK")
+            status = self.status if self.bearer else 601
+            if status == self.status:
+                try:
+                    body = json.loads(self._data)
+                except ValueError:
+                    body = self._data
+                self.posts.append({"t": t / 1e9, "url": self.params.get("URL"),
+                                   "content_type": self.params.get("CONTENT"), "body": body})
+            self._reply(t, f"+HTTPACTION: 1,{status},0", self.HTTP_S)
+            return
+        elif not upper.startswith("AT"):
+            self._reply(t, "ERROR")
+            return
+        self._reply(t, "OK")
+
+
+class ESP32Cam:
+    """ESP32-CAM trigger link: records each 'c<event_id>\\n' capture command as (t, event_id)."""
+
+    def __init__(self):
+        self.captures = []
+        self._pending = None
+
+    def output_until(self, t):
+        return []
+
+    def receive(self, data, t):
+        for byte in data:
+            if self._pending is None:
+                if byte == ord("c"):
+                    self._pending = (t, b"")
+            elif byte == ord("\n"):
+                self.captures.append((self._pending[0] / 1e9, self._pending[1].decode(errors="replace") or None))
+                self._pending = None
+            else:
+                self._pending = (self._pending[0], self._pending[1] + bytes([byte]))
+
+
+class SimBackend:
+    """hal backend wiring the device models to the pins and ports PotholeSystem uses."""
+    name = "sim"
+
+    def __init__(self, scenario=None, clock=None):
+        self.scenario = scenario or Scenario()
+        self.clock = clock or VirtualClock()
+        self.gpio = SimGPIO(self.clock)
+        self.ultrasonic = HCSR04(self.clock, 17, 18, self.scenario.ultrasonic_cm)
+        self.gpio.attach(self.ultrasonic, 17, 18)
+        self.lidar = TF02Lidar(self.scenario.lidar_cm)
+        self.gps_receiver = NeoGPS(self.clock, self.scenario.location)
+        self.modem = SIM800()
+        self.camera = ESP32Cam()
+        self.ports = {"/dev/ttyS0": self.gps_receiver}
+        # (tx, rx) from the Pi's point of view
+        self.soft_ports = {(6, 12): self.lidar, (16, 20): self.modem, (23, 24): self.camera}
+
+    def serial(self, port, baud, timeout=1.0):
+        if port not in self.ports:
+            raise OSError(f"could not open port {port}: No such file or directory")
+        return SimSerial(self.clock, self.ports[port], baud, timeout, name=port)
+
+    def soft_serial(self, tx, rx, baud=9600, timeout=1.0):
+        # Nothing attached (e.g. no Bluetooth module) reads as a silent line
+        return SimSerial(self.clock, self.soft_ports.get((tx, rx)), baud, timeout, blocking_write=True,
+                         name=f"soft:{tx}/{rx}")
+
+    def edge_callback(self, pin, callback):
+        return hal.GPIOEdges(self.gpio, self.clock, pin, callback)
+
+    def pulse(self, pin, us, level=1):
+        hal.gpio_pulse(self.gpio, self.clock, pin, us, level)
+
+    def gps(self, uart):
+        if not isinstance(uart.device, NeoGPS):
+            raise OSError(f"no GPS on {uart.name}")
+        return uart.device
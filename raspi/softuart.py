@@ -0,0 +1,241 @@
+"""
+Software UART receiver decoded from edge timestamps.
+
+Polling a pin from Python cannot keep up with a serial line: a bit lasts 104 us
+at 9600 baud and 8.7 us at 115200. Instead every level change of the RX pin is
+reported as (level, timestamp) by an edge callback, and a background thread
+rebuilds the frames from the timestamps alone, sampling each bit at its centre
+the way a hardware UART does. Decoded bytes go into a bounded ring buffer that
+read() and in_waiting work on, so callers get pyserial-like behaviour.
+
+The last byte of a burst ends on a high stop bit with no edge after it, so the
+edge source also reports idle(t), "no edge until t", on the same time base as
+the edges; pigpio's watchdog does exactly that. Sources without one pass their
+clock and the receiver thread stamps the idle marks itself.
+
+Nothing here touches the hardware: communication.SoftwareSerial wires the
+receiver to pigpio (edge ticks taken by the pigpiod DMA sampler, good for
+115200 baud when pigpiod runs with -s 1) or to RPi.GPIO interrupts (timestamps
+taken in the callback, 9600 baud at best). frame_edges() produces the edges of
+a serial transmission, to drive the receiver from a simulated line.
+"""
+import threading
+import time
+from collections import deque
+
+# A frame is 1 start bit, 8 data bits (LSB first) and 1 stop bit
+FRAME_BITS = 10
+STOP_BIT = FRAME_BITS - 1
+
+# Quiet period after which a receiver with a clock stamps an idle mark, and how
+# far behind its clock the mark is put (edges may be stamped but not queued yet)
+IDLE_FLUSH_S = 0.002
+IDLE_MARGIN_NS = 1_000_000
+
+
+class RingBuffer:
+    """Fixed size byte FIFO. put() refuses bytes when full; not thread safe."""
+
+    def __init__(self, capacity):
+        self._buf = bytearray(capacity)
+        self._head = 0  # next byte to read
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def put(self, byte):
+        if self._size == len(self._buf):
+            return False
+        self._buf[(self._head + self._size) % len(self._buf)] = byte
+        self._size += 1
+        return True
+
+    def get(self, count):
+        count = min(count, self._size)
+        end = self._head + count
+        if end <= len(self._buf):
+            data = bytes(self._buf[self._head:end])
+        else:
+            data = bytes(self._buf[self._head:]) + bytes(self._buf[:end - len(self._buf)])
+        self._head = end % len(self._buf)
+        self._size -= count
+        return data
+
+    def clear(self):
+        self._head = self._size = 0
+
+
+class EdgeDecoder:
+    """
+    8N1 frame decoder fed with line transitions. edge() returns the byte a
+    transition completes, if any; framing errors and glitches are counted and
+    dropped. Timestamps are integer nanoseconds from any monotonic clock.
+    """
+
+    def __init__(self, baud):
+        self.bit_ns = 1_000_000_000 / baud
+        self.level = 1  # UART lines idle high
+        self.framing_errors = 0
+        self.glitches = 0
+        self._start = None  # time of the start bit's falling edge, None when idle
+        self._bits = [0] * FRAME_BITS
+        self._next = 0  # next bit to sample
+
+    @property
+    def in_frame(self):
+        return self._start is not None
+
+    def _sample_until(self, t):
+        # The line held self.level until t: sample every bit centre before it
+        while self._next < FRAME_BITS and self._start + (self._next + 0.5) * self.bit_ns <= t:
+            self._bits[self._next] = self.level
+            self._next += 1
+
+    def _finish(self):
+        self._start = None
+        if not self._bits[STOP_BIT]:
+            self.framing_errors += 1
+            return None
+        value = 0
+        for i in range(8):
+            value |= self._bits[1 + i] << i
+        return value
+
+    def edge(self, level, t):
+        byte = None
+        if level == self.level:
+            return None  # repeated report of the same level
+        if self._start is not None:
+            self._sample_until(t)
+            if self._next == 0:
+                # Back high before the middle of the start bit: noise, not a frame
+                self._start = None
+                self.glitches += 1
+            elif self._next == FRAME_BITS:
+                byte = self._finish()
+        self.level = level
+        if self._start is None and level == 0:
+            self._start = t
+            self._next = 0
+        return byte
+
+    def idle(self, t):
+        """The line has not moved until t: complete an open frame that ended by then."""
+        if self._start is None:
+            return None
+        self._sample_until(t)
+        return self._finish() if self._next == FRAME_BITS else None
+
+
+class SoftUartReceiver:
+    """
+    Decodes edges reported by edge(level, t_ns) and idle(t_ns) in a background
+    thread into a ring buffer of capacity bytes. Both only append to a queue, so
+    they are safe to call from an interrupt or pigpio callback thread. With
+    clock (a function returning the edge time base in ns) the receiver stamps
+    idle marks itself when the line has been quiet for IDLE_FLUSH_S.
+    """
+
+    def __init__(self, baud, capacity=4096, timeout=1.0, clock=None):
+        self.baud = baud
+        self.timeout = timeout
+        self.clock = clock
+        self.overruns = 0
+        self._decoder = EdgeDecoder(baud)
+        self._edges = deque()
+        self._wake = threading.Event()
+        self._buffer = RingBuffer(capacity)
+        self._ready = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"softuart-{baud}", daemon=True)
+        self._thread.start()
+
+    def edge(self, level, t_ns):
+        wake = not self._edges
+        self._edges.append((level, t_ns))
+        if wake:
+            self._wake.set()
+
+    def idle(self, t_ns):
+        self.edge(None, t_ns)
+
+    def _run(self):
+        idle_s = IDLE_FLUSH_S + FRAME_BITS / self.baud
+        while self._running:
+            woke = self._wake.wait(idle_s)
+            self._wake.clear()
+            if not woke and self.clock is not None and self._decoder.in_frame and not self._edges:
+                self._edges.append((None, self.clock() - IDLE_MARGIN_NS))
+            decoded = []
+            while self._edges:
+                level, t = self._edges.popleft()
+                if level is None:
+                    byte = self._decoder.idle(t)
+                else:
+                    byte = self._decoder.edge(level, t)
+                if byte is not None:
+                    decoded.append(byte)
+            if decoded:
+                with self._ready:
+                    for byte in decoded:
+                        if not self._buffer.put(byte):
+                            self.overruns += 1
+                    self._ready.notify_all()
+
+    def read(self, count=1, timeout=None):
+        """Up to count bytes, waiting at most timeout (default self.timeout) for all of them."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._ready:
+            while len(self._buffer) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._ready.wait(remaining)
+            return self._buffer.get(count)
+
+    @property
+    def in_waiting(self):
+        with self._ready:
+            return len(self._buffer)
+
+    def reset_input_buffer(self):
+        with self._ready:
+            self._buffer.clear()
+
+    @property
+    def stats(self):
+        return {
+            "framing_errors": self._decoder.framing_errors,
+            "glitches": self._decoder.glitches,
+            "overruns": self.overruns,
+            "buffered": self.in_waiting,
+        }
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout=1.0)
+        with self._ready:
+            self._ready.notify_all()
+
+
+def frame_edges(data, baud, t0_ns=0, gap_bits=0.0):
+    """
+    (level, t_ns) transitions of data sent 8N1 from t0_ns, with gap_bits of
+    idle line between bytes. Returns (edges, time the last stop bit ends).
+    """
+    bit_ns = 1_000_000_000 / baud
+    edges, level, t = [], 1, t0_ns
+    for byte in data:
+        bits = [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+        for i, bit in enumerate(bits):
+            if bit != level:
+                edges.append((bit, int(round(t + i * bit_ns))))
+                level = bit
+        t += (FRAME_BITS + gap_bits) * bit_ns
+    return edges, int(round(t))